@@ -1,27 +1,60 @@
 '''
 This is the script to translate text data into embedding models and should only be used once 
+
+Chunks are embedded in token-budgeted batches with bounded concurrency and
+backoff on rate limits. Rows are appended to the output file as batches
+finish, so an interrupted run picks up where it stopped.
 '''
 
 
-from langchain_openai import OpenAIEmbeddings
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+import openai
 import tiktoken
-import pandas as pd
 from dotenv import load_dotenv
 
+load_dotenv() 
 
-from dotenv import load_dotenv
+from embeddings import EMBEDDING_PROVIDER, create_embedding_provider
 
-load_dotenv() 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init-db'))
+
+from load_data import read_services_csv, record_text
+
+# Paths default to this directory, so the script can be run from anywhere
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUT_FILE = os.path.join(BASE_DIR, 'mental_health_services_nwmphn_dataset.csv')
+OUTPUT_FILE = os.path.join(BASE_DIR, 'mental_health_embedding.csv')
+# The embeddings endpoint accepts up to 2048 inputs and 300k tokens per request
+EMBED_BATCH_MAX_TOKENS = int(os.getenv('EMBED_BATCH_MAX_TOKENS', '100000'))
+EMBED_BATCH_MAX_INPUTS = int(os.getenv('EMBED_BATCH_MAX_INPUTS', '512'))
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
+EMBED_MAX_RETRIES = int(os.getenv('EMBED_MAX_RETRIES', '6'))
 
-df = pd.read_csv('mental_health_services_nwmphn_dataset.csv')
-df["index"] = range(1, len(df) + 1)
+def load_records(csv_path = INPUT_FILE): 
+  """
+  (index, text) per service record. index is the record's 1-based position
+  in the CSV, which is the id load_data.py gives it in MentalHealthRawData.
+  """
+  return [(index, record_text(row)) for index, row in enumerate(read_services_csv(csv_path), start = 1)]
 
 #Calculate the cost for the embedding for the entire content 
 
+_encodings = {}
+
 def num_token_from_string(string : str, encoding_name = "cl100k_base") -> int: 
  if not string : 
     return 0
- encoding_model = tiktoken.get_encoding(encoding_name) 
+ encoding_model = _encodings.get(encoding_name)
+ if encoding_model is None:
+    encoding_model = _encodings[encoding_name] = tiktoken.get_encoding(encoding_name)
  num_tokens = len(encoding_model.encode(string)) 
  return num_tokens 
 
@@ -33,69 +66,204 @@ def get_essay_length(essay):
 def get_embedding_cost(num_tokens): 
    return num_tokens / 1000 * 0.0002
 
-def get_total_embeddings_cost(): 
+def get_total_embeddings_cost(records): 
    total_tokens = 0
-   for i in range(len(df.index)): 
-       text = df.iloc[i].to_json() 
+   for _, text in records: 
        token_len = num_token_from_string(text) 
        total_tokens += token_len
    total_cost = get_embedding_cost(total_tokens) 
    return total_cost
 
+# Split one record's text into chunks of at most MAX_CHUNK_TOKENS 
+def split_record(index, text, MAX_CHUNK_TOKENS = 512): 
+  token_len = num_token_from_string(text) 
+  if token_len <= MAX_CHUNK_TOKENS : 
+    return [[index, token_len, text]]
+  # 1 token ~ 3 / 4 * (word) 
+  # 512 tokens ~ 512 * 3 / 4 words 
+  new_list = [] 
+  start = 0 
+  ideal_token_size = MAX_CHUNK_TOKENS 
+  ideal_word_size = int(ideal_token_size  // (4 / 3)) 
+  end = ideal_word_size 
+  words = text.split() 
+  words = [x for x in words if x != ' '] 
+  total_words = len(words) 
+  chunks = total_words // ideal_word_size 
+  if total_words % ideal_word_size > 0 : 
+     chunks += 1 
+  new_content = [] 
+  for j in range(chunks): 
+    if end > total_words : 
+      end = total_words 
+    new_content = words[start : end] 
+    new_content_string = ' '.join(new_content)
+    new_content_token_len = num_token_from_string(new_content_string)
+    if new_content_token_len > 0: 
+      new_list.append([index, new_content_token_len, new_content_string])
+    start += ideal_word_size
+    end   += ideal_word_size   
+  return new_list
+
 # Create a smaller chunk of contents 
-def splitting_dataset(MAX_CHUNK_TOKENS = 512): 
+def splitting_dataset(records, MAX_CHUNK_TOKENS = 512): 
   new_list = [] 
-  for i in range(len(df.index)): 
-    text = df.iloc[i].to_json() 
-    token_len = num_token_from_string(text) 
-    if token_len <= MAX_CHUNK_TOKENS : 
-      new_list.append([
-        df['index'][i], 
-        token_len, 
-        text 
-      ]) 
-    else : 
-      # 1 token ~ 3 / 4 * (word) 
-      # 512 tokens ~ 512 * 3 / 4 words 
-      start = 0 
-      ideal_token_size = MAX_CHUNK_TOKENS 
-      ideal_word_size = int(ideal_token_size  // (4 / 3)) 
-      end = ideal_word_size 
-      words = text.split() 
-      words = [x for x in words if x != ' '] 
-      total_words = len(words) 
-      chunks = total_words // ideal_word_size 
-      if total_words % ideal_word_size > 0 : 
-         chunks += 1 
-      new_content = [] 
-      for j in range(chunks): 
-        if end > total_words : 
-          end = total_words 
-        new_content = words[start : end] 
-        new_content_string = ' '.join(new_content)
-        new_content_token_len = num_token_from_string(new_content_string)
-        if new_content_token_len > 0: 
-          new_list.append([df['index'][i], new_content_token_len, new_content_string])
-        start += ideal_word_size
-        end   += ideal_word_size   
-  return new_list    
-
-
-
-def get_embeddings_vector(text): 
-  embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-  response = embedding_model.embed_query(text)
-  return response
-
-index_embedding_pairs = [] 
-new_list = splitting_dataset() 
-for i in range(len(new_list)): 
-  text = new_list[i][2] 
-  embedding = get_embeddings_vector(text)
-  index_embedding_pairs.append([new_list[i][0], new_list[i][1], embedding])
+  for index, text in records: 
+    new_list.extend(split_record(index, text, MAX_CHUNK_TOKENS))
+  return new_list
+
+
+# Batched, resumable ingestion 
+# Output rows are (chunk_id, index, token_len, embeddings). chunk_id is the
+# chunk's position in splitting_dataset(), which lets an interrupted run skip
+# chunks that are already in the output file.
+
+OUTPUT_COLUMNS = ['chunk_id', 'index', 'token_len', 'embeddings']
+
+RETRYABLE_ERRORS = (
+  openai.RateLimitError,
+  openai.APIConnectionError,
+  openai.APITimeoutError,
+  openai.InternalServerError,
+)
+
+def make_batches(chunks, max_tokens = EMBED_BATCH_MAX_TOKENS, max_inputs = EMBED_BATCH_MAX_INPUTS): 
+  """
+  Group (chunk_id, index, token_len, text) tuples into batches that stay
+  under the request's token and input limits
+  """
+  batch, batch_tokens = [], 0
+  for chunk in chunks: 
+    token_len = chunk[2]
+    if batch and (batch_tokens + token_len > max_tokens or len(batch) >= max_inputs): 
+      yield batch
+      batch, batch_tokens = [], 0
+    batch.append(chunk)
+    batch_tokens += token_len
+  if batch: 
+    yield batch
+
+def completed_chunk_ids(output_file): 
+  """
+  Read chunk ids already written by a previous run, dropping a trailing
+  partial line left by a crash
+  """
+  if not os.path.exists(output_file): 
+    return set()
+  with open(output_file, 'rb+') as f: 
+    data = f.read()
+    if data and not data.endswith(b'\n'): 
+      f.truncate(data.rfind(b'\n') + 1)
+  done = set()
+  with open(output_file, newline = '') as f: 
+    reader = csv.DictReader(f)
+    if reader.fieldnames != OUTPUT_COLUMNS: 
+      raise ValueError(f"{output_file} was not written by the batched pipeline; rerun with --restart")
+    for row in reader: 
+      done.add(int(row['chunk_id']))
+  return done
+
+def retry_delay(error, attempt): 
+  # Prefer the server's Retry-After hint on 429s, otherwise exponential backoff with jitter
+  response = getattr(error, 'response', None)
+  retry_after = response.headers.get('retry-after') if response is not None else None
+  if retry_after: 
+    try: 
+      return float(retry_after)
+    except ValueError: 
+      pass
+  return min(60, 2 ** attempt) * (0.5 + random.random() / 2)
+
+async def embed_batch(provider, texts, max_retries = EMBED_MAX_RETRIES): 
+  for attempt in range(max_retries + 1): 
+    try: 
+      return await provider.embed(texts)
+    except RETRYABLE_ERRORS as e: 
+      if attempt == max_retries: 
+        raise
+      delay = retry_delay(e, attempt)
+      print(f"Embedding batch failed ({type(e).__name__}); retrying in {delay:.1f}s")
+      await asyncio.sleep(delay)
+
+def metadata_file(output_file): 
+  return os.path.splitext(output_file)[0] + '.meta.json'
+
+def check_output_metadata(output_file, provider): 
+  """
+  Record which model made the vectors in output_file next to it (load_data.py
+  stores it with the vectors), refusing to resume a file made by another model
+  """
+  path = metadata_file(output_file)
+  if os.path.exists(output_file) and os.path.getsize(output_file) > 0: 
+    if os.path.exists(path): 
+      with open(path) as f: 
+        stored = json.load(f)
+    else: 
+      # Files from before the metadata was written came from the OpenAI API
+      stored = {'provider': 'openai', 'model': provider.model if provider.name == 'openai' else 'unknown'}
+    if stored['model'] != provider.model: 
+      raise ValueError(f"{output_file} was embedded with {stored['provider']}/{stored['model']}, "
+                       f"not {provider.name}/{provider.model}; rerun with --restart")
+  with open(path, 'w') as f: 
+    json.dump(provider.describe(), f)
+
+async def embed_dataset(output_file = OUTPUT_FILE, concurrency = EMBED_CONCURRENCY, restart = False, provider = None, 
+                        csv_path = INPUT_FILE): 
+  """
+  Embed every chunk of the records in csv_path and append rows to output_file
+  as batches finish, resuming from the rows already written unless restart is set
+  """
+  provider = provider or create_embedding_provider(EMBEDDING_PROVIDER)
+  if restart and os.path.exists(output_file): 
+    os.remove(output_file)
+  check_output_metadata(output_file, provider)
+  done = completed_chunk_ids(output_file)
+  chunks = [
+    (chunk_id, int(index), token_len, text)
+    for chunk_id, (index, token_len, text) in enumerate(splitting_dataset(load_records(csv_path)))
+    if chunk_id not in done
+  ]
+  batches = list(make_batches(chunks))
+  print(f"{len(done)} chunks already embedded; {len(chunks)} chunks left in {len(batches)} batches")
+  if not batches: 
+    return
+
+  semaphore = asyncio.Semaphore(concurrency)
+  write_header = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+  started = time.perf_counter()
+  written = 0
+
+  with open(output_file, 'a', newline = '') as f: 
+    writer = csv.writer(f)
+    if write_header: 
+      writer.writerow(OUTPUT_COLUMNS)
+      f.flush()
+
+    async def run_batch(batch): 
+      async with semaphore: 
+        return batch, await embed_batch(provider, [chunk[3] for chunk in batch])
+
+    for finished in asyncio.as_completed([run_batch(batch) for batch in batches]): 
+      batch, embeddings = await finished
+      for (chunk_id, index, token_len, _), embedding in zip(batch, embeddings): 
+        writer.writerow([chunk_id, index, token_len, json.dumps(embedding)])
+      # Flushed rows are the checkpoint: a crashed run resumes after them
+      f.flush()
+      written += len(batch)
+      print(f"Embedded {written}/{len(chunks)} chunks")
+
+  elapsed = time.perf_counter() - started
+  print(f"Embedded {written} chunks in {elapsed:.1f}s ({written / elapsed:.0f} chunks/s)")
+
 
 if __name__ == "__main__" : 
- total_cost = get_total_embeddings_cost() 
+ parser = argparse.ArgumentParser(description = "Embed the mental health services dataset")
+ parser.add_argument('--csv', default = INPUT_FILE)
+ parser.add_argument('--output', default = OUTPUT_FILE)
+ parser.add_argument('--concurrency', type = int, default = EMBED_CONCURRENCY)
+ parser.add_argument('--restart', action = 'store_true', help = "Discard existing output instead of resuming")
+ args = parser.parse_args()
+
+ total_cost = get_total_embeddings_cost(load_records(args.csv)) 
  print("estimated price to embed the content = $" + str(total_cost))
- df_new = pd.DataFrame(index_embedding_pairs, columns = ['index', 'token_len', 'embeddings'])
- df_new.to_csv('mental_health_embedding.csv', index = False)
+ asyncio.run(embed_dataset(args.output, args.concurrency, args.restart, csv_path = args.csv))
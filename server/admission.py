@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upstream OpenAI calls in flight at once, and how many more may queue for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+LLM_MAX_WAITING = int(os.getenv('LLM_MAX_WAITING', '64'))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '32'))
+EMBEDDING_MAX_WAITING = int(os.getenv('EMBEDDING_MAX_WAITING', '128'))
+# Longest a request waits for an upstream slot before it is turned away
+ADMISSION_WAIT_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_WAIT_TIMEOUT_SECONDS', '10'))
+# Turns of one session that may wait behind the turn in progress, and for how long
+SESSION_MAX_QUEUED_TURNS = int(os.getenv('SESSION_MAX_QUEUED_TURNS', '1'))
+SESSION_TURN_WAIT_SECONDS = float(os.getenv('SESSION_TURN_WAIT_SECONDS', '60'))
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of queueing unbounded work; the API turns it into a
+    429 or 503 response with a Retry-After header
+    """
+
+    def __init__(self, message: str, retry_after: int, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders at a time, with a bounded FIFO wait queue.
+
+    A caller that finds the queue full is rejected immediately; a queued
+    caller that has not been admitted within `wait_timeout` seconds is
+    rejected when its deadline passes. Retry-After is estimated from the
+    average hold time and the queue length. Use as `async with limiter.slot():`.
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: int, wait_timeout: float,
+                 overload_status: int = 503):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.overload_status = overload_status
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_seconds = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        # Roughly the time for the current queue to drain through the available slots
+        return max(1, math.ceil(self._hold_seconds * (self.waiting + 1) / max(self.limit, 1)))
+
+    def _overloaded(self, reason: str) -> Overloaded:
+        logger.warning(f"Rejected request: {self.name} {reason} ({self.active} active, {self.waiting} waiting)")
+        return Overloaded(f"{self.name} is overloaded ({reason}); retry later", self.retry_after(),
+                          self.overload_status)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_waiting:
+            self.rejected_queue_full += 1
+            raise self._overloaded("queue full")
+
+        self.queued += 1
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.wait_timeout):
+                await waiter
+        except TimeoutError:
+            # The slot may have been handed over just as the deadline passed
+            if not (waiter.done() and not waiter.cancelled()):
+                self._waiters.remove(waiter)
+                self.rejected_timeout += 1
+                raise self._overloaded("wait deadline exceeded")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        self.admitted += 1
+        self.wait_seconds += time.perf_counter() - started
+
+    def release(self):
+        # Hand the slot straight to the next waiter, so newcomers cannot jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def record_hold(self, seconds: float):
+        # Exponential moving average of hold time, for Retry-After estimates
+        self._hold_seconds = seconds if not self._hold_seconds else 0.9 * self._hold_seconds + 0.1 * seconds
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_hold(time.perf_counter() - started)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 1) if self.queued else 0.0,
+            "avg_hold_seconds": round(self._hold_seconds, 3),
+        }
+
+
+class SessionLocks:
+    """
+    Serializes the turns of each session so messages are appended in order.
+
+    Each busy session gets a one-slot limiter; up to `max_queued` further
+    turns wait their turn and anything beyond that is rejected with 429.
+    Limiters are dropped as soon as their session is idle.
+    """
+
+    def __init__(self, max_queued: int = SESSION_MAX_QUEUED_TURNS, wait_timeout: float = SESSION_TURN_WAIT_SECONDS):
+        self.max_queued = max_queued
+        self.wait_timeout = wait_timeout
+        self._locks: Dict[str, ConcurrencyLimiter] = {}
+        self.rejected = 0
+
+    async def acquire(self, session_id: str) -> Callable[[], None]:
+        """Wait for the session's turn; returns an idempotent release function"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = ConcurrencyLimiter(f"session {session_id}", 1, self.max_queued, self.wait_timeout,
+                                      overload_status=429)
+            self._locks[session_id] = lock
+        try:
+            await lock.acquire()
+        except Overloaded:
+            self.rejected += 1
+            self._discard_if_idle(session_id, lock)
+            raise
+        except asyncio.CancelledError:
+            self._discard_if_idle(session_id, lock)
+            raise
+
+        started = time.perf_counter()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                lock.record_hold(time.perf_counter() - started)
+                lock.release()
+                self._discard_if_idle(session_id, lock)
+
+        return release
+
+    def _discard_if_idle(self, session_id: str, lock: ConcurrencyLimiter):
+        if lock.active == 0 and not lock.waiting and self._locks.get(session_id) is lock:
+            del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold(self, session_id: Optional[str]):
+        """Hold the session's turn for the block; a missing session id needs no lock"""
+        if not session_id:
+            yield
+            return
+        release = await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> dict:
+        return {
+            "busy_sessions": len(self._locks),
+            "queued_turns": sum(lock.waiting for lock in self._locks.values()),
+            "rejected": self.rejected,
+        }
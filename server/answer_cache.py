@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '512'))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', str(6 * 60 * 60)))
+# Minimum cosine similarity between query embeddings for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.95'))
+
+
+class SemanticAnswerCache:
+    """
+    Size-bounded LRU cache of first-turn answers, looked up by query embedding.
+
+    Embeddings live in a preallocated float32 matrix (one row per slot), so a
+    lookup is a single matrix-vector product over the cached queries.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 threshold=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._matrix = None  # allocated on first put, once the dimension is known
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries = OrderedDict()  # slot -> (answer, expires_at, cost_seconds), LRU first
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _release(self, slot):
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def get(self, query_embedding):
+        """
+        Return a cached answer whose query is within the similarity threshold, or None
+        """
+        query = self._normalize(query_embedding)
+        with self._lock:
+            self.lookups += 1
+            if self._matrix is None or not self._entries or query.shape[0] != self._matrix.shape[1]:
+                return None
+
+            scores = self._matrix @ query
+            scores[~self._valid] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return None
+
+            answer, expires_at, cost_seconds = self._entries[slot]
+            if expires_at <= time.monotonic():
+                self._release(slot)
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            self.saved_seconds += cost_seconds
+            return answer
+
+    def put(self, query_embedding, answer, cost_seconds=0.0):
+        """
+        Store an answer; cost_seconds is how long it took to produce, counted as saved on each hit
+        """
+        query = self._normalize(query_embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+            elif query.shape[0] != self._matrix.shape[1]:
+                return
+
+            if not self._free_slots:
+                self._release(next(iter(self._entries)))
+                self.evictions += 1
+            slot = self._free_slots.pop()
+            self._matrix[slot] = query
+            self._valid[slot] = True
+            self._entries[slot] = (answer, time.monotonic() + self.ttl_seconds, cost_seconds)
+
+    def clear(self):
+        """
+        Drop every entry, e.g. after the service data has been reloaded
+        """
+        with self._lock:
+            for slot in list(self._entries):
+                self._release(slot)
+            self.invalidations += 1
+        logger.info("Answer cache invalidated")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": self.lookups - self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
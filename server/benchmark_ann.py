@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Measure recall@k and query latency of the pgvector ANN index against an exact scan.
+
+For each search-time setting (ivfflat.probes or hnsw.ef_search) the same
+queries are run through the index and through an exact sequential scan on
+the real embeddings, and recall@k plus p50/p99 latency are reported.
+Queries are stored chunk embeddings with a little noise added, so no OpenAI
+access is needed.
+
+Usage:
+    python benchmark_ann.py --k 10 --settings 1 2 5 10
+    python benchmark_ann.py --build hnsw --m 16 --ef-construction 64 --settings 10 40 100
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init-db'))
+
+import db
+from benchmark_retrieval import percentile, sample_queries
+from load_data import build_ann_index
+
+KNN_QUERY = "SELECT id FROM MentalHealthEmbeddings ORDER BY embedding <=> %s LIMIT %s"
+
+SEARCH_SETTING = {
+    "ivfflat": "ivfflat.probes",
+    "hnsw": "hnsw.ef_search",
+}
+
+
+def current_index_type(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT am.amname
+            FROM pg_class c JOIN pg_am am ON am.oid = c.relam
+            WHERE c.relname = 'embedding_idx'
+        """)
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def run_queries(conn, queries, k, settings):
+    """
+    Run every query in its own transaction with SET LOCAL settings; returns (ids per query, latencies in ms)
+    """
+    results, latencies = [], []
+    with conn.cursor() as cur:
+        for query in queries:
+            for name, value in settings.items():
+                cur.execute(f"SET LOCAL {name} = %s", (str(value),))
+            started = time.perf_counter()
+            cur.execute(KNN_QUERY, (query, k))
+            ids = [row[0] for row in cur.fetchall()]
+            latencies.append((time.perf_counter() - started) * 1000)
+            conn.rollback()
+            results.append(ids)
+    return results, latencies
+
+
+def main(args):
+    pool = db.get_pool()
+    with pool.connection() as conn:
+        if args.build:
+            build_ann_index(conn, args.build, args.lists, args.m, args.ef_construction)
+        index_type = current_index_type(conn)
+    if index_type not in SEARCH_SETTING:
+        sys.exit("No ivfflat or hnsw index named embedding_idx found; build one with --build")
+
+    queries = sample_queries(pool, args.queries, args.noise, args.seed)
+    with pool.connection() as conn:
+        # Exact ground truth: forbid index scans so the planner sorts every row
+        exact, exact_latencies = run_queries(
+            conn, queries, args.k, {"enable_indexscan": "off", "enable_bitmapscan": "off"}
+        )
+
+        print(f"Index: {index_type}, queries: {len(queries)}, k = {args.k}")
+        print(f"{'setting':>24} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        print(f"{'exact scan':>24} {1.0:>9.3f} {percentile(exact_latencies, 50):>9.3f} "
+              f"{percentile(exact_latencies, 99):>9.3f}")
+
+        setting_name = SEARCH_SETTING[index_type]
+        for value in args.settings:
+            approx, latencies = run_queries(conn, queries, args.k, {setting_name: value})
+            recall = sum(len(set(a) & set(e)) for a, e in zip(approx, exact)) / sum(len(e) for e in exact)
+            print(f"{setting_name + ' = ' + str(value):>24} {recall:>9.3f} {percentile(latencies, 50):>9.3f} "
+                  f"{percentile(latencies, 99):>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN recall and latency against an exact scan")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--settings", type=int, nargs="+", default=[1, 2, 5, 10, 20, 40, 100],
+                        help="Values of ivfflat.probes or hnsw.ef_search to measure")
+    parser.add_argument("--build", choices=sorted(SEARCH_SETTING), help="Rebuild embedding_idx with this index type first")
+    parser.add_argument("--lists", type=int, help="ivfflat lists for --build (default: from row count)")
+    parser.add_argument("--m", type=int, help="hnsw m for --build")
+    parser.add_argument("--ef-construction", type=int, help="hnsw ef_construction for --build")
+    parser.add_argument("--noise", type=float, default=0.01, help="Std-dev of noise added to sampled embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
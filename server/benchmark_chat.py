@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the chat pipeline.
+
+Starts fake_openai.py as a local OpenAI stand-in, loads the service records
+from the CSV into the in-process NumPy index with deterministic fake
+embeddings, serves the FastAPI app from an in-process uvicorn server and
+drives it over loopback HTTP with concurrent multi-turn sessions. Needs
+neither network access nor a database; pass --retrieval pgvector or hybrid
+to retrieve from a running database instead.
+
+Every level reports throughput, rejections (429/503) and end-to-end latency
+percentiles, plus per-stage percentiles taken from the Server-Timing header
+(non-streaming) or time to first token (streaming), so a change can be
+compared before and after on the same machine.
+
+Usage:
+    python benchmark_chat.py --sessions 1 8 32 --turns 3 --latency-ms 400 --tokens-per-second 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import uvicorn
+
+from fake_openai import fake_embedding
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init-db'))
+
+DEFAULT_CSV = 'mental_health_services_nwmphn_dataset.csv'
+QUESTIONS = [
+    "Are there any free counselling services near Footscray?",
+    "I need someone to talk to tonight, is anything open 24/7?",
+    "What services help young people with anxiety in Sunshine?",
+    "Can I see a psychologist online without a referral?",
+    "Where can my dad get help with alcohol use?",
+    "Are there support groups for carers of people with mental illness?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def parse_server_timing(header):
+    """{stage: milliseconds} from a Server-Timing header value"""
+    timings = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value)
+    return timings
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_openai(args, port):
+    command = [
+        sys.executable, "fake_openai.py", "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--tokens-per-second", str(args.tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens),
+        "--embedding-latency-ms", str(args.embedding_latency_ms), "--dimensions", str(args.dimensions),
+    ]
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"fake_openai.py exited with code {process.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("fake_openai.py did not become healthy")
+
+
+def load_memory_index(index, csv_path, dimensions):
+    """Records from the CSV, one fake-embedded chunk each, as the database loader would number them"""
+    from load_data import read_services_csv
+
+    records, chunks = {}, []
+    for record_id, row in enumerate(read_services_csv(csv_path), start=1):
+        record = {col: row.get(col) for col in index.columns if col in row}
+        record["work_force_type"] = row.get("workforce_type")
+        for flag in ("opening_hours_24_7", "opening_hours_standard", "opening_hours_extended"):
+            record[flag] = row.get(flag) == "Yes"
+        record["id"] = record_id
+        records[record_id] = record
+        text = " ".join(str(value) for value in row.values() if value)
+        chunks.append((record_id, fake_embedding(text, dimensions)))
+    index.load_records(records, chunks)
+    return len(records)
+
+
+async def run_session(client, session_index, args, result):
+    response = await client.post("/api/sessions")
+    session_id = response.json()["session_id"]
+    for turn in range(args.turns):
+        message = QUESTIONS[(session_index + turn) % len(QUESTIONS)]
+        if args.unique_messages:
+            # Defeat the embedding and answer caches
+            message = f"{message} (session {session_index}, turn {turn})"
+        started = time.perf_counter()
+        try:
+            if args.stream:
+                status, first_token = await stream_turn(client, session_id, message, started)
+            else:
+                response = await client.post("/api/chat", json={"message": message, "session_id": session_id})
+                status, first_token = response.status_code, None
+                if status == 200:
+                    for name, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                        result["stages"][name].append(ms)
+        except httpx.HTTPError:
+            result["errors"] += 1
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if status == 200:
+            result["latencies"].append(elapsed_ms)
+            if first_token is not None:
+                result["stages"]["first_token"].append(first_token)
+        elif status in (429, 503):
+            result["rejected"] += 1
+        else:
+            result["errors"] += 1
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+
+
+async def stream_turn(client, session_id, message, started):
+    """Status of a streaming turn and its time to first delta in ms; an error event counts as a failure"""
+    first_token = None
+    async with client.stream("POST", "/api/chat/stream", json={"message": message, "session_id": session_id}) as response:
+        if response.status_code != 200:
+            return response.status_code, None
+        event = "message"
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                if event == "error":
+                    return json.loads(line[len("data:"):]).get("status", 500), None
+                if event == "message" and first_token is None:
+                    first_token = (time.perf_counter() - started) * 1000
+            elif not line:
+                event = "message"
+    return 200, first_token
+
+
+async def run_level(base_url, sessions, args):
+    result = {"latencies": [], "rejected": 0, "errors": 0, "stages": defaultdict(list)}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, i, args, result) for i in range(sessions)))
+        result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def report(sessions, result):
+    latencies = result["latencies"]
+    line = (f"{sessions:>8} {len(latencies):>6} {result['rejected']:>8} {result['errors']:>6} "
+            f"{len(latencies) / result['elapsed']:>8.2f}")
+    if latencies:
+        line += "".join(f" {percentile(latencies, pct):>9.0f}" for pct in (50, 95, 99))
+    print(line)
+    for name, values in sorted(result["stages"].items()):
+        print(f"{'':>8} {name:>31}" + "".join(f" {percentile(values, pct):>9.1f}" for pct in (50, 95, 99)))
+
+
+async def main(args):
+    port = free_port()
+    process = start_fake_openai(args, port)
+    try:
+        # Configure the app before it is imported; it reads its settings at import time
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+        os.environ["METRICS_TIMING_HEADERS"] = "true"
+        os.environ["SESSION_STORE"] = "memory"
+        os.environ["RETRIEVAL_BACKEND"] = "numpy" if args.retrieval == "memory" else args.retrieval
+        import main as server
+        import rag_service
+
+        if args.retrieval == "memory":
+            count = load_memory_index(rag_service.numpy_index, args.csv, args.dimensions)
+            print(f"Loaded {count} records into the in-process index")
+
+        # Lifespan off: the startup hooks would load the index and documents from the database
+        app_port = free_port()
+        app_server = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=app_port,
+                                                   lifespan="off", log_level="warning"))
+        serving = asyncio.create_task(app_server.serve())
+        while not app_server.started:
+            await asyncio.sleep(0.05)
+
+        print(f"\n{'sessions':>8} {'ok':>6} {'rejected':>8} {'errors':>6} {'turns/s':>8} "
+              f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for sessions in args.sessions:
+            report(sessions, await run_level(f"http://127.0.0.1:{app_port}", sessions, args))
+        app_server.should_exit = True
+        await serving
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the chat pipeline")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 32],
+                        help="Concurrent sessions for each level")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a session's turns")
+    parser.add_argument("--stream", action="store_true", help="Use /api/chat/stream and report time to first token")
+    parser.add_argument("--unique-messages", action="store_true", help="Make every message distinct")
+    parser.add_argument("--retrieval", choices=["memory", "pgvector", "hybrid"], default="memory",
+                        help="memory loads the CSV into the NumPy index; the others need a database")
+    parser.add_argument("--csv", default=DEFAULT_CSV)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Fake time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Fake completion token rate")
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--embedding-latency-ms", type=float, default=40)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare pgvector and the in-process NumPy index on latency and result agreement.
+
+Queries are stored chunk embeddings with a little Gaussian noise added, so the
+benchmark needs a populated database but no OpenAI access.
+
+Usage:
+    python benchmark_retrieval.py --queries 200 --k 3
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import db
+from rag_service import DOC_COLUMNS, get_top_k_similar_docs
+from vector_index import VectorIndex
+
+
+def sample_queries(pool, n, noise, seed):
+    def fetch(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT embedding FROM MentalHealthEmbeddings ORDER BY random() LIMIT %s", (n,))
+            return [np.asarray(row[0], dtype=np.float32) for row in cur.fetchall()]
+
+    rng = np.random.default_rng(seed)
+    return [q + rng.normal(0, noise, q.shape).astype(np.float32) for q in pool.run(fetch)]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def time_backend(search, queries):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        docs = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([doc["id"] for doc in docs])
+    return latencies, results
+
+
+def main(args):
+    pool = db.get_pool()
+    index = VectorIndex(DOC_COLUMNS, pool=pool)
+    started = time.perf_counter()
+    index.reload()
+    print(f"NumPy index load: {(time.perf_counter() - started) * 1000:.0f} ms {index.stats()}")
+
+    queries = sample_queries(pool, args.queries, args.noise, args.seed)
+
+    def pg_search(query):
+        return pool.run(lambda conn: get_top_k_similar_docs(query, conn, args.k))
+
+    def np_search(query):
+        return index.search(query, args.k)
+
+    # Warm both paths so connection setup and first-call costs are excluded
+    pg_search(queries[0])
+    np_search(queries[0])
+
+    pg_latencies, pg_results = time_backend(pg_search, queries)
+    np_latencies, np_results = time_backend(np_search, queries)
+
+    print(f"\n{'backend':>10} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, latencies in (("pgvector", pg_latencies), ("numpy", np_latencies)):
+        print(f"{name:>10} {percentile(latencies, 50):>9.3f} {percentile(latencies, 99):>9.3f} "
+              f"{statistics.mean(latencies):>9.3f}")
+
+    overlaps = [
+        len(set(pg) & set(npy)) / max(len(npy), 1)
+        for pg, npy in zip(pg_results, np_results)
+    ]
+    exact = sum(pg == npy for pg, npy in zip(pg_results, np_results))
+    print(f"\nMean overlap@{args.k}: {statistics.mean(overlaps):.3f}")
+    print(f"Identical ranked results: {exact}/{len(queries)}")
+    print("(the NumPy index is exact, so disagreement reflects ANN recall loss in pgvector)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pgvector against the in-process NumPy index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.01, help="Std-dev of noise added to sampled embeddings")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Tokens of conversation history sent with each turn (newest messages first)
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '2000'))
+# Messages kept per session; older ones drop off the ring buffer
+SESSION_MAX_MESSAGES = int(os.getenv('SESSION_MAX_MESSAGES', '200'))
+TOKEN_ENCODING = os.getenv('TOKEN_ENCODING', 'o200k_base')
+# Fixed per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_failed = False
+# Held while loading, which may take seconds; the event loop never waits on it
+_encoding_lock = threading.Lock()
+_encoding_loader = None
+_encoding_loader_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    Load the tokenizer once. Returns None if it cannot be loaded (e.g. no
+    network to fetch the BPE file), in which case counts are estimated.
+    Blocking: the first call may download the BPE file.
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    _encoding_failed = True
+                    logger.warning(f"Could not load {TOKEN_ENCODING} tokenizer ({e}); estimating token counts")
+    return _encoding
+
+
+def start_loading_encoding():
+    """
+    Load the tokenizer on a background thread, once; called at startup
+    """
+    global _encoding_loader
+    with _encoding_loader_lock:
+        if _encoding_loader is None and _encoding is None and not _encoding_failed:
+            _encoding_loader = threading.Thread(target=get_encoding, name="tokenizer-load", daemon=True)
+            _encoding_loader.start()
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding
+    if encoding is None and not _encoding_failed:
+        if _on_event_loop():
+            # Loading may download the BPE file, so the loop estimates until it is loaded
+            start_loading_encoding()
+        else:
+            encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+class ChatMessage:
+    """One stored chat message with its token count computed once, at creation"""
+
+    __slots__ = ("role", "content", "created", "tokens", "seq")
+
+    def __init__(self, role: str, content: str, created: Optional[float] = None, tokens: Optional[int] = None,
+                 seq: Optional[int] = None):
+        self.role = role
+        self.content = content
+        self.created = time.time() if created is None else created
+        self.tokens = count_tokens(content) if tokens is None else tokens
+        # Position in the session, increasing; assigned by the session store
+        self.seq = seq
+
+    @classmethod
+    def from_dict(cls, message: dict) -> "ChatMessage":
+        return cls(message["role"], message["content"])
+
+    def to_prompt(self) -> dict:
+        return {"role": self.role, "content": self.content}
+
+    def to_dict(self) -> dict:
+        """API representation, with the ISO timestamp rendered on demand"""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.created).isoformat(),
+        }
+
+
+def select_history_records(history: Sequence, budget: int = HISTORY_TOKEN_BUDGET) -> List[ChatMessage]:
+    """
+    Return the most recent messages that fit in `budget` tokens, oldest first.
+    Accepts ChatMessage records or {"role", "content"} dicts. A message too
+    long for what is left of the budget is skipped, so one long answer does
+    not drop the shorter messages before it; the selection is therefore not
+    always a contiguous tail of `history`.
+    """
+    selected = []
+    used = 0
+    for message in reversed(history):
+        if budget - used < MESSAGE_OVERHEAD_TOKENS:
+            break
+        if not isinstance(message, ChatMessage):
+            message = ChatMessage.from_dict(message)
+        cost = message.tokens + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.append(message)
+    selected.reverse()
+    return selected
+
+
+def select_history(history: Sequence, budget: int = HISTORY_TOKEN_BUDGET) -> List[dict]:
+    """select_history_records as prompt dicts"""
+    return [message.to_prompt() for message in select_history_records(history, budget)]
+
+
+class ConversationSummary:
+    """Running summary of a session's messages up to and including `seq`"""
+
+    __slots__ = ("text", "tokens", "seq")
+
+    def __init__(self, text: str, seq: int, tokens: Optional[int] = None):
+        self.text = text
+        self.seq = seq
+        self.tokens = count_tokens(text) if tokens is None else tokens
+
+    def to_prompt(self) -> dict:
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{self.text}"}
+
+
+def unsummarized(history: Sequence, summary: Optional[ConversationSummary]) -> Sequence:
+    """Messages newer than the summary (all of them if there is no summary)"""
+    if summary is None:
+        return history
+    return [message for message in history if message.seq is None or message.seq > summary.seq]
+
+
+def history_tokens(history: Sequence) -> int:
+    return sum(
+        (message.tokens if isinstance(message, ChatMessage) else count_tokens(message["content"]))
+        + MESSAGE_OVERHEAD_TOKENS
+        for message in history
+    )
+
+
+class PromptTokenStats:
+    """
+    Prompt size per turn, as sent and as it would be with the whole
+    conversation history and no summary
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.summarized_turns = 0
+        self.prompt_tokens = 0
+        self.full_history_prompt_tokens = 0
+        self.max_prompt_tokens = 0
+
+    def record(self, prompt_tokens: int, full_history_prompt_tokens: int, summarized: bool):
+        self.turns += 1
+        self.summarized_turns += int(summarized)
+        self.prompt_tokens += prompt_tokens
+        self.full_history_prompt_tokens += full_history_prompt_tokens
+        self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+
+    def stats(self) -> dict:
+        turns = max(self.turns, 1)
+        return {
+            "turns": self.turns,
+            "summarized_turns": self.summarized_turns,
+            "avg_prompt_tokens": round(self.prompt_tokens / turns, 1),
+            "avg_full_history_prompt_tokens": round(self.full_history_prompt_tokens / turns, 1),
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "tokens_saved_ratio": (
+                round(1 - self.prompt_tokens / self.full_history_prompt_tokens, 3)
+                if self.full_history_prompt_tokens else 0.0
+            ),
+        }
@@ -0,0 +1,345 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '10'))
+# Idle connections older than this are pinged before being handed out
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv('DB_POOL_HEALTHCHECK_IDLE_SECONDS', '30'))
+
+# Errors that mean the connection itself is unusable and should be replaced
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# SQLSTATEs of a lost connection: class 08 and server shutdown. Other
+# OperationalErrors, such as a cancelled query (57014), leave it usable.
+CONNECTION_LOST_SQLSTATES = ('08', '57P01', '57P02', '57P03')
+
+
+def connection_lost(error, conn):
+    """
+    True when `error` means the connection dropped, rather than the statement failing on a live connection
+    """
+    if not isinstance(error, CONNECTION_ERRORS):
+        return False
+    if conn.closed:
+        return True
+    pgcode = getattr(error, 'pgcode', None)
+    return pgcode is not None and pgcode.startswith(CONNECTION_LOST_SQLSTATES)
+
+
+# Statements PREPAREd on every new pooled connection, keyed by statement name
+PREPARED_STATEMENTS = {}
+
+
+def register_prepared_statement(name, statement):
+    """
+    Register a server-side prepared statement for pooled connections.
+    `statement` is the full "PREPARE name (types) AS ..." text. Register
+    statements at import time, before the pool opens its first connection.
+    """
+    PREPARED_STATEMENTS[name] = statement
+
+
+# Session settings (SET name = value) applied to every new pooled connection
+SESSION_SETTINGS = {}
+
+
+def register_session_setting(name, value):
+    """
+    Register a setting applied with SET on every new pooled connection,
+    e.g. search-time ANN parameters such as ivfflat.probes
+    """
+    SESSION_SETTINGS[name] = value
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+def connection_params():
+    return dict(
+        host = os.getenv('POSTGRES_HOST', 'postgres'),
+        database = os.getenv('POSTGRES_DB', 'mental_health_db'),
+        user = os.getenv('POSTGRES_USER', 'mental_health_user'),
+        password = os.getenv('POSTGRES_PASSWORD', 'password'),
+        port = os.getenv('POSTGRES_PORT', '5432'),
+    )
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe psycopg2 connection pool.
+
+    Connections are created on demand up to max_size and have the pgvector
+    type registered once when they are opened. Callers block for up to
+    `timeout` seconds when every connection is checked out.
+    """
+
+    def __init__(self, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT_SECONDS,
+                 healthcheck_idle_seconds=DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+                 connect_kwargs=None):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_idle_seconds = healthcheck_idle_seconds
+        self._connect_kwargs = connect_kwargs or connection_params()
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, last_used_monotonic), most recently used last
+        self._size = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._reconnects = 0
+        self._healthcheck_failures = 0
+
+        for _ in range(min_size):
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        register_vector(conn)
+        if PREPARED_STATEMENTS or SESSION_SETTINGS:
+            with conn.cursor() as cur:
+                for name, value in SESSION_SETTINGS.items():
+                    cur.execute(f"SET {name} = %s", (str(value),))
+                for statement in PREPARED_STATEMENTS.values():
+                    cur.execute(statement)
+        conn.commit()
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_idle_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection available within {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, last_used):
+                with self._cond:
+                    self._healthcheck_failures += 1
+                logger.warning("Discarding unhealthy database connection")
+                self._discard(conn)
+                continue
+
+            wait = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+                if waited:
+                    self._waits += 1
+            return conn
+
+    def putconn(self, conn, close=False):
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _release_after_error(self, conn, error):
+        """
+        Roll back and return a connection whose work failed, closing it
+        instead if the connection itself was lost
+        """
+        if connection_lost(error, conn):
+            self.putconn(conn, close=True)
+            return
+        try:
+            conn.rollback()
+        except CONNECTION_ERRORS:
+            self.putconn(conn, close=True)
+            return
+        self.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection, committing on success and rolling back on error.
+        Connections that were lost are closed instead of being returned to the pool.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            self._release_after_error(conn, e)
+            raise
+        else:
+            self.putconn(conn)
+
+    def run(self, fn, retries=1):
+        """
+        Call fn(conn) in one transaction on a pooled connection and commit it.
+
+        If the connection drops while fn runs, the server rolls back what fn
+        did, so fn is replayed on a fresh connection. Nothing is retried once
+        the commit has been sent: a commit that fails may still have been
+        applied. Errors raised on a live connection (constraint violations,
+        cancelled queries) are never retried. fn must not commit itself.
+        """
+        attempt = 0
+        while True:
+            conn = self.getconn()
+            try:
+                result = fn(conn)
+            except Exception as e:
+                self._release_after_error(conn, e)
+                if attempt >= retries or not connection_lost(e, conn):
+                    raise
+                attempt += 1
+                with self._cond:
+                    self._reconnects += 1
+                logger.warning(f"Database connection lost ({e}); retrying with a new connection")
+                continue
+            try:
+                conn.commit()
+            except Exception as e:
+                self._release_after_error(conn, e)
+                raise
+            self.putconn(conn)
+            return result
+
+    def warm(self, count):
+        """
+        Open connections until at least `count` exist (capped at max_size), so
+        early requests skip connecting, type registration and PREPARE.
+        Returns the number of connections checked.
+        """
+        conns = []
+        try:
+            while len(conns) < min(count, self.max_size):
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+        return len(conns)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._total_wait * 1000, 3),
+                "avg_wait_ms": round(self._total_wait * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "reconnects": self._reconnects,
+                "healthcheck_failures": self._healthcheck_failures,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide pool, creating it on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+                logger.info(f"Opened database pool (min={_pool.min_size}, max={_pool.max_size})")
+    return _pool
+
+
+def pool_stats():
+    """
+    Statistics of the process-wide pool without opening it; opening connects
+    to the database, which would block the caller
+    """
+    pool = _pool
+    if pool is None:
+        return {"open": False}
+    return {"open": True, **pool.stats()}
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
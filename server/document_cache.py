@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import db
+from chat_context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens of rendered service records added to each prompt; the best match is always included
+DOC_TOKEN_BUDGET = int(os.getenv('DOC_TOKEN_BUDGET', '1200'))
+
+# Rendered in this order; columns not listed here (and the id) are never sent to the model
+FIELD_LABELS = (
+    ("service_name", "Service"),
+    ("organisation_name", "Organisation"),
+    ("campus_name", "Campus"),
+    ("region_name", "Region"),
+    ("service_type", "Type"),
+    ("level_of_care", "Care"),
+    ("target_population", "For"),
+    ("delivery_method", "Delivery"),
+    ("cost", "Cost"),
+    ("referral_pathway", "Referral"),
+    ("expected_wait_time", "Wait"),
+    ("work_force_type", "Workforce"),
+)
+ADDRESS_COLUMNS = ("address", "suburb", "state", "postcode")
+CONTACT_LABELS = (("phone", "Phone"), ("email", "Email"), ("website", "Web"))
+HOURS_FLAGS = (
+    ("opening_hours_24_7", "24/7"),
+    ("opening_hours_standard", "standard hours"),
+    ("opening_hours_extended", "extended hours"),
+)
+RENDER_COLUMNS = tuple(
+    [column for column, _ in FIELD_LABELS] + list(ADDRESS_COLUMNS) + [column for column, _ in CONTACT_LABELS]
+    + [column for column, _ in HOURS_FLAGS] + ["op_hours_extended_details", "notes"]
+)
+
+
+def _value(record: dict, column: str) -> Optional[str]:
+    value = record.get(column)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value or value.lower() == "nan":
+        return None
+    return value
+
+
+def render_document(record: dict) -> str:
+    """
+    Render a service record as one compact line of "Label: value" fields,
+    leaving out empty fields and folding the opening-hours flags, address
+    parts and duplicate names together
+    """
+    fields = []
+    for column, label in FIELD_LABELS:
+        value = _value(record, column)
+        if value is None:
+            continue
+        if column == "organisation_name" and value == _value(record, "service_name"):
+            continue
+        fields.append(f"{label}: {value}")
+
+    hours = [text for column, text in HOURS_FLAGS if record.get(column) is True]
+    details = _value(record, "op_hours_extended_details")
+    if details:
+        hours.append(details)
+    if hours:
+        fields.append(f"Hours: {', '.join(hours)}")
+
+    address = [value for value in (_value(record, column) for column in ADDRESS_COLUMNS) if value]
+    if address:
+        fields.append(f"Address: {', '.join(address)}")
+    for column, label in CONTACT_LABELS:
+        value = _value(record, column)
+        if value:
+            fields.append(f"{label}: {value}")
+
+    notes = _value(record, "notes")
+    if notes:
+        fields.append(f"Notes: {notes}")
+    return "; ".join(fields)
+
+
+class RenderedDocument:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = count_tokens(text)
+
+
+class DocumentRenderCache:
+    """
+    Compact, token-counted renderings of service records keyed by record id.
+
+    Records are rendered once, when the cache is warmed at startup or on
+    first retrieval, and cleared when the service data changes. Changed
+    records get a new id on sync, so a rendering never outlives its content.
+    """
+
+    def __init__(self, budget: int = DOC_TOKEN_BUDGET, pool=None):
+        self.budget = budget
+        self._pool = pool
+        self._documents: Dict[int, RenderedDocument] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dropped = 0
+
+    @property
+    def pool(self):
+        return self._pool or db.get_pool()
+
+    def get(self, record: dict) -> RenderedDocument:
+        record_id = record.get("id")
+        document = self._documents.get(record_id) if record_id is not None else None
+        if document is not None:
+            self.hits += 1
+            return document
+        self.misses += 1
+        document = RenderedDocument(render_document(record))
+        if record_id is not None:
+            self._documents[record_id] = document
+        return document
+
+    def render(self, records: List[dict], budget: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Join the renderings of records, best first, until the token budget is
+        used up; returns (text, tokens)
+        """
+        budget = self.budget if budget is None else budget
+        lines, used = [], 0
+        for position, record in enumerate(records):
+            document = self.get(record)
+            if lines and used + document.tokens > budget:
+                self.dropped += len(records) - position
+                break
+            lines.append(document.text)
+            used += document.tokens
+        return "\n".join(lines), used
+
+    def warm(self):
+        """
+        Render every record in MentalHealthRawData, replacing the current contents
+        """
+        with self._lock:
+            started = time.perf_counter()
+
+            def load(conn):
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT id, {', '.join(RENDER_COLUMNS)} FROM MentalHealthRawData")
+                    colnames = [desc[0] for desc in cur.description]
+                    return [dict(zip(colnames, row)) for row in cur.fetchall()]
+
+            records = self.pool.run(load)
+            self._documents = {record["id"]: RenderedDocument(render_document(record)) for record in records}
+            logger.info(
+                f"Rendered {len(records)} service records in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+
+    def clear(self):
+        self._documents = {}
+
+    def stats(self) -> dict:
+        documents = list(self._documents.values())
+        lookups = self.hits + self.misses
+        return {
+            "documents": len(documents),
+            "avg_tokens": round(sum(d.tokens for d in documents) / len(documents), 1) if documents else 0.0,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "dropped_for_budget": self.dropped,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '2048'))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv('EMBEDDING_CACHE_TTL_SECONDS', str(24 * 60 * 60)))
+# Optional SQLite file for a second cache tier that survives restarts; empty disables it
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '')
+# Rows kept in the SQLite tier; the oldest are deleted beyond this
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_DISK_MAX_ENTRIES', '100000'))
+
+DISK_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS query_embeddings (
+        model TEXT NOT NULL,
+        -- Dimensions requested of the model, 0 for its native size
+        dimensions INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (model, dimensions, text)
+    );
+    CREATE INDEX IF NOT EXISTS query_embeddings_created_at_idx ON query_embeddings (created_at);
+    -- Earlier versions keyed entries without dimensions
+    DROP TABLE IF EXISTS embedding_cache;
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse whitespace and case so trivially different messages share an entry
+    """
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with a TTL, keyed by (model,
+    dimensions, normalized text); `dimensions` is what was requested of the
+    model, None for its native size.
+
+    When `path` is set, entries are also kept in a SQLite table of at most
+    `disk_max_entries` rows and looked up there on a memory miss, so the
+    cache survives restarts. The async lookups read SQLite on a worker
+    thread, and writes made from the event loop are batched and written
+    behind on a worker thread, so the disk tier never blocks the loop.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+                 path=EMBEDDING_CACHE_PATH, disk_max_entries=EMBEDDING_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict()  # key -> (embedding, expires_at wall-clock)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_evictions = 0
+        self.disk_writes = 0
+
+        self._db = None
+        # Serialises use of the SQLite connection, which worker threads share
+        self._db_lock = threading.Lock()
+        self._pending_writes = []
+        self._flushing = False
+        self._flush_task = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(DISK_SCHEMA)
+            self._db.commit()
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            logger.info(f"Embedding cache persisted to {path}")
+
+    def _key(self, text, model, dimensions=None):
+        return (model, dimensions or 0, normalize_text(text))
+
+    def _lookup_memory(self, keys, now) -> List[Optional[list]]:
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    embedding, expires_at = entry
+                    if expires_at > now:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results.append(embedding)
+                        continue
+                    del self._entries[key]
+                    self.expirations += 1
+                results.append(None)
+        return results
+
+    def _lookup_disk(self, keys, results, now) -> List[Optional[list]]:
+        """Fill memory misses from SQLite. Blocking: the async lookups run it on a worker thread."""
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        found = {}
+        if self._db is not None and missing:
+            with self._db_lock:
+                for i in missing:
+                    embedding = self._disk_get(keys[i], now)
+                    if embedding is not None:
+                        found[i] = embedding
+        with self._lock:
+            for i in missing:
+                if i in found:
+                    results[i] = found[i]
+                    self.disk_hits += 1
+                    self._store(keys[i], found[i], now)
+                else:
+                    self.misses += 1
+        return results
+
+    def get(self, text, model, dimensions=None):
+        """Blocking lookup, for scripts; the API uses get_async"""
+        keys = [self._key(text, model, dimensions)]
+        now = time.time()
+        return self._lookup_disk(keys, self._lookup_memory(keys, now), now)[0]
+
+    async def get_many_async(self, texts: Sequence[str], model, dimensions=None) -> List[Optional[list]]:
+        """Cached embeddings for texts, None for misses; all disk lookups share one worker thread hop"""
+        keys = [self._key(text, model, dimensions) for text in texts]
+        now = time.time()
+        results = self._lookup_memory(keys, now)
+        if self._db is not None and None in results:
+            return await asyncio.to_thread(self._lookup_disk, keys, results, now)
+        return self._lookup_disk(keys, results, now)
+
+    async def get_async(self, text, model, dimensions=None):
+        return (await self.get_many_async([text], model, dimensions))[0]
+
+    def put(self, text, model, embedding, dimensions=None):
+        key = self._key(text, model, dimensions)
+        embedding = list(embedding)
+        now = time.time()
+        with self._lock:
+            self._store(key, embedding, now)
+            if self._db is None:
+                return
+            self._pending_writes.append(
+                (*key, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            )
+            if self._flushing:
+                return
+            self._flushing = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, tests): write through
+            self.flush()
+            return
+        self._flush_task = loop.create_task(asyncio.to_thread(self.flush))
+
+    def flush(self):
+        """Write pending entries to SQLite until none are left; blocking"""
+        while True:
+            with self._lock:
+                batch, self._pending_writes = self._pending_writes, []
+                if not batch:
+                    self._flushing = False
+                    return
+            try:
+                with self._db_lock:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO query_embeddings (model, dimensions, text, embedding, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                    self._disk_rows += len(batch)
+                    self._trim_disk(time.time())
+                    self._db.commit()
+                with self._lock:
+                    self.disk_writes += len(batch)
+            except Exception as e:
+                logger.warning(f"Failed to write {len(batch)} entries to the embedding cache file: {e}")
+
+    async def drain(self):
+        """Wait for entries written behind to reach SQLite, e.g. before shutdown"""
+        while self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+
+    def _store(self, key, embedding, now):
+        self._entries[key] = (embedding, now + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        row = self._db.execute(
+            "SELECT embedding, created_at FROM query_embeddings WHERE model = ? AND dimensions = ? AND text = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if created_at + self.ttl_seconds <= now:
+            self._db.execute("DELETE FROM query_embeddings WHERE model = ? AND dimensions = ? AND text = ?", key)
+            self._db.commit()
+            self._disk_rows -= 1
+            with self._lock:
+                self.expirations += 1
+            return None
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+
+    def _trim_disk(self, now):
+        # _disk_rows overcounts replaced rows, so it only decides when to count for real
+        if self._disk_rows <= self.disk_max_entries:
+            return
+        self._db.execute("DELETE FROM query_embeddings WHERE created_at <= ?", (now - self.ttl_seconds,))
+        rows = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        excess = rows - self.disk_max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN "
+                "(SELECT rowid FROM query_embeddings ORDER BY created_at LIMIT ?)",
+                (excess,),
+            )
+            self.disk_evictions += excess
+            rows -= excess
+        self._disk_rows = rows
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending_writes.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+                self._disk_rows = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self._db is not None,
+                "disk_size": self._disk_rows if self._db is not None else 0,
+                "disk_max_entries": self.disk_max_entries,
+                "pending_writes": len(self._pending_writes),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "disk_evictions": self.disk_evictions,
+                "disk_writes": self.disk_writes,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
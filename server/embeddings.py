@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import openai
+
+from metrics import record_usage
+
+logger = logging.getLogger(__name__)
+
+# "openai" calls the embeddings API; "local" runs a sentence-transformers model on the CPU
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'openai')
+EMBEDDING_PROVIDERS = ("openai", "local")
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+# Shortened OpenAI embeddings (text-embedding-3 models only); unset keeps the model's size
+EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '0')) or None
+
+# Local model, its inference backend ("torch" or "onnx") and request batching
+LOCAL_EMBEDDING_MODEL = os.getenv('LOCAL_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+LOCAL_EMBEDDING_BACKEND = os.getenv('LOCAL_EMBEDDING_BACKEND', 'torch')
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', '32'))
+# How long a query waits for others to share its batch
+LOCAL_EMBEDDING_BATCH_WAIT_MS = float(os.getenv('LOCAL_EMBEDDING_BATCH_WAIT_MS', '2'))
+LOCAL_EMBEDDING_THREADS = int(os.getenv('LOCAL_EMBEDDING_THREADS', '1'))
+
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Which model produced the stored vectors. Also part of init-db/02-create-tables.sql;
+# applied here so existing databases pick it up.
+EMBEDDING_METADATA_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS EmbeddingMetadata (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        provider VARCHAR(32) NOT NULL,
+        model VARCHAR(255) NOT NULL,
+        dimensions INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+
+class EmbeddingModelMismatch(Exception):
+    """Raised when the stored vectors were made by a different model than the configured provider's"""
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into embedding vectors, for queries and for ingestion.
+    `model` and `dimensions` are recorded with the stored vectors, since
+    vectors from different models cannot be compared.
+    """
+
+    name = "base"
+    model = None
+    dimensions = None
+    # Output size asked of the model (shortened OpenAI embeddings); None for its native size
+    requested_dimensions = None
+
+    @abstractmethod
+    async def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """One vector per text, in order"""
+
+    async def embed_one(self, text: str) -> List[float]:
+        return (await self.embed([text]))[0]
+
+    async def warm(self):
+        """Make the first real call fast"""
+
+    def describe(self) -> dict:
+        return {"provider": self.name, "model": self.model, "dimensions": self.dimensions}
+
+    def stats(self) -> dict:
+        return self.describe()
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    The OpenAI embeddings API. client_factory returns the AsyncOpenAI client
+    to use, so the API server can share its long-lived client.
+    """
+
+    name = "openai"
+
+    def __init__(self, client_factory: Optional[Callable[[], openai.AsyncOpenAI]] = None,
+                 model: str = EMBEDDING_MODEL, dimensions: Optional[int] = EMBEDDING_DIMENSIONS):
+        self._client_factory = client_factory
+        self._client = None
+        self.model = model
+        self.requested_dimensions = dimensions
+        self.dimensions = dimensions or OPENAI_EMBEDDING_DIMENSIONS.get(model)
+        self.requests = 0
+        self.texts = 0
+
+    def client(self):
+        if self._client_factory is not None:
+            return self._client_factory()
+        if self._client is None:
+            self._client = openai.AsyncOpenAI()
+        return self._client
+
+    async def embed(self, texts):
+        kwargs = {"dimensions": self.requested_dimensions} if self.requested_dimensions else {}
+        response = await self.client().embeddings.create(model=self.model, input=list(texts), **kwargs)
+        record_usage(self.model, response.usage)
+        self.requests += 1
+        self.texts += len(texts)
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        if embeddings:
+            self.dimensions = len(embeddings[0])
+        return embeddings
+
+    async def warm(self):
+        # Opens the HTTPS connection (DNS, TLS) and checks the key; model lookups are not billed
+        await self.client().models.retrieve(self.model)
+
+    def stats(self):
+        return {**self.describe(), "requests": self.requests, "texts": self.texts}
+
+
+def load_sentence_transformer(model: str, backend: str):
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        raise RuntimeError(
+            "EMBEDDING_PROVIDER=local needs sentence-transformers: pip install -r requirements-local.txt"
+        ) from e
+    return SentenceTransformer(model, backend=backend, device="cpu")
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    A sentence-transformers model (PyTorch or ONNX) run on the CPU.
+
+    The model is loaded on first use. Queries arriving within
+    `batch_wait_ms` of each other are encoded as one batch on a small thread
+    pool, which keeps the event loop free and amortises per-call overhead
+    under load. Vectors are normalised, so cosine and dot product agree.
+    """
+
+    name = "local"
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL, backend: str = LOCAL_EMBEDDING_BACKEND,
+                 batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE, batch_wait_ms: float = LOCAL_EMBEDDING_BATCH_WAIT_MS,
+                 threads: int = LOCAL_EMBEDDING_THREADS, loader=load_sentence_transformer):
+        self.model = model
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._loader = loader
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="embedding")
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        self._batches = set()
+        self.batches = 0
+        self.texts = 0
+        self.encode_seconds = 0.0
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = self._loader(self.model, self.backend)
+                    logger.info(f"Loaded local embedding model {self.model} ({self.backend}) "
+                                f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._model
+
+    @property
+    def dimensions(self):
+        return self._get_model().get_sentence_embedding_dimension()
+
+    def _encode(self, texts):
+        model = self._get_model()
+        started = time.perf_counter()
+        vectors = model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                               convert_to_numpy=True)
+        self.encode_seconds += time.perf_counter() - started
+        self.batches += 1
+        self.texts += len(texts)
+        return vectors.tolist()
+
+    async def embed(self, texts):
+        loop = asyncio.get_running_loop()
+        if len(texts) >= self.batch_size:
+            return await loop.run_in_executor(self._executor, self._encode, list(texts))
+
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            vectors = await loop.run_in_executor(self._executor, self._encode, [text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            # Callers that were cancelled meanwhile have already moved on
+            if not future.done():
+                future.set_result(vector)
+
+    async def warm(self):
+        await self.embed(["warm-up"])
+
+    def stats(self):
+        loaded = self._model is not None
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "dimensions": self.dimensions if loaded else None,
+            "backend": self.backend,
+            "loaded": loaded,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "avg_encode_ms": round(self.encode_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+        }
+
+
+def create_embedding_provider(kind: str = EMBEDDING_PROVIDER, client_factory=None) -> EmbeddingProvider:
+    if kind == "openai":
+        return OpenAIEmbeddingProvider(client_factory)
+    if kind == "local":
+        return LocalEmbeddingProvider()
+    raise ValueError(f"Unknown embedding provider: {kind} (expected one of {EMBEDDING_PROVIDERS})")
+
+
+def stored_embedding_model(conn) -> Optional[dict]:
+    """
+    Provider, model and dimensions of the stored vectors. Databases loaded
+    before EmbeddingMetadata existed only report the dimensions of a stored
+    vector. None when there are no stored vectors.
+    """
+    with conn.cursor() as cur:
+        cur.execute(EMBEDDING_METADATA_SCHEMA)
+        cur.execute("SELECT provider, model, dimensions FROM EmbeddingMetadata")
+        row = cur.fetchone()
+        if row:
+            return {"provider": row[0], "model": row[1], "dimensions": row[2]}
+        cur.execute("SELECT vector_dims(embedding) FROM MentalHealthEmbeddings LIMIT 1")
+        row = cur.fetchone()
+        return {"provider": None, "model": None, "dimensions": row[0]} if row else None
+
+
+def record_embedding_model(conn, provider: EmbeddingProvider):
+    """Record the provider's model as the one behind the stored vectors, in the caller's transaction"""
+    with conn.cursor() as cur:
+        cur.execute(EMBEDDING_METADATA_SCHEMA)
+        cur.execute("""
+            INSERT INTO EmbeddingMetadata (provider, model, dimensions) VALUES (%s, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET provider = EXCLUDED.provider, model = EXCLUDED.model,
+                dimensions = EXCLUDED.dimensions, updated_at = CURRENT_TIMESTAMP
+        """, (provider.name, provider.model, provider.dimensions))
+
+
+def check_embedding_model(stored: Optional[dict], provider: EmbeddingProvider):
+    """
+    Raise EmbeddingModelMismatch unless the provider's vectors can be
+    compared with the stored ones
+    """
+    if stored is None:
+        return
+    if stored["model"] is not None and stored["model"] != provider.model:
+        raise EmbeddingModelMismatch(
+            f"Stored vectors were made by {stored['provider']}/{stored['model']}, "
+            f"but the configured embedding model is {provider.name}/{provider.model}; re-embed the data "
+            f"or set EMBEDDING_PROVIDER and EMBEDDING_MODEL to match"
+        )
+    if stored["dimensions"] != provider.dimensions:
+        raise EmbeddingModelMismatch(
+            f"Stored vectors have {stored['dimensions']} dimensions, "
+            f"but {provider.name}/{provider.model} produces {provider.dimensions}"
+        )
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI API, for offline benchmarks.
+
+Serves /v1/embeddings and /v1/chat/completions (including streaming) with
+configurable latency and token rates. Embeddings are deterministic per
+input text; completions are filler text of a fixed length. Token counts are
+estimated at four characters per token and reported in the usage field.
+
+Usage:
+    python fake_openai.py --port 8100 --latency-ms 400 --tokens-per-second 60 --completion-tokens 120
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FILLER_WORDS = ("You", " could", " contact", " a", " local", " community", " health", " service", ".")
+
+
+def fake_embedding(text: str, dimensions: int = 1536) -> np.ndarray:
+    """Deterministic unit vector for a text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(latency_ms: float = 400, tokens_per_second: float = 60, completion_tokens: int = 120,
+               embedding_latency_ms: float = 40, dimensions: int = 1536) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI API")
+    token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0
+
+    @app.get("/health")
+    def health():
+        return {"status": "healthy"}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embedding_latency_ms / 1000)
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text), body.get("dimensions") or dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        prompt_tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in body["messages"])
+        n_tokens = min(completion_tokens, body.get("max_tokens") or completion_tokens)
+        words = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(n_tokens)]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + n_tokens * token_interval)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        def chunk(delta, finish_reason=None, **extra):
+            choices = [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": choices, **extra}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            # Time to first token, then a steady token rate
+            await asyncio.sleep(latency_ms / 1000)
+            yield chunk({"role": "assistant", "content": ""})
+            for word in words:
+                yield chunk({"content": word})
+                await asyncio.sleep(token_interval)
+            yield chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible API for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Time to first token of a completion")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Completion token rate")
+    parser.add_argument("--completion-tokens", type=int, default=120, help="Tokens per completion")
+    parser.add_argument("--embedding-latency-ms", type=float, default=40)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency_ms, args.tokens_per_second, args.completion_tokens,
+                   args.embedding_latency_ms, args.dimensions),
+        host=args.host, port=args.port, log_level="warning",
+    )
@@ -0,0 +1,248 @@
+import logging
+import os
+import re
+import threading
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion constant: larger values flatten the difference between ranks
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+# Records taken from each of the vector and full-text rankings before fusion
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+
+# Victorian postcodes (3000-3999); other four-digit numbers are more likely years or phone fragments
+POSTCODE_PATTERN = re.compile(r"\b(3\d{3})\b")
+OPEN_24_7_PATTERN = re.compile(r"\b24\s*/\s*7\b|\b24[\s-]*hours?\b|\baround the clock\b|\bovernight\b", re.I)
+FREE_PATTERN = re.compile(r"(?<!feel )\bfree\b(?!\s+to\b)|\bno cost\b|\bbulk[\s-]?bill", re.I)
+ONLINE_PATTERN = re.compile(r"\bonline\b|\btelehealth\b|\bvirtual(ly)?\b|\bvideo call", re.I)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class QueryFilters:
+    """Structured filters pulled out of a user query"""
+
+    __slots__ = ("suburb", "postcode", "open_24_7", "free", "online")
+
+    def __init__(self, suburb: Optional[str] = None, postcode: Optional[str] = None,
+                 open_24_7: bool = False, free: bool = False, online: bool = False):
+        self.suburb = suburb
+        self.postcode = postcode
+        self.open_24_7 = open_24_7
+        self.free = free
+        self.online = online
+
+    def __bool__(self):
+        return bool(self.suburb or self.postcode or self.open_24_7 or self.free or self.online)
+
+    def __repr__(self):
+        return f"QueryFilters({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+    def where_clause(self):
+        """
+        SQL predicates over MentalHealthRawData r and their parameters. A
+        location matches services in that suburb or postcode, and services
+        delivered online, which are available anywhere.
+        """
+        predicates, params = [], []
+        location = []
+        if self.suburb:
+            location.append("lower(r.suburb) = %s")
+            params.append(self.suburb.lower())
+        if self.postcode:
+            location.append("r.postcode = %s")
+            params.append(self.postcode)
+        if location:
+            predicates.append(f"({' OR '.join(location)} OR r.delivery_method ILIKE '%%Online%%')")
+        if self.open_24_7:
+            predicates.append("r.opening_hours_24_7")
+        if self.free:
+            predicates.append("r.cost ILIKE 'Free%%'")
+        if self.online:
+            predicates.append("r.delivery_method ILIKE '%%Online%%'")
+        return " AND ".join(predicates) or "TRUE", params
+
+
+def suburb_pattern(suburbs: Iterable[str]) -> Optional[re.Pattern]:
+    names = sorted({suburb.strip() for suburb in suburbs if suburb and suburb.strip()}, key=len, reverse=True)
+    if not names:
+        return None
+    return re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b", re.I)
+
+
+def extract_filters(text: str, suburbs: Optional[re.Pattern] = None) -> QueryFilters:
+    """
+    Pull suburb, postcode, 24/7, free and online filters out of a query with
+    regular expressions; no model call involved
+    """
+    suburb = suburbs.search(text) if suburbs is not None else None
+    postcode = POSTCODE_PATTERN.search(text)
+    return QueryFilters(
+        suburb=suburb.group(1) if suburb else None,
+        postcode=postcode.group(1) if postcode else None,
+        open_24_7=bool(OPEN_24_7_PATTERN.search(text)),
+        free=bool(FREE_PATTERN.search(text)),
+        online=bool(ONLINE_PATTERN.search(text)),
+    )
+
+
+def text_query(text: str) -> str:
+    """
+    OR of the query words for to_tsquery, so a record matching some of the
+    words still ranks; stop words are dropped by the english configuration
+    """
+    return " | ".join(dict.fromkeys(WORD_PATTERN.findall(text.lower())))
+
+
+class HybridRetriever:
+    """
+    Filtered vector search and full-text search over the service records,
+    fused with reciprocal rank fusion in a single query.
+
+    Structured filters narrow both candidate sets before ranking. The
+    filtered vector search is an exact scan over the matching records'
+    chunks, which is cheaper than the ANN index once a filter applies. If the
+    filters leave nothing, the query is retried without them.
+    """
+
+    def __init__(self, columns, pool=None, rrf_k: int = HYBRID_RRF_K, candidates: int = HYBRID_CANDIDATES):
+        self.columns = tuple(columns)
+        self._pool = pool
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self._suburbs = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.filtered_queries = 0
+        self.fallbacks = 0
+
+    @property
+    def pool(self):
+        return self._pool or db.get_pool()
+
+    def _prepare(self, conn):
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'mentalhealthrawdata' AND column_name = 'search_tsv'"
+            )
+            if cur.fetchone() is None:
+                raise RuntimeError(
+                    "MentalHealthRawData has no search_tsv column; run init-db/load_data.py to add the hybrid search schema"
+                )
+            cur.execute("SELECT DISTINCT suburb FROM MentalHealthRawData WHERE suburb IS NOT NULL")
+            return suburb_pattern(row[0] for row in cur.fetchall())
+
+    def suburbs(self):
+        """
+        Pattern of the suburbs present in the data, loaded on first use. The
+        full-text column and indexes come from init-db, never from the API.
+        """
+        if self._suburbs is None:
+            with self._lock:
+                if self._suburbs is None:
+                    self._suburbs = self.pool.run(self._prepare) or re.compile(r"(?!)")
+        return self._suburbs
+
+    def reset(self):
+        """Forget the suburb vocabulary after the service data changes"""
+        self._suburbs = None
+
+    def _search(self, conn, query_embedding, words, filters, k):
+        where, filter_params = filters.where_clause()
+        # Unfiltered, order by the bare distance expression so the ANN index can serve it
+        chunks = (
+            f"""
+                SELECT e.record_index, e.embedding <=> %s AS distance
+                FROM MentalHealthEmbeddings e
+                JOIN MentalHealthRawData r ON r.id = e.record_index
+                WHERE {where}
+                ORDER BY distance
+                LIMIT %s
+            """ if filters else """
+                SELECT record_index, embedding <=> %s AS distance
+                FROM MentalHealthEmbeddings
+                ORDER BY embedding <=> %s
+                LIMIT %s
+            """
+        )
+        embedding = np.asarray(query_embedding)
+        vector_params = [embedding, *filter_params] if filters else [embedding, embedding]
+        ranked = [f"""
+            SELECT record_index AS id, ROW_NUMBER() OVER (ORDER BY MIN(distance)) AS rank
+            FROM ({chunks}) chunks
+            GROUP BY record_index
+            ORDER BY MIN(distance)
+            LIMIT %s
+        """]
+        # A few chunks per record, since long records are stored as several chunks
+        params = [*vector_params, self.candidates * 4, self.candidates]
+        if words:
+            ranked.append(f"""
+                SELECT r.id, ROW_NUMBER() OVER (ORDER BY ts_rank_cd(r.search_tsv, q) DESC) AS rank
+                FROM MentalHealthRawData r, to_tsquery('english', %s) q
+                WHERE r.search_tsv @@ q AND {where}
+                ORDER BY rank
+                LIMIT %s
+            """)
+            params += [words, *filter_params, self.candidates]
+        union = " UNION ALL ".join(f"({sql})" for sql in ranked)
+
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT r.id, {", ".join("r." + col for col in self.columns)}, fused.score
+                FROM (
+                    SELECT id, SUM(1.0 / (%s + rank)) AS score
+                    FROM ({union}) ranked
+                    GROUP BY id
+                    ORDER BY score DESC
+                    LIMIT %s
+                ) fused
+                JOIN MentalHealthRawData r ON r.id = fused.id
+                ORDER BY fused.score DESC
+            """, [self.rrf_k, *params, k])
+            colnames = [desc[0] for desc in cur.description]
+            return [dict(zip(colnames, row)) for row in cur.fetchall()]
+
+    def _search_with_fallback(self, conn, query_embedding, query_text, k):
+        filters = extract_filters(query_text, self.suburbs())
+        words = text_query(query_text)
+        self.queries += 1
+        if filters:
+            self.filtered_queries += 1
+            logger.info(f"Hybrid retrieval filters: {filters!r}")
+        results = self._search(conn, query_embedding, words, filters, k)
+        if not results and filters:
+            self.fallbacks += 1
+            results = self._search(conn, query_embedding, words, QueryFilters(), k)
+        return results
+
+    def search(self, query_embedding, query_text: str, k: int) -> List[dict]:
+        """
+        Return up to k records for the query, best first, in the same shape as
+        rag_service.get_top_k_similar_docs (score is the fused rank score)
+        """
+        # Load the suburb vocabulary first; it checks out a connection of its own
+        self.suburbs()
+        return self.pool.run(lambda conn: self._search_with_fallback(conn, query_embedding, query_text, k))
+
+    def search_many(self, query_embeddings, query_texts, k: int) -> List[List[dict]]:
+        """search() for several queries over one pooled connection"""
+        self.suburbs()
+        return self.pool.run(lambda conn: [
+            self._search_with_fallback(conn, embedding, text, k)
+            for embedding, text in zip(query_embeddings, query_texts)
+        ])
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "filtered_queries": self.filtered_queries,
+            "unfiltered_fallbacks": self.fallbacks,
+            "rrf_k": self.rrf_k,
+            "candidates": self.candidates,
+        }
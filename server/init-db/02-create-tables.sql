@@ -24,9 +24,23 @@ CREATE TABLE IF NOT EXISTS MentalHealthRawData (
   referral_pathway TEXT,
   service_type TEXT,
   target_population TEXT,
-  work_force_type TEXT
+  work_force_type TEXT,
+  -- SHA-256 of the source CSV row, used by sync_index.py for incremental updates
+  content_hash CHAR(64) UNIQUE,
+  -- Full-text search over the descriptive fields, for hybrid retrieval
+  search_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english',
+    coalesce(service_name, '') || ' ' || coalesce(organisation_name, '') || ' ' ||
+    coalesce(campus_name, '') || ' ' || coalesce(service_type, '') || ' ' ||
+    coalesce(level_of_care, '') || ' ' || coalesce(target_population, '') || ' ' ||
+    coalesce(notes, '') || ' ' || coalesce(suburb, ''))) STORED
 );
 
+-- Full-text and structured-filter indexes used by RETRIEVAL_BACKEND=hybrid
+CREATE INDEX IF NOT EXISTS raw_data_search_idx ON MentalHealthRawData USING GIN (search_tsv);
+CREATE INDEX IF NOT EXISTS raw_data_suburb_idx ON MentalHealthRawData (lower(suburb));
+CREATE INDEX IF NOT EXISTS raw_data_postcode_idx ON MentalHealthRawData (postcode);
+CREATE INDEX IF NOT EXISTS raw_data_24_7_idx ON MentalHealthRawData (id) WHERE opening_hours_24_7;
+
 -- Create MentalHealthEmbeddings table
 CREATE TABLE IF NOT EXISTS MentalHealthEmbeddings (
   id SERIAL PRIMARY KEY,
@@ -35,5 +49,43 @@ CREATE TABLE IF NOT EXISTS MentalHealthEmbeddings (
   embedding vector(1536)
 );
 
--- Create index for vector similarity search
-CREATE INDEX IF NOT EXISTS embedding_idx ON MentalHealthEmbeddings USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
\ No newline at end of file
+-- The vector similarity index (embedding_idx) is built by load_data.py after
+-- the embeddings are loaded, so its IVF lists are trained on the real data.
+
+-- Chunk lookups by record (joins, incremental sync deletes)
+CREATE INDEX IF NOT EXISTS embedding_record_idx ON MentalHealthEmbeddings (record_index);
+
+-- The embedding model behind the stored vectors (a single row), checked by the
+-- API and sync_index.py against EMBEDDING_PROVIDER / EMBEDDING_MODEL
+CREATE TABLE IF NOT EXISTS EmbeddingMetadata (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  provider VARCHAR(32) NOT NULL,
+  model VARCHAR(255) NOT NULL,
+  dimensions INTEGER NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Chat sessions for SESSION_STORE=postgres
+CREATE TABLE IF NOT EXISTS ChatSessions (
+  session_id TEXT PRIMARY KEY,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_activity TIMESTAMPTZ NOT NULL DEFAULT now(),
+  -- min(created_at + TTL, last_activity + inactivity timeout), kept current on every write
+  expires_at TIMESTAMPTZ NOT NULL,
+  -- Running conversation summary covering messages up to summary_seq (a ChatMessages id)
+  summary TEXT,
+  summary_tokens INTEGER,
+  summary_seq BIGINT
+);
+CREATE INDEX IF NOT EXISTS chat_sessions_expires_at_idx ON ChatSessions (expires_at);
+CREATE INDEX IF NOT EXISTS chat_sessions_last_activity_idx ON ChatSessions (last_activity);
+
+CREATE TABLE IF NOT EXISTS ChatMessages (
+  id BIGSERIAL PRIMARY KEY,
+  session_id TEXT NOT NULL REFERENCES ChatSessions (session_id) ON DELETE CASCADE,
+  role TEXT NOT NULL,
+  content TEXT NOT NULL,
+  tokens INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS chat_messages_session_idx ON ChatMessages (session_id, id);
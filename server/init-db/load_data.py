@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 """
 Script to load CSV data into PostgreSQL database during Docker initialization
+
+Tables are bulk loaded with COPY (binary COPY for the embedding vectors), and
+the ANN index is built afterwards so its IVF lists are trained on real data.
 """
 
+import csv
+import hashlib
+import io
+import json
+import math
 import os
+import struct
 import sys
+import time
 import psycopg2
 import pandas as pd
-from psycopg2.extras import execute_values
 
 # Database connection from environment variables
 conn_params = {
@@ -18,6 +27,205 @@ conn_params = {
     'port': '5432'
 }
 
+# Columns of the services CSV, in file order
+CSV_COLUMNS = [
+    'organisation_name', 'campus_name', 'service_name', 'region_name', 'email', 'phone',
+    'website', 'notes', 'expected_wait_time', 'opening_hours_24_7', 'opening_hours_standard',
+    'opening_hours_extended', 'op_hours_extended_details', 'address', 'suburb', 'state',
+    'postcode', 'cost', 'delivery_method', 'level_of_care', 'referral_pathway', 'service_type',
+    'target_population', 'workforce_type',
+]
+
+# Target columns for row_to_record tuples (the table spells workforce_type as work_force_type)
+RAW_DATA_COLUMNS = CSV_COLUMNS[:-1] + ['work_force_type', 'content_hash']
+
+def read_services_csv(path):
+    """Read the services CSV as a list of row dicts of strings, with None for empty cells"""
+    df = pd.read_csv(path, dtype=str).astype(object)
+    # Convert to plain dicts: iterrows() would turn None back into NaN
+    return df.where(df.notna(), None).to_dict('records')
+
+def record_hash(row):
+    """SHA-256 of a service record's CSV values, used to detect new and changed records"""
+    canonical = json.dumps([row.get(col) for col in CSV_COLUMNS], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def record_text(row):
+    """
+    The text a service record is chunked and embedded from. DataEmbedding.py
+    and sync_index.py both use it, so a record gets the same chunks and
+    vectors whichever path loaded it.
+    """
+    return json.dumps({col: row.get(col) for col in CSV_COLUMNS}, ensure_ascii=False)
+
+def row_to_record(row):
+    """Convert a CSV row into a MentalHealthRawData tuple ordered as RAW_DATA_COLUMNS"""
+    return (
+        row.get('organisation_name'),
+        row.get('campus_name'),
+        row.get('service_name'),
+        row.get('region_name'),
+        row.get('email'),
+        row.get('phone'),
+        row.get('website'),
+        row.get('notes'),
+        row.get('expected_wait_time'),
+        True if row.get('opening_hours_24_7') == "Yes" else False,
+        True if row.get('opening_hours_standard') == "Yes" else False,
+        True if row.get('opening_hours_extended') == "Yes" else False,
+        row.get('op_hours_extended_details'),
+        row.get('address'),
+        row.get('suburb'),
+        row.get('state'),
+        row.get('postcode'),
+        row.get('cost'),
+        row.get('delivery_method'),
+        row.get('level_of_care'),
+        row.get('referral_pathway'),
+        row.get('service_type'),
+        row.get('target_population'),
+        row.get('workforce_type'),
+        record_hash(row),
+    )
+
+# Memory for the post-load index build; larger values make CREATE INDEX faster
+INDEX_BUILD_MAINTENANCE_WORK_MEM = os.getenv('INDEX_BUILD_MAINTENANCE_WORK_MEM', '256MB')
+
+# Vector index build parameters: ANN_INDEX_TYPE is ivfflat or hnsw.
+# IVFFLAT_LISTS of 0 picks the list count from the row count.
+ANN_INDEX_TYPE = os.getenv('ANN_INDEX_TYPE', 'ivfflat')
+IVFFLAT_LISTS = int(os.getenv('IVFFLAT_LISTS', '0'))
+HNSW_M = int(os.getenv('HNSW_M', '16'))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '64'))
+
+# Schema added after the first release: the full-text column and the indexes
+# behind hybrid retrieval's structured filters, and the Postgres session store's
+# tables with their summary and token columns. New databases get them from
+# 02-create-tables.sql; this brings existing ones up to date. ALTER TABLE locks
+# (and for the generated column rewrites) the table, so it runs here rather
+# than in the API.
+SCHEMA_UPGRADES = """
+    ALTER TABLE MentalHealthRawData ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english',
+            coalesce(service_name, '') || ' ' || coalesce(organisation_name, '') || ' ' ||
+            coalesce(campus_name, '') || ' ' || coalesce(service_type, '') || ' ' ||
+            coalesce(level_of_care, '') || ' ' || coalesce(target_population, '') || ' ' ||
+            coalesce(notes, '') || ' ' || coalesce(suburb, ''))) STORED;
+    CREATE INDEX IF NOT EXISTS raw_data_search_idx ON MentalHealthRawData USING GIN (search_tsv);
+    CREATE INDEX IF NOT EXISTS raw_data_suburb_idx ON MentalHealthRawData (lower(suburb));
+    CREATE INDEX IF NOT EXISTS raw_data_postcode_idx ON MentalHealthRawData (postcode);
+    CREATE INDEX IF NOT EXISTS raw_data_24_7_idx ON MentalHealthRawData (id) WHERE opening_hours_24_7;
+
+    CREATE TABLE IF NOT EXISTS ChatSessions (
+        session_id TEXT PRIMARY KEY,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        last_activity TIMESTAMPTZ NOT NULL DEFAULT now(),
+        expires_at TIMESTAMPTZ NOT NULL
+    );
+    ALTER TABLE ChatSessions ADD COLUMN IF NOT EXISTS summary TEXT;
+    ALTER TABLE ChatSessions ADD COLUMN IF NOT EXISTS summary_tokens INTEGER;
+    ALTER TABLE ChatSessions ADD COLUMN IF NOT EXISTS summary_seq BIGINT;
+    CREATE INDEX IF NOT EXISTS chat_sessions_expires_at_idx ON ChatSessions (expires_at);
+    CREATE INDEX IF NOT EXISTS chat_sessions_last_activity_idx ON ChatSessions (last_activity);
+    CREATE TABLE IF NOT EXISTS ChatMessages (
+        id BIGSERIAL PRIMARY KEY,
+        session_id TEXT NOT NULL REFERENCES ChatSessions (session_id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    ALTER TABLE ChatMessages ADD COLUMN IF NOT EXISTS tokens INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS chat_messages_session_idx ON ChatMessages (session_id, id);
+"""
+
+def upgrade_schema(conn):
+    """Apply SCHEMA_UPGRADES; every statement is a no-op once applied"""
+    cursor = conn.cursor()
+    cursor.execute(SCHEMA_UPGRADES)
+    cursor.close()
+    conn.commit()
+
+def report_throughput(table, rows, nbytes, elapsed):
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    print(f"Loaded {rows} rows ({nbytes / 1e6:.1f} MB) into {table} in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+def copy_raw_data(cursor, records):
+    """COPY MentalHealthRawData tuples (ordered as RAW_DATA_COLUMNS) through an in-memory CSV buffer"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow(['\\N' if value is None else value for value in record])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY MentalHealthRawData ({', '.join(RAW_DATA_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        buffer
+    )
+    return buffer.tell()
+
+def copy_embeddings(cursor, rows):
+    """
+    COPY (record_index, tokens, embedding) rows in PostgreSQL binary format.
+    A pgvector value is sent as int16 dimensions, int16 unused, then float4 values,
+    so the server does not have to parse text vectors.
+    """
+    buffer = io.BytesIO()
+    buffer.write(b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0))
+    for record_index, tokens, embedding in rows:
+        dim = len(embedding)
+        buffer.write(struct.pack('>hii', 3, 4, record_index))
+        buffer.write(struct.pack('>ii', 4, tokens))
+        buffer.write(struct.pack(f'>ihh{dim}f', 4 + 4 * dim, dim, 0, *embedding))
+    buffer.write(struct.pack('>h', -1))
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY MentalHealthEmbeddings (record_index, tokens, embedding) FROM STDIN WITH (FORMAT binary)",
+        buffer
+    )
+    return buffer.tell()
+
+def ivfflat_lists(row_count):
+    """pgvector guidance: rows / 1000 lists up to 1M rows, sqrt(rows) beyond"""
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+def build_ann_index(conn, index_type=None, lists=None, m=None, ef_construction=None):
+    """
+    (Re)build the vector index now that the table is populated, then refresh planner statistics.
+    Parameters default to the ANN_INDEX_TYPE / IVFFLAT_LISTS / HNSW_* settings.
+    """
+    index_type = index_type or ANN_INDEX_TYPE
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM MentalHealthEmbeddings")
+    row_count = cursor.fetchone()[0]
+
+    if index_type == 'ivfflat':
+        lists = int(lists or IVFFLAT_LISTS or ivfflat_lists(row_count))
+        options = f"lists = {lists}"
+    elif index_type == 'hnsw':
+        options = f"m = {int(m or HNSW_M)}, ef_construction = {int(ef_construction or HNSW_EF_CONSTRUCTION)}"
+    else:
+        raise ValueError(f"Unknown ANN index type: {index_type} (expected ivfflat or hnsw)")
+
+    started = time.perf_counter()
+    cursor.execute(f"SET maintenance_work_mem = '{INDEX_BUILD_MAINTENANCE_WORK_MEM}'")
+    cursor.execute("DROP INDEX IF EXISTS embedding_idx")
+    cursor.execute(
+        f"CREATE INDEX embedding_idx ON MentalHealthEmbeddings USING {index_type} (embedding vector_cosine_ops) WITH ({options})"
+    )
+    cursor.execute("ANALYZE MentalHealthEmbeddings")
+    cursor.execute("ANALYZE MentalHealthRawData")
+    cursor.close()
+    conn.commit()
+    print(f"Built {index_type} index with {options} over {row_count} rows in {time.perf_counter() - started:.2f}s")
+
+def ann_index_exists(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('embedding_idx') IS NOT NULL")
+    exists = cursor.fetchone()[0]
+    cursor.close()
+    return exists
+
 def load_raw_data(conn):
     """Load mental health services raw data"""
     cursor = conn.cursor()
@@ -29,78 +237,46 @@ def load_raw_data(conn):
     if count > 0:
         print(f"MentalHealthRawData table already has {count} records. Skipping data load.")
         cursor.close()
-        return
-    
-    df = pd.read_csv('/data/mental_health_services_nwmphn_dataset.csv')
+        return False
     
-    # Replace NaN values with None for SQL NULL
-    df = df.where(pd.notnull(df), None)
-    
-    data_list = []
-    for index, row in df.iterrows():
-        data_list.append((
-            row.get('organisation_name'),
-            row.get('campus_name'),
-            row.get('service_name'),
-            row.get('region_name'),
-            row.get('email'),
-            row.get('phone'),
-            row.get('website'),
-            row.get('notes'),
-            row.get('expected_wait_time'),
-            True if row.get('opening_hours_24_7') == "Yes" else False,
-            True if row.get('opening_hours_standard') == "Yes" else False,
-            True if row.get('opening_hours_extended') == "Yes" else False,
-            row.get('op_hours_extended_details'),
-            row.get('address'),
-            row.get('suburb'),
-            row.get('state'),
-            row.get('postcode'),
-            row.get('cost'),
-            row.get('delivery_method'),
-            row.get('level_of_care'),
-            row.get('referral_pathway'),
-            row.get('service_type'),
-            row.get('target_population'),
-            row.get('workforce_type')
-        ))
-    
-    execute_values(
-        cursor,
-        """
-        INSERT INTO MentalHealthRawData (
-            organisation_name,
-            campus_name,
-            service_name,
-            region_name,
-            email,
-            phone,
-            website,
-            notes,
-            expected_wait_time,
-            opening_hours_24_7,
-            opening_hours_standard,
-            opening_hours_extended,
-            op_hours_extended_details,
-            address,
-            suburb,
-            state,
-            postcode,
-            cost,
-            delivery_method,
-            level_of_care,
-            referral_pathway,
-            service_type,
-            target_population,
-            work_force_type
-        ) VALUES %s
-        """,
-        data_list
-    )
+    started = time.perf_counter()
+    rows = read_services_csv('/data/mental_health_services_nwmphn_dataset.csv')
+    data_list = [row_to_record(row) for row in rows]
+    nbytes = copy_raw_data(cursor, data_list)
     
     cursor.close()
     conn.commit()
-    print(f"Loaded {len(data_list)} records into MentalHealthRawData table")
+    report_throughput("MentalHealthRawData", len(data_list), nbytes, time.perf_counter() - started)
+    return True
+
+def read_embedding_metadata(path, dimensions):
+    """
+    The model behind the embeddings file, from the .meta.json DataEmbedding.py
+    writes next to it; older files were made with the OpenAI API
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata = json.load(f)
+    else:
+        metadata = {'provider': 'openai', 'model': os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')}
+    metadata['dimensions'] = dimensions
+    return metadata
+
+def record_embedding_metadata(cursor, metadata):
+    """
+    Size the (empty) vector column for the model and record the model in EmbeddingMetadata
+    """
+    cursor.execute(
+        "SELECT atttypmod FROM pg_attribute WHERE attrelid = 'mentalhealthembeddings'::regclass AND attname = 'embedding'"
+    )
+    if cursor.fetchone()[0] != metadata['dimensions']:
+        cursor.execute(f"ALTER TABLE MentalHealthEmbeddings ALTER COLUMN embedding TYPE vector({int(metadata['dimensions'])})")
+    cursor.execute("""
+        INSERT INTO EmbeddingMetadata (provider, model, dimensions) VALUES (%s, %s, %s)
+        ON CONFLICT (id) DO UPDATE SET provider = EXCLUDED.provider, model = EXCLUDED.model,
+            dimensions = EXCLUDED.dimensions, updated_at = CURRENT_TIMESTAMP
+    """, (metadata['provider'], metadata['model'], metadata['dimensions']))
+    print(f"Embeddings were made by {metadata['provider']}/{metadata['model']} ({metadata['dimensions']} dimensions)")
 
 def load_embeddings(conn):
     """Load mental health embeddings data"""
@@ -113,34 +289,39 @@ def load_embeddings(conn):
     if count > 0:
         print(f"MentalHealthEmbeddings table already has {count} records. Skipping data load.")
         cursor.close()
-        return
+        return False
     
-    df = pd.read_csv('/data/mental_health_embedding.csv')
-    
-    data_list = [
-        (row['index'], int(row['token_len']), row['embeddings'])
-        for index, row in df.iterrows()
+    started = time.perf_counter()
+    df = pd.read_csv('/data/mental_health_embedding.csv', usecols=['index', 'token_len', 'embeddings'])
+    rows = [
+        (int(record_index), int(token_len), json.loads(embedding))
+        for record_index, token_len, embedding in zip(df['index'], df['token_len'], df['embeddings'])
     ]
-    
-    execute_values(
-        cursor,
-        "INSERT INTO MentalHealthEmbeddings (record_index, tokens, embedding) VALUES %s",
-        data_list
-    )
+    if rows:
+        record_embedding_metadata(cursor, read_embedding_metadata('/data/mental_health_embedding.meta.json', len(rows[0][2])))
+    nbytes = copy_embeddings(cursor, rows)
     
     cursor.close()
     conn.commit()
-    print(f"Loaded {len(data_list)} embeddings into MentalHealthEmbeddings table")
+    report_throughput("MentalHealthEmbeddings", len(rows), nbytes, time.perf_counter() - started)
+    return True
 
 if __name__ == "__main__":
     try:
         conn = psycopg2.connect(**conn_params)
         
+        print("Upgrading schema...")
+        upgrade_schema(conn)
+        
         print("Loading mental health raw data...")
         load_raw_data(conn)
         
         print("Loading mental health embeddings...")
-        load_embeddings(conn)
+        embeddings_loaded = load_embeddings(conn)
+        
+        if embeddings_loaded or not ann_index_exists(conn):
+            print("Building vector index...")
+            build_ann_index(conn)
         
         print("Database initialization completed successfully!")
     except Exception as e:
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional
+
+import openai
+
+from metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock budget for one /api/chat turn; completions get whatever retrieval left of it (0 disables)
+CHAT_LATENCY_BUDGET_SECONDS = float(os.getenv('CHAT_LATENCY_BUDGET_SECONDS', '60'))
+# Longest a single completion attempt may take, and how often a failed or timed-out one is retried
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '30'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+# Retry n waits a random time up to LLM_RETRY_BASE_SECONDS * 2**n ("full jitter")
+LLM_RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', '0.5'))
+# "off", "hedge" (a second request to the same model) or "fallback" (a second request to LLM_FALLBACK_MODEL),
+# sent when the first has taken longer than the LLM_HEDGE_PERCENTILE of recent completions
+LLM_HEDGE_MODE = os.getenv('LLM_HEDGE_MODE', 'off')
+LLM_HEDGE_MODES = ("off", "hedge", "fallback")
+LLM_FALLBACK_MODEL = os.getenv('LLM_FALLBACK_MODEL', 'gpt-4o-mini')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+# Completions observed before hedging starts, and the shortest wait before a second request
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '1'))
+# Recent completion latencies kept per model for the percentile
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+
+# Errors worth another attempt; anything else (bad request, auth, overload shedding) is raised at once
+RETRYABLE_ERRORS = (
+    TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+    openai.RateLimitError, openai.InternalServerError,
+)
+
+LLM_RETRIES = registry.register(Counter(
+    "llm_retries_total", "Completion attempts retried after a timeout or transient error", ("model",)))
+LLM_HEDGES = registry.register(Counter(
+    "llm_hedged_requests_total", "Second completion requests sent, by mode, trigger and which request answered",
+    ("mode", "trigger", "winner")))
+LLM_BUDGET_EXCEEDED = registry.register(Counter(
+    "llm_budget_exceeded_total", "Completions abandoned because the request's latency budget ran out"))
+
+
+class LatencyBudgetExceeded(Exception):
+    """Raised when a request's latency budget runs out; the API turns it into a 504 response"""
+
+    status_code = 504
+
+
+# Monotonic deadline of the request being served, set by latency_budget()
+_deadline: ContextVar[Optional[float]] = ContextVar("latency_deadline", default=None)
+
+
+@contextmanager
+def latency_budget(seconds: float):
+    """
+    Give the enclosed work `seconds` of wall-clock time. Nested budgets
+    never extend an outer one; a non-positive value adds no limit.
+    """
+    deadline = _deadline.get()
+    if seconds > 0:
+        own = time.monotonic() + seconds
+        deadline = own if deadline is None else min(deadline, own)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current request's budget, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def retry_delay(attempt: int, base: float = LLM_RETRY_BASE_SECONDS) -> float:
+    """Full-jitter backoff, so clients that failed together do not retry together"""
+    return random.uniform(0, base * 2 ** attempt)
+
+
+class LatencyWindow:
+    """The last `size` latencies of one model, for percentile thresholds"""
+
+    def __init__(self, size: int = LLM_LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class CompletionPolicy:
+    """
+    Timeouts, retries and hedging around one logical completion.
+
+    `request(model)` makes a single upstream attempt. Each attempt is cut off
+    after `timeout` seconds or when the request's latency budget runs out,
+    and transient failures are retried with jittered backoff while budget
+    remains. With hedging on, a second request (same model, or the fallback
+    model) is sent once the first has been outstanding longer than the
+    `hedge_percentile` of recent latencies (in fallback mode also as soon as
+    the first fails); the first good answer is returned and the other
+    request is cancelled.
+    """
+
+    def __init__(self, timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 retry_base: float = LLM_RETRY_BASE_SECONDS, hedge_mode: str = LLM_HEDGE_MODE,
+                 fallback_model: str = LLM_FALLBACK_MODEL, hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES, min_hedge_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS,
+                 window: int = LLM_LATENCY_WINDOW):
+        if hedge_mode not in LLM_HEDGE_MODES:
+            raise ValueError(f"Unknown hedge mode: {hedge_mode} (expected one of {LLM_HEDGE_MODES})")
+        if hedge_mode == "fallback" and not fallback_model:
+            raise ValueError("LLM_HEDGE_MODE=fallback needs LLM_FALLBACK_MODEL")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.hedge_mode = hedge_mode
+        self.fallback_model = fallback_model
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self._window = window
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exceeded = 0
+
+    def _latencies(self, model: str) -> LatencyWindow:
+        window = self.latencies.get(model)
+        if window is None:
+            window = self.latencies[model] = LatencyWindow(self._window)
+        return window
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """How long to wait for `model` before a second request; None while not hedging"""
+        if self.hedge_mode == "off":
+            return None
+        window = self._latencies(model)
+        if len(window) < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, window.percentile(self.hedge_percentile))
+
+    async def _attempts(self, model: str, request: Callable[[str], Awaitable],
+                        admission: Callable[[], AsyncContextManager]):
+        attempt = 0
+        while True:
+            remaining = remaining_budget()
+            if remaining is not None and remaining <= 0:
+                raise LatencyBudgetExceeded(f"Latency budget exhausted before calling {model}")
+            started = None
+            try:
+                # Queueing for an upstream slot is not upstream latency: the attempt is timed once admitted
+                async with admission():
+                    remaining = remaining_budget()
+                    if remaining is not None and remaining <= 0:
+                        raise LatencyBudgetExceeded(f"Latency budget exhausted waiting for a slot for {model}")
+                    timeout = self.timeout if remaining is None else min(self.timeout, remaining)
+                    started = time.perf_counter()
+                    async with asyncio.timeout(timeout):
+                        result = await request(model)
+            except asyncio.CancelledError:
+                # A cancelled attempt took at least this long; keeps hedged-away slow requests in the tail
+                if started is not None:
+                    self._latencies(model).record(time.perf_counter() - started)
+                raise
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, TimeoutError) and started is not None:
+                    self.timeouts += 1
+                    self._latencies(model).record(time.perf_counter() - started)
+                delay = retry_delay(attempt, self.retry_base)
+                remaining = remaining_budget()
+                if remaining is not None and remaining <= delay:
+                    raise LatencyBudgetExceeded(f"Latency budget exhausted waiting for {model} ({e!r})") from e
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                LLM_RETRIES.inc(1, model)
+                logger.warning(f"Completion attempt {attempt} with {model} failed ({e!r}); "
+                               f"retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self._latencies(model).record(time.perf_counter() - started)
+            return result
+
+    async def call(self, model: str, request: Callable[[str], Awaitable],
+                   can_hedge: Callable[[], bool] = lambda: True,
+                   admission: Callable[[], AsyncContextManager] = nullcontext):
+        """
+        Result of `request` for `model` under this policy. Each attempt first
+        enters `admission()` (e.g. a concurrency limiter slot), which is
+        neither timed nor counted as upstream latency. `can_hedge` is asked
+        before a second request is sent, so hedging can stand down while
+        upstream capacity is short.
+        """
+        self.calls += 1
+        try:
+            delay = self.hedge_delay(model)
+            if delay is None:
+                return await self._attempts(model, request, admission)
+            return await self._hedged(model, request, delay, can_hedge, admission)
+        except LatencyBudgetExceeded:
+            self.budget_exceeded += 1
+            LLM_BUDGET_EXCEEDED.inc()
+            raise
+
+    async def _hedged(self, model, request, delay, can_hedge, admission):
+        backup_model = self.fallback_model if self.hedge_mode == "fallback" else model
+        primary = asyncio.ensure_future(self._attempts(model, request, admission))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and primary.exception() is None:
+                return primary.result()
+            # After a failure only a different model is worth asking; the same one was already retried
+            if (done and self.hedge_mode != "fallback") or not can_hedge():
+                return await primary
+            trigger = "error" if done else "slow"
+            logger.info(f"Sending {self.hedge_mode} request to {backup_model}: {model} "
+                        f"{'failed' if done else f'exceeded {delay:.2f}s'}")
+            self.hedges += 1
+            backup = asyncio.ensure_future(self._attempts(backup_model, request, admission))
+            tasks.append(backup)
+            while True:
+                for task in tasks:
+                    if task.done() and task.exception() is None:
+                        winner = "primary" if task is primary else "backup"
+                        if winner == "backup":
+                            self.hedge_wins += 1
+                        LLM_HEDGES.inc(1, self.hedge_mode, trigger, winner)
+                        return task.result()
+                pending = [task for task in tasks if not task.done()]
+                if not pending:
+                    LLM_HEDGES.inc(1, self.hedge_mode, trigger, "none")
+                    raise backup.exception()
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cancelling the loser closes its HTTP request, so the upstream stops generating
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        thresholds = {}
+        for model, window in self.latencies.items():
+            p = window.percentile(self.hedge_percentile)
+            thresholds[model] = round(p * 1000, 1) if p is not None else None
+        return {
+            "hedge_mode": self.hedge_mode,
+            "fallback_model": self.fallback_model if self.hedge_mode == "fallback" else None,
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "budget_exceeded": self.budget_exceeded,
+            f"p{self.hedge_percentile:g}_ms": thresholds,
+        }
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Load test for the /api/chat endpoint.
+
+Sends the same number of chat requests at increasing concurrency levels and
+reports throughput for each level. With a non-blocking chat pipeline the
+requests/s figure should grow with the number of in-flight requests instead
+of staying flat.
+
+Usage:
+    python load_test.py --url http://localhost:5001 --requests 32 --concurrency 1 2 4 8 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_MESSAGE = "Are there any free counselling services near Footscray?"
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total_requests: int, message: str):
+    """
+    Run total_requests chats with at most `concurrency` in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one_chat():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/chat", json={"message": message})
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_chat() for _ in range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "completed": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def main(args):
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+        health = await client.get("/health")
+        health.raise_for_status()
+
+        print(f"{'concurrency':>11} {'ok':>5} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'max ms':>9}")
+        for concurrency in args.concurrency:
+            result = await run_level(client, concurrency, args.requests, args.message)
+            print(
+                f"{result['concurrency']:>11} {result['completed']:>5} {result['errors']:>5} "
+                f"{result['requests_per_s']:>8.2f} {result['p50_ms']:>9.0f} {result['max_ms']:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for /api/chat")
+    parser.add_argument("--url", default="http://localhost:5001", help="Base URL of the API")
+    parser.add_argument("--requests", type=int, default=32, help="Requests sent per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--message", default=DEFAULT_MESSAGE)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -1,20 +1,81 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
+import json
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Sequence, Tuple
 import logging
-import uuid
-from datetime import datetime, timedelta
 import asyncio
-from rag_service import process_input_with_retrieval_continuous
-from tasks import cleanup_expired_sessions, SESSION_TTL_HOURS, SESSION_INACTIVITY_MINUTES, MAX_SESSIONS
+from contextlib import asynccontextmanager
+from rag_service import (
+    process_input_with_retrieval_continuous,
+    process_input_with_retrieval_stream,
+    process_inputs_with_retrieval_batch,
+    get_completion_from_messages,
+    service_data_signature,
+    on_service_data_changed,
+    numpy_index,
+    hybrid_retriever,
+    embedding_flight,
+    retrieval_flight,
+    embedding_cache,
+    answer_cache,
+    document_cache,
+    prompt_token_stats,
+    llm_limiter,
+    embedding_limiter,
+    completion_policy,
+    embedding_provider,
+    verify_embedding_model,
+    warm_retrieval,
+    warm_openai,
+    close_openai_client,
+    RETRIEVAL_BACKEND,
+    BATCH_MAX_ITEMS,
+)
+import db
+from tasks import cleanup_expired_sessions, watch_service_data, SESSION_TTL_HOURS, SESSION_INACTIVITY_MINUTES, MAX_SESSIONS
+from vector_index import DATA_RELOAD_CHECK_SECONDS
+from session_store import create_session_store, SESSION_STORE
+from chat_context import ChatMessage, HISTORY_TOKEN_BUDGET, get_encoding, start_loading_encoding
+from summarizer import ConversationSummarizer
+from admission import Overloaded, SessionLocks
+from latency_budget import CHAT_LATENCY_BUDGET_SECONDS, LatencyBudgetExceeded, latency_budget
+from metrics import MetricsMiddleware, SESSIONS, record_component_stats, registry, stage
+from warmup import WarmUp, WARMUP_ENABLED, WARMUP_DB_CONNECTIONS, WARMUP_OPENAI
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Mental Health Chat Bot API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start background tasks, including warm-up, without blocking startup: a
+    slow or unavailable database delays readiness instead of failing boot.
+    On shutdown, stop them and close the OpenAI and database connections.
+    """
+    # Even with warm-up off, the first chat must not wait for the tokenizer download
+    start_loading_encoding()
+    tasks = [
+        asyncio.create_task(cleanup_expired_sessions(session_store)),
+        asyncio.create_task(watch_service_data(service_data_signature, on_service_data_changed, DATA_RELOAD_CHECK_SECONDS)),
+        asyncio.create_task(warmup.run()),
+    ]
+    logger.info("Started session cleanup, service data watch and warm-up tasks")
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await embedding_cache.drain()
+        await close_openai_client()
+        db.close_pool()
+
+app = FastAPI(title="Mental Health Chat Bot API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -25,8 +86,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for chat sessions with cleanup
-chat_sessions: Dict[str, dict] = {}
+# Request latency by route, plus Server-Timing headers when METRICS_TIMING_HEADERS is set
+app.add_middleware(MetricsMiddleware)
+
+# Chat sessions, in memory or in Postgres depending on SESSION_STORE
+session_store = create_session_store(SESSION_STORE)
+# Background rolling summaries of long conversations (SUMMARIES_ENABLED)
+summarizer = ConversationSummarizer(session_store, get_completion_from_messages)
+# One turn at a time per session, so history is read and appended in order
+session_locks = SessionLocks()
+
+# Pre-opened connections and primed caches, so the first chats are not cold; reported by /ready
+warmup = WarmUp()
+if WARMUP_ENABLED:
+    warmup.add("database", lambda: db.get_pool().warm(WARMUP_DB_CONNECTIONS))
+    warmup.add("sessions", session_store.count)
+    # Query vectors from another model would silently retrieve the wrong records
+    warmup.add("embedding_model", verify_embedding_model)
+    warmup.add("retrieval", warm_retrieval)
+    # Records and the tokenizer are otherwise loaded on first use
+    warmup.add("tokenizer", get_encoding, required=False)
+    warmup.add("documents", document_cache.warm, required=False)
+    if embedding_provider.name == "local" or WARMUP_OPENAI:
+        warmup.add("embeddings", embedding_provider.warm, required=False)
+    if WARMUP_OPENAI:
+        warmup.add("openai", warm_openai, required=False)
 
 # Request/Response models
 class ChatRequest(BaseModel):
@@ -38,6 +122,13 @@ class ChatResponse(BaseModel):
     session_id: str
     error: Optional[str] = None
 
+class BatchChatItem(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
+
 class SessionRequest(BaseModel):
     pass
 
@@ -54,27 +145,49 @@ class ChatHistory(BaseModel):
     session_id: str
     messages: List[Message]
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """
+    Shed load with 429 (session busy) or 503 (upstream saturated) and a Retry-After hint
+    """
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(LatencyBudgetExceeded)
+async def latency_budget_handler(request: Request, exc: LatencyBudgetExceeded):
+    """
+    A turn that could not be answered within CHAT_LATENCY_BUDGET_SECONDS
+    """
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)})
+
 @app.get("/")
 def read_root():
     return {"message": "Mental Health Chat Bot API is running"}
 
 @app.get("/health")
 def health_check():
+    """
+    Liveness: the process is up and serving requests, warm or not
+    """
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness: 503 until warm-up has finished, so traffic is only routed to
+    warm instances. Includes the outcome and duration of each warm-up step.
+    """
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
 @app.post("/api/sessions", response_model=SessionResponse)
 async def create_session():
     """
     Create a new chat session
     """
-    session_id = str(uuid.uuid4())
-    timestamp = datetime.now().isoformat()
-    
-    chat_sessions[session_id] = {
-        "created_at": timestamp,
-        "last_activity": timestamp,
-        "messages": []
-    }
+    session_id, timestamp = await session_store.create()
     
     logger.info(f"Created new session: {session_id}")
     return SessionResponse(session_id=session_id, created_at=timestamp)
@@ -84,72 +197,250 @@ async def get_chat_history(session_id: str):
     """
     Get chat history for a session
     """
-    if session_id not in chat_sessions:
+    messages = await session_store.get_messages(session_id)
+    if messages is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
     return ChatHistory(
         session_id=session_id,
-        messages=chat_sessions[session_id]["messages"]
+        messages=[message.to_dict() for message in messages]
     )
 
+async def load_session(session_id: Optional[str]) -> Tuple[str, Sequence[ChatMessage]]:
+    """
+    Return (session_id, messages) for the given session, creating a new
+    session if none is provided
+    """
+    if not session_id:
+        session_id, _ = await session_store.create()
+        logger.info(f"Created new session: {session_id}")
+        return session_id, []
+    messages = await session_store.get_messages(session_id)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session_id, messages
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
     Process user chat message using RAG system with conversation history
     """
     try:
-        # Create new session if none provided
-        if not request.session_id:
-            session_id = str(uuid.uuid4())
-            timestamp = datetime.now().isoformat()
-            chat_sessions[session_id] = {
-                "created_at": timestamp,
-                "last_activity": timestamp,
-                "messages": []
-            }
-            logger.info(f"Created new session: {session_id}")
-        else:
-            session_id = request.session_id
-            if session_id not in chat_sessions:
+        # Later turns of the same session wait here until this one is stored
+        async with session_locks.hold(request.session_id):
+            with stage("session_load"):
+                session_id, conversation_history = await load_session(request.session_id)
+                summary = await summarizer.get_summary(session_id)
+            
+            logger.info(f"Processing chat request for session {session_id}: {request.message[:100]}...")
+            
+            user_message = ChatMessage("user", request.message)
+            
+            # Process the message with RAG and conversation context; the completion gets what
+            # retrieval has left of the latency budget
+            with latency_budget(CHAT_LATENCY_BUDGET_SECONDS):
+                response = await process_input_with_retrieval_continuous(request.message, conversation_history, summary)
+            
+            # Store the user and assistant messages of this turn in one write
+            assistant_message = ChatMessage("assistant", response)
+            with stage("session_append"):
+                stored = await session_store.append_messages(session_id, [user_message, assistant_message])
+            if not stored:
+                # The session expired or was evicted while the turn was being answered
                 raise HTTPException(status_code=404, detail="Session not found")
-        
-        logger.info(f"Processing chat request for session {session_id}: {request.message[:100]}...")
-        
-        # Update last activity time
-        chat_sessions[session_id]["last_activity"] = datetime.now().isoformat()
-        
-        # Get conversation history
-        conversation_history = chat_sessions[session_id]["messages"]
-        
-        # Add user message to history
-        user_message = Message(
-            role="user",
-            content=request.message,
-            timestamp=datetime.now().isoformat()
-        )
-        conversation_history.append(user_message.dict())
-        
-        # Process the message with RAG and conversation context
-        response = process_input_with_retrieval_continuous(
-            request.message, 
-            [{"role": msg["role"], "content": msg["content"]} for msg in conversation_history[:-1]]
-        )
-        
-        # Add assistant response to history
-        assistant_message = Message(
-            role="assistant",
-            content=response,
-            timestamp=datetime.now().isoformat()
-        )
-        conversation_history.append(assistant_message.dict())
+        summarizer.schedule(session_id)
         
         logger.info("Successfully processed chat request")
         return ChatResponse(response=response, session_id=session_id)
     
+    except (HTTPException, Overloaded):
+        raise
+    except LatencyBudgetExceeded as e:
+        logger.warning(f"Chat request exceeded its latency budget: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Stream the assistant response as Server-Sent Events.
+
+    Emits a `session` event with the session id, `data` events carrying
+    {"delta": ...} as tokens arrive, and a final `done` event with the full
+    response. The turn is appended to the session history once the stream
+    completes; if the client disconnects, the upstream generation is
+    cancelled and nothing is stored for the turn. The session's turn is
+    held until the stream ends; a rejection by admission control after the
+    stream has started arrives as an `error` event with `retry_after`.
+    """
+    release_session = await session_locks.acquire(request.session_id) if request.session_id else (lambda: None)
+    try:
+        with stage("session_load"):
+            session_id, conversation_history = await load_session(request.session_id)
+            summary = await summarizer.get_summary(session_id)
+    except BaseException:
+        release_session()
+        raise
+    logger.info(f"Processing streaming chat request for session {session_id}: {request.message[:100]}...")
+
+    user_message = ChatMessage("user", request.message)
+
+    async def event_stream():
+        try:
+            yield sse_event({"session_id": session_id}, event="session")
+            parts = []
+            deltas = process_input_with_retrieval_stream(request.message, conversation_history, summary)
+            try:
+                async for delta in deltas:
+                    if await http_request.is_disconnected():
+                        logger.info(f"Client disconnected from stream for session {session_id}")
+                        return
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+            except asyncio.CancelledError:
+                logger.info(f"Stream cancelled for session {session_id}")
+                raise
+            except Overloaded as e:
+                yield sse_event({"detail": str(e), "status": e.status_code, "retry_after": e.retry_after}, event="error")
+                return
+            except Exception as e:
+                logger.error(f"Error processing streaming chat request: {str(e)}")
+                yield sse_event({"detail": str(e)}, event="error")
+                return
+            finally:
+                # Closing the generator closes the upstream OpenAI stream
+                await deltas.aclose()
+
+            response = "".join(parts)
+            assistant_message = ChatMessage("assistant", response)
+            with stage("session_append"):
+                stored = await session_store.append_messages(session_id, [user_message, assistant_message])
+            if not stored:
+                logger.warning(f"Session {session_id} expired before its streamed turn could be stored")
+                yield sse_event({"detail": "Session not found", "status": 404}, event="error")
+                return
+        finally:
+            release_session()
+        summarizer.schedule(session_id)
+        logger.info("Successfully processed streaming chat request")
+        yield sse_event({"response": response, "session_id": session_id}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Release the session even if the stream never started; release is idempotent
+        background=BackgroundTask(release_session),
+    )
+
+@app.post("/api/chat/batch")
+async def chat_batch_endpoint(request: BatchChatRequest):
+    """
+    Answer many chat turns in one request, e.g. replayed QA conversations.
+
+    An item names an existing session or, without a session_id, starts a
+    new one. Turns of one session run in item order and each session is
+    held for the whole batch. Results stream as Server-Sent Events as turns
+    finish: a `result` event per answered item ({"index", "session_id",
+    "response"}), an `error` event per failed item ({"index", "session_id",
+    "detail", "status"}), then `done` with the counts.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+
+    session_ids = []
+    for item in request.items:
+        session_ids.append(item.session_id or (await session_store.create())[0])
+    distinct_ids = list(dict.fromkeys(session_ids))
+    logger.info(f"Processing chat batch: {len(request.items)} items in {len(distinct_ids)} sessions")
+
+    # Hold every session for the batch, so single turns cannot interleave with it
+    acquired = await asyncio.gather(*(session_locks.acquire(sid) for sid in distinct_ids), return_exceptions=True)
+    releases = [release for release in acquired if callable(release)]
+
+    def release_sessions():
+        for release in releases:
+            release()
+
+    try:
+        rejected, histories, summaries = {}, {}, {}
+        with stage("session_load"):
+            for session_id, lock in zip(distinct_ids, acquired):
+                if isinstance(lock, Overloaded):
+                    rejected[session_id] = (str(lock), lock.status_code)
+                    continue
+                if isinstance(lock, BaseException):
+                    raise lock
+                messages = await session_store.get_messages(session_id)
+                if messages is None:
+                    rejected[session_id] = ("Session not found", 404)
+                    continue
+                histories[session_id] = list(messages)
+                summaries[session_id] = await summarizer.get_summary(session_id)
+    except BaseException:
+        release_sessions()
+        raise
+
+    # Positions in `turns` map back to item indexes
+    indexes = [i for i, session_id in enumerate(session_ids) if session_id not in rejected]
+    turns = [(session_ids[i], request.items[i].message) for i in indexes]
+
+    async def store_turn(position, session_id, user_input, response):
+        with stage("session_append"):
+            stored = await session_store.append_messages(
+                session_id, [ChatMessage("user", user_input), ChatMessage("assistant", response)]
+            )
+        if not stored:
+            raise HTTPException(status_code=404, detail="Session not found")
+        summarizer.schedule(session_id)
+
+    async def event_stream():
+        completed = failed = 0
+        try:
+            for index, session_id in enumerate(session_ids):
+                if session_id in rejected:
+                    detail, status = rejected[session_id]
+                    failed += 1
+                    yield sse_event({"index": index, "session_id": session_id, "detail": detail, "status": status},
+                                    event="error")
+            try:
+                async for position, response, error in process_inputs_with_retrieval_batch(
+                        turns, histories, summaries, on_turn=store_turn):
+                    index = indexes[position]
+                    if error is None:
+                        completed += 1
+                        yield sse_event({"index": index, "session_id": session_ids[index], "response": response},
+                                        event="result")
+                    else:
+                        failed += 1
+                        known = (HTTPException, Overloaded, LatencyBudgetExceeded)
+                        status = error.status_code if isinstance(error, known) else 500
+                        logger.error(f"Error processing batch item {index}: {str(error)}")
+                        yield sse_event({"index": index, "session_id": session_ids[index], "detail": str(error),
+                                         "status": status}, event="error")
+            except Exception as e:
+                # Embedding or retrieval for the whole batch failed
+                logger.error(f"Error processing chat batch: {str(e)}")
+                yield sse_event({"detail": str(e)}, event="error")
+        finally:
+            release_sessions()
+        logger.info(f"Processed chat batch: {completed} answered, {failed} failed")
+        yield sse_event({"completed": completed, "failed": failed, "total": len(session_ids)}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Release the sessions even if the stream never started; releases are idempotent
+        background=BackgroundTask(release_sessions),
+    )
+
 @app.get("/api/test")
 def test_endpoint():
     """
@@ -163,20 +454,92 @@ async def get_session_stats():
     Get statistics about current sessions
     """
     return {
-        "total_sessions": len(chat_sessions),
+        "store": SESSION_STORE,
+        "total_sessions": await session_store.count(),
         "max_sessions": MAX_SESSIONS,
         "ttl_hours": SESSION_TTL_HOURS,
         "inactivity_minutes": SESSION_INACTIVITY_MINUTES
     }
 
+@app.get("/api/db/stats")
+async def get_db_stats():
+    """
+    Get connection pool statistics (size, checkouts and wait times); "open" is
+    false until something has used the database
+    """
+    return db.pool_stats()
 
-@app.on_event("startup")
-async def startup_event():
+@app.get("/api/retrieval/stats")
+async def get_retrieval_stats():
     """
-    Start background tasks on application startup
+    Get the active retrieval backend, embedding provider and in-process vector index statistics
     """
-    asyncio.create_task(cleanup_expired_sessions(chat_sessions))
-    logger.info("Started session cleanup background task")
+    return {
+        "backend": RETRIEVAL_BACKEND,
+        "embeddings": embedding_provider.stats(),
+        "numpy_index": numpy_index.stats(),
+        "hybrid": hybrid_retriever.stats(),
+        "coalescing": retrieval_flight.stats(),
+    }
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Get hit/miss/eviction counters for the query caches
+    """
+    return {
+        "embeddings": embedding_cache.stats(),
+        "embedding_coalescing": embedding_flight.stats(),
+        "answers": answer_cache.stats(),
+        "documents": document_cache.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics: per-stage latency histograms, token usage, session
+    store size and the counters of the caches, limiters and indexes
+    """
+    SESSIONS.set(await session_store.count())
+    for component, stats in (
+        ("embedding_cache", embedding_cache.stats()),
+        ("answer_cache", answer_cache.stats()),
+        ("document_cache", document_cache.stats()),
+        ("embedding_provider", embedding_provider.stats()),
+        ("embedding_coalescing", embedding_flight.stats()),
+        ("retrieval_coalescing", retrieval_flight.stats()),
+        ("llm_limiter", llm_limiter.stats()),
+        ("completion_policy", completion_policy.stats()),
+        ("embedding_limiter", embedding_limiter.stats()),
+        ("session_locks", session_locks.stats()),
+        ("summaries", summarizer.stats()),
+        ("prompt_tokens", prompt_token_stats.stats()),
+    ):
+        record_component_stats(component, stats)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/admission/stats")
+async def get_admission_stats():
+    """
+    Get upstream concurrency limiter, completion retry and hedging, and per-session queue statistics
+    """
+    return {
+        "chat_completions": llm_limiter.stats(),
+        "completion_policy": completion_policy.stats(),
+        "embeddings": embedding_limiter.stats(),
+        "sessions": session_locks.stats(),
+    }
+
+@app.get("/api/context/stats")
+async def get_context_stats():
+    """
+    Get prompt tokens per turn, with and without conversation summaries
+    """
+    return {
+        "history_token_budget": HISTORY_TOKEN_BUDGET,
+        "prompt_tokens": prompt_token_stats.stats(),
+        "summaries": summarizer.stats(),
+    }
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=5001, reload=True)
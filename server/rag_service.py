@@ -1,53 +1,359 @@
-import psycopg2
+import asyncio
+import time
+from collections import defaultdict
 import numpy as np
-from pgvector.psycopg2 import register_vector
-from langchain_openai import OpenAIEmbeddings
 import openai
 import os
 from dotenv import load_dotenv
 
 load_dotenv() 
-openai_client = openai.OpenAI()
-
-conn = psycopg2.connect(
-    host = os.getenv('POSTGRES_HOST', 'postgres'),       
-    database = os.getenv('POSTGRES_DB', 'mental_health_db'),
-    user = os.getenv('POSTGRES_USER', 'mental_health_user'),
-    password = os.getenv('POSTGRES_PASSWORD', 'password'),
-    port = os.getenv('POSTGRES_PORT', '5432'), 
+import db
+from vector_index import VectorIndex, table_signature
+from embedding_cache import EmbeddingCache, normalize_text
+from embeddings import EMBEDDING_PROVIDER, check_embedding_model, create_embedding_provider, stored_embedding_model
+from answer_cache import SemanticAnswerCache, ANSWER_CACHE_ENABLED
+from chat_context import MESSAGE_OVERHEAD_TOKENS, ChatMessage, PromptTokenStats, count_tokens, history_tokens, select_history_records, unsummarized
+from document_cache import DocumentRenderCache
+from hybrid_search import HybridRetriever
+from single_flight import SingleFlight
+from metrics import record_stage, record_usage, stage
+from latency_budget import CompletionPolicy
+from admission import (
+    ConcurrencyLimiter, ADMISSION_WAIT_TIMEOUT_SECONDS,
+    LLM_MAX_CONCURRENCY, LLM_MAX_WAITING, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_WAITING,
 )
 
-def get_top3_similar_docs(query_embedding, conn):
+# Long-lived client, created on first use; its HTTP connection pool is reused across
+# chat, completion and embedding calls
+_openai_client = None
+
+def get_openai_client():
+    """
+    Return the shared OpenAI client. Created lazily so importing this module
+    needs neither an API key nor network access.
+    """
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.AsyncOpenAI()
+    return _openai_client
+
+async def close_openai_client():
+    global _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+# Model answering chat turns
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-4o')
+# Query embeddings come from the same provider and model as the stored vectors (EMBEDDING_PROVIDER)
+embedding_provider = create_embedding_provider(EMBEDDING_PROVIDER, get_openai_client)
+embedding_cache = EmbeddingCache()
+# Reused answers for first-turn questions; only consulted when ANSWER_CACHE_ENABLED is set
+answer_cache = SemanticAnswerCache()
+# Bounds on concurrent upstream OpenAI calls; excess requests queue briefly, then are rejected
+llm_limiter = ConcurrencyLimiter("chat completions", LLM_MAX_CONCURRENCY, LLM_MAX_WAITING,
+                                 ADMISSION_WAIT_TIMEOUT_SECONDS)
+embedding_limiter = ConcurrencyLimiter("embeddings", EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_WAITING,
+                                       ADMISSION_WAIT_TIMEOUT_SECONDS)
+# Timeouts, jittered retries and optional hedging or fallback for non-streaming completions
+completion_policy = CompletionPolicy()
+# Concurrent identical embedding and retrieval requests share one upstream call
+embedding_flight = SingleFlight("embeddings")
+retrieval_flight = SingleFlight("retrieval")
+# Compact renderings of retrieved service records, keyed by record id
+document_cache = DocumentRenderCache()
+# Prompt tokens per turn, with and without conversation summaries
+prompt_token_stats = PromptTokenStats()
+
+# Number of distinct service records returned per query
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '3'))
+# Chunks fetched per requested record; long records are stored as several chunks
+RETRIEVAL_CANDIDATE_MULTIPLIER = int(os.getenv('RETRIEVAL_CANDIDATE_MULTIPLIER', '4'))
+# Cap on the candidate window, which is doubled while it holds fewer than k distinct records
+RETRIEVAL_MAX_CANDIDATES = int(os.getenv('RETRIEVAL_MAX_CANDIDATES', '1000'))
+
+# Batch chat: items per request, completions in flight at once for one batch, and texts per embedding request
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_EMBED_MAX_INPUTS = int(os.getenv('BATCH_EMBED_MAX_INPUTS', '256'))
+
+# "pgvector" queries Postgres per request, "numpy" searches an in-process copy of the embeddings,
+# "hybrid" adds structured filters from the query and full-text matches to the pgvector search
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'pgvector')
+RETRIEVAL_BACKENDS = ("pgvector", "numpy", "hybrid")
+
+# Search-time ANN knobs, applied to every pooled connection: more probes / a larger
+# ef_search raise recall at the cost of latency. Unset keeps the pgvector defaults.
+ANN_IVFFLAT_PROBES = os.getenv('ANN_IVFFLAT_PROBES')
+ANN_HNSW_EF_SEARCH = os.getenv('ANN_HNSW_EF_SEARCH')
+if ANN_IVFFLAT_PROBES:
+    db.register_session_setting("ivfflat.probes", int(ANN_IVFFLAT_PROBES))
+if ANN_HNSW_EF_SEARCH:
+    db.register_session_setting("hnsw.ef_search", int(ANN_HNSW_EF_SEARCH))
+
+# Columns of MentalHealthRawData passed to the model
+DOC_COLUMNS = (
+    "organisation_name", "campus_name", "service_name", "region_name",
+    "email", "phone", "website", "notes", "expected_wait_time",
+    "opening_hours_24_7", "opening_hours_standard", "opening_hours_extended",
+    "op_hours_extended_details", "address", "suburb", "state", "postcode",
+    "cost", "delivery_method", "level_of_care", "referral_pathway",
+    "service_type", "target_population", "work_force_type",
+)
+
+# Nearest chunks via the ANN index, collapsed to the best chunk per record,
+# joined to the raw record in one round trip and kept in similarity order.
+# candidate_count is how many chunks the window held, so the caller can tell
+# a full window (widen it) from a table with fewer than k records.
+# $1 = query vector, $2 = k, $3 = number of candidate chunks
+db.register_prepared_statement("top_k_similar_docs", f"""
+    PREPARE top_k_similar_docs (vector, integer, integer) AS
+    SELECT r.id, {", ".join("r." + col for col in DOC_COLUMNS)}, 1 - best.distance AS score,
+        best.candidate_count
+    FROM (
+        SELECT record_index, MIN(distance) AS distance, SUM(COUNT(*)) OVER () AS candidate_count
+        FROM (
+            SELECT record_index, embedding <=> $1 AS distance
+            FROM MentalHealthEmbeddings
+            ORDER BY embedding <=> $1
+            LIMIT $3
+        ) candidates
+        GROUP BY record_index
+        ORDER BY distance
+        LIMIT $2
+    ) best
+    JOIN MentalHealthRawData r ON r.id = best.record_index
+    ORDER BY best.distance
+""")
+
+def get_top_k_similar_docs(query_embedding, conn, k=RETRIEVAL_TOP_K, max_candidates=None):
+    """
+    Return up to k distinct service records most similar to the query, best first.
+    Each record holds the DOC_COLUMNS plus its id and cosine similarity score.
+
+    The k * RETRIEVAL_CANDIDATE_MULTIPLIER nearest chunks are collapsed to
+    records. When a few long records fill that window with their chunks, it
+    is doubled (up to max_candidates) until it yields k records. Fewer than k
+    come back only when the table, or what the ANN index finds, holds fewer.
+    """
+    max_candidates = max(k, max_candidates or RETRIEVAL_MAX_CANDIDATES)
+    candidates = min(k * RETRIEVAL_CANDIDATE_MULTIPLIER, max_candidates)
     embedding_array = np.array(query_embedding)
-    register_vector(conn)
-    cur = conn.cursor()
-    cur.execute("SELECT record_index FROM MentalHealthEmbeddings ORDER BY embedding <=> %s LIMIT 3", (embedding_array,))
-    top3_indexes = cur.fetchall()
-    top3_indexes_flat = tuple(idx[0] for idx in top3_indexes)
-    cur.execute("SELECT * FROM MentalHealthRawData WHERE id in %s", (top3_indexes_flat, ))
-    top_3_docs = cur.fetchall()
-    colnames = [desc[0] for desc in cur.description]
-    record = [dict(zip(colnames, doc)) for doc in top_3_docs]
-    return record
-
-def get_completion_from_messages(messages, model="gpt-4o", temperature=0, max_tokens=1000):
-    response = openai_client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature, 
-        max_tokens=max_tokens, 
-    )
-    return response.choices[0].message.content
+    with conn.cursor() as cur:
+        while True:
+            cur.execute("EXECUTE top_k_similar_docs (%s, %s, %s)", (embedding_array, k, candidates))
+            rows = cur.fetchall()
+            colnames = [desc[0] for desc in cur.description]
+            records = [dict(zip(colnames, row)) for row in rows]
+            window_full = bool(records) and records[0]["candidate_count"] >= candidates
+            if len(records) >= k or not window_full or candidates >= max_candidates:
+                break
+            candidates = min(candidates * 2, max_candidates)
+    for record in records:
+        del record["candidate_count"]
+    return records
 
-def get_embeddings_vector(text): 
-  embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-  response = embedding_model.embed_query(text)
-  return response
+numpy_index = VectorIndex(DOC_COLUMNS)
+hybrid_retriever = HybridRetriever(DOC_COLUMNS)
+
+def retrieve_similar_docs(query_embedding, k=RETRIEVAL_TOP_K, backend=None, query_text=None):
+    """
+    Up to k distinct service records for the query, best first. Fewer than k
+    only when the backend has fewer matching records (see get_top_k_similar_docs
+    for how pgvector widens its candidate window).
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "numpy":
+        return numpy_index.search(query_embedding, k)
+    if backend == "hybrid":
+        return hybrid_retriever.search(query_embedding, query_text or "", k)
+    if backend == "pgvector":
+        # Vector type registration, statement preparation and reconnects are handled by the pool
+        return db.get_pool().run(lambda conn: get_top_k_similar_docs(query_embedding, conn, k))
+    raise ValueError(f"Unknown retrieval backend: {backend} (expected one of {RETRIEVAL_BACKENDS})")
+
+def retrieve_similar_docs_bulk(query_embeddings, query_texts, k=RETRIEVAL_TOP_K, backend=None):
+    """
+    retrieve_similar_docs for many queries at once: one matrix product for the
+    in-process index, one pooled connection for the database backends
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "numpy":
+        return numpy_index.search_many(query_embeddings, k)
+    if backend == "hybrid":
+        return hybrid_retriever.search_many(query_embeddings, query_texts, k)
+    if backend == "pgvector":
+        return db.get_pool().run(
+            lambda conn: [get_top_k_similar_docs(embedding, conn, k) for embedding in query_embeddings]
+        )
+    raise ValueError(f"Unknown retrieval backend: {backend} (expected one of {RETRIEVAL_BACKENDS})")
+
+def warm_retrieval():
+    """
+    Run one retrieval with a stored embedding, so the first chat does not pay
+    for loading the in-process index, loading the hybrid suburb vocabulary, planning
+    the prepared statement or reading cold index pages
+    """
+    def sample(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT embedding FROM MentalHealthEmbeddings LIMIT 1")
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    if RETRIEVAL_BACKEND == "numpy":
+        numpy_index.reload_if_changed()
+    embedding = db.get_pool().run(sample)
+    if embedding is not None:
+        retrieve_similar_docs(embedding, RETRIEVAL_TOP_K, query_text="counselling")
+
+async def warm_openai():
+    """
+    Open the HTTPS connection to the API (DNS, TLS) and check the API key
+    with a model lookup, which is not billed
+    """
+    await get_openai_client().models.retrieve(CHAT_MODEL)
+
+def verify_embedding_model():
+    """
+    Raise EmbeddingModelMismatch if the stored vectors were made by a
+    different model than the one embedding queries
+    """
+    stored = db.get_pool().run(stored_embedding_model)
+    check_embedding_model(stored, embedding_provider)
+    return stored
+
+def service_data_signature():
+    return db.get_pool().run(table_signature)
+
+def on_service_data_changed():
+    """
+    Refresh everything derived from the service tables after they change
+    """
+    answer_cache.clear()
+    document_cache.warm()
+    hybrid_retriever.reset()
+    if RETRIEVAL_BACKEND == "numpy":
+        numpy_index.reload_if_changed()
 
-def process_input_with_retrieval_continuous(user_input, conversation_history=[]):
+def format_related_docs(related_docs):
+    """
+    Render the retrieved records compactly within DOC_TOKEN_BUDGET; returns (text, tokens)
+    """
+    return document_cache.render(related_docs)
+
+async def get_completion_from_messages(messages, model=CHAT_MODEL, temperature=0, max_tokens=1000):
+    """
+    One completion under completion_policy: each attempt takes an llm_limiter
+    slot, then is bounded by LLM_TIMEOUT_SECONDS and the caller's latency
+    budget, and a slow or failed request may be hedged or sent to the
+    fallback model.
+    """
+    async def request(model):
+        # Retries are completion_policy's, so they can respect the latency budget
+        response = await get_openai_client().with_options(max_retries=0).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature, 
+            max_tokens=max_tokens, 
+        )
+        record_usage(model, response.usage)
+        return response.choices[0].message.content
+
+    # No second requests while others are already queueing for an upstream slot
+    return await completion_policy.call(model, request, can_hedge=lambda: llm_limiter.waiting == 0,
+                                        admission=llm_limiter.slot)
+
+async def stream_completion_from_messages(messages, model=CHAT_MODEL, temperature=0, max_tokens=1000):
+    # The slot is held until the stream ends, since the upstream request is open that long
+    async with llm_limiter.slot():
+        stream = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature, 
+            max_tokens=max_tokens, 
+            stream=True,
+            # The final chunk then carries the token usage of the whole response
+            stream_options={"include_usage": True},
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage:
+                    record_usage(model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closes the HTTP response, so a cancelled consumer stops the generation upstream
+            await stream.close()
+
+async def get_embeddings_vector(text): 
+  model, dimensions = embedding_provider.model, embedding_provider.requested_dimensions
+  with stage("embed"):
+    cached = await embedding_cache.get_async(text, model, dimensions)
+    if cached is not None:
+      return cached
+
+    async def fetch():
+      async with embedding_limiter.slot():
+        embedding = await embedding_provider.embed_one(text)
+      embedding_cache.put(text, model, embedding, dimensions)
+      return embedding
+
+    # Same key as the embedding cache, so a burst of identical questions makes one API call
+    return await embedding_flight.do((model, dimensions, normalize_text(text)), fetch)
+
+async def get_embeddings_vectors(texts):
+    """
+    Embeddings for many texts, in input order. Cached texts are reused and
+    the rest are embedded in batched calls of up to BATCH_EMBED_MAX_INPUTS.
+    """
+    model, dimensions = embedding_provider.model, embedding_provider.requested_dimensions
+    with stage("embed"):
+        vectors = await embedding_cache.get_many_async(texts, model, dimensions)
+        # One embedding per distinct normalized text
+        missing = {}
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                missing.setdefault(normalize_text(text), text)
+        pending = list(missing.values())
+        fetched = {}
+        for start in range(0, len(pending), BATCH_EMBED_MAX_INPUTS):
+            batch = pending[start:start + BATCH_EMBED_MAX_INPUTS]
+            async with embedding_limiter.slot():
+                embedded = await embedding_provider.embed(batch)
+            for text, vector in zip(batch, embedded):
+                embedding_cache.put(text, model, vector, dimensions)
+                fetched[normalize_text(text)] = vector
+        return [vector if vector is not None else fetched[normalize_text(text)] for text, vector in zip(texts, vectors)]
+
+async def retrieve_similar_docs_coalesced(query_embedding, query_text, k=RETRIEVAL_TOP_K):
+    """
+    retrieve_similar_docs on a worker thread, shared by concurrent callers with the same query
+    """
+    backend = RETRIEVAL_BACKEND
+    # Hybrid results also depend on the query text; vector-only results only on the embedding
+    key = (backend, k, np.asarray(query_embedding, dtype=np.float32).tobytes(),
+           query_text if backend == "hybrid" else None)
+    # Retrieval is blocking (psycopg2 or a NumPy scan), so run it on a worker thread to keep the event loop free
+    return await retrieval_flight.do(
+        key, lambda: asyncio.to_thread(retrieve_similar_docs, query_embedding, k, backend, query_text)
+    )
+
+async def build_messages_with_retrieval(user_input, conversation_history=[], query_embedding=None, summary=None,
+                                        related_docs=None):
+    """
+    Embed the input, retrieve related services and assemble the chat messages.
+    With a conversation summary, the prompt carries the summary plus the
+    messages it does not cover yet. Batch callers pass related_docs they
+    retrieved in bulk.
+    """
     delimiter = "```"
 
-    related_docs = get_top3_similar_docs(get_embeddings_vector(user_input), conn)
+    if related_docs is None:
+        if query_embedding is None:
+            query_embedding = await get_embeddings_vector(user_input)
+        with stage("retrieve"):
+            related_docs = await retrieve_similar_docs_coalesced(query_embedding, user_input)
+    build_started = time.perf_counter()
 
     system_message = f"""
     You are a friendly chatbot. \
@@ -60,15 +366,134 @@ def process_input_with_retrieval_continuous(user_input, conversation_history=[])
     # Build message history for context
     messages = [{"role": "system", "content": system_message}]
     
-    # Add conversation history (limit to last 10 messages to manage token usage)
-    recent_history = conversation_history[-10:] if len(conversation_history) > 10 else conversation_history
-    messages.extend(recent_history)
+    # Add the summary of older turns, then as much recent history as fits in HISTORY_TOKEN_BUDGET
+    if summary is not None:
+        messages.append(summary.to_prompt())
+    pending = list(unsummarized(conversation_history, summary))
+    history = select_history_records(pending)
+    messages.extend(message.to_prompt() for message in history)
     
     # Add current user input and retrieved documents
+    docs_header = "Relevant mental health services information: \n "
+    docs_text, docs_tokens = format_related_docs(related_docs)
+    user_message = {"role": "user", "content": f"{delimiter}{user_input}{delimiter}"}
     messages.extend([
-        {"role": "user", "content": f"{delimiter}{user_input}{delimiter}"},
-        {"role": "assistant", "content": f"Relevant mental health services information: \n {related_docs[0]} \n {related_docs[1]} {related_docs[2]}"}   
+        user_message,
+        {"role": "assistant", "content": f"{docs_header}{docs_text}"}
     ])
 
-    final_response = get_completion_from_messages(messages)
-    return final_response
\ No newline at end of file
+    # History and document token counts are cached, so only this turn's input is tokenized
+    base_tokens = (history_tokens([messages[0], user_message]) + count_tokens(docs_header)
+                   + docs_tokens + MESSAGE_OVERHEAD_TOKENS)
+    prompt_tokens = base_tokens + history_tokens(history)
+    if summary is not None:
+        prompt_tokens += summary.tokens + MESSAGE_OVERHEAD_TOKENS
+    prompt_token_stats.record(prompt_tokens, base_tokens + history_tokens(conversation_history), summary is not None)
+    record_stage("prompt_build", time.perf_counter() - build_started)
+    return messages
+
+def use_answer_cache(conversation_history):
+    # Cached answers are only valid for opening questions with no prior context
+    return ANSWER_CACHE_ENABLED and not conversation_history
+
+async def process_input_with_retrieval_continuous(user_input, conversation_history=[], summary=None,
+                                                  query_embedding=None, related_docs=None):
+    started = time.perf_counter()
+    cache_answer = use_answer_cache(conversation_history)
+    if cache_answer:
+        if query_embedding is None:
+            query_embedding = await get_embeddings_vector(user_input)
+        cached = answer_cache.get(query_embedding)
+        if cached is not None:
+            return cached
+
+    messages = await build_messages_with_retrieval(user_input, conversation_history, query_embedding, summary,
+                                                   related_docs)
+    with stage("completion"):
+        final_response = await get_completion_from_messages(messages)
+
+    if cache_answer:
+        answer_cache.put(query_embedding, final_response, time.perf_counter() - started)
+    return final_response
+
+async def process_inputs_with_retrieval_batch(items, conversation_histories=None, summaries=None,
+                                              concurrency=BATCH_CONCURRENCY, on_turn=None):
+    """
+    Answer many (session_key, user_input) turns, e.g. replayed conversations.
+
+    Every input is embedded in batched calls and retrieved in bulk up front;
+    completions then run with at most `concurrency` in flight. Turns of one
+    session run strictly in order, each seeing the earlier ones in its
+    history (conversation_histories[session_key], extended in place), and
+    on_turn(position, session_key, user_input, response) is awaited before
+    the session's next turn. Yields (position, response, error) in the
+    order turns finish; a failed turn does not stop its session.
+    """
+    histories = conversation_histories if conversation_histories is not None else {}
+    summaries = summaries or {}
+    texts = [user_input for _, user_input in items]
+    if not texts:
+        return
+    embeddings = await get_embeddings_vectors(texts)
+    with stage("retrieve"):
+        related_docs = await asyncio.to_thread(retrieve_similar_docs_bulk, embeddings, texts)
+
+    positions_by_session = defaultdict(list)
+    for position, (session_key, _) in enumerate(items):
+        positions_by_session[session_key].append(position)
+    semaphore = asyncio.Semaphore(concurrency)
+    finished = asyncio.Queue()
+
+    async def run_session(session_key, positions):
+        history = histories.setdefault(session_key, [])
+        for position in positions:
+            user_input = texts[position]
+            try:
+                async with semaphore:
+                    response = await process_input_with_retrieval_continuous(
+                        user_input, history, summaries.get(session_key), embeddings[position], related_docs[position]
+                    )
+                history.extend([ChatMessage("user", user_input), ChatMessage("assistant", response)])
+                if on_turn is not None:
+                    await on_turn(position, session_key, user_input, response)
+            except Exception as e:
+                finished.put_nowait((position, None, e))
+            else:
+                finished.put_nowait((position, response, None))
+
+    tasks = [asyncio.create_task(run_session(key, positions)) for key, positions in positions_by_session.items()]
+    try:
+        for _ in range(len(texts)):
+            yield await finished.get()
+    finally:
+        # Stops outstanding turns if the consumer goes away early
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def process_input_with_retrieval_stream(user_input, conversation_history=[], summary=None):
+    """
+    Same as process_input_with_retrieval_continuous, but yields completion
+    deltas as they arrive. Closing the generator cancels the upstream request.
+    """
+    started = time.perf_counter()
+    query_embedding = None
+    if use_answer_cache(conversation_history):
+        query_embedding = await get_embeddings_vector(user_input)
+        cached = answer_cache.get(query_embedding)
+        if cached is not None:
+            yield cached
+            return
+
+    messages = await build_messages_with_retrieval(user_input, conversation_history, query_embedding, summary)
+    parts = []
+    completion_started = time.perf_counter()
+    async for delta in stream_completion_from_messages(messages):
+        if not parts:
+            record_stage("first_token", time.perf_counter() - completion_started)
+        parts.append(delta)
+        yield delta
+    record_stage("completion", time.perf_counter() - completion_started)
+
+    if query_embedding is not None:
+        answer_cache.put(query_embedding, "".join(parts), time.perf_counter() - started)
@@ -0,0 +1,389 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Deque, List, Optional, Sequence, Tuple
+
+import db
+from chat_context import ChatMessage, ConversationSummary, SESSION_MAX_MESSAGES
+from tasks import SESSION_TTL_HOURS, SESSION_INACTIVITY_MINUTES, MAX_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps sessions in this process; "postgres" shares them across workers and replicas
+SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+
+
+class SessionStore(ABC):
+    """
+    Storage for chat sessions and their message history.
+
+    Messages are ChatMessage records carrying their token counts, and only
+    the last SESSION_MAX_MESSAGES of a session are kept. A chat turn writes
+    its user and assistant messages together with append_messages, so each
+    turn costs one write.
+    """
+
+    @abstractmethod
+    async def create(self) -> Tuple[str, str]:
+        """Create a session and return (session_id, created_at)"""
+
+    @abstractmethod
+    async def get_messages(self, session_id: str) -> Optional[Sequence[ChatMessage]]:
+        """Return the session's messages in order, or None if the session does not exist"""
+
+    @abstractmethod
+    async def append_messages(self, session_id: str, messages: List[ChatMessage]) -> bool:
+        """Append messages and mark the session active; returns False if the session does not exist"""
+
+    @abstractmethod
+    async def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        """Return the session's running summary, or None if it has none yet"""
+
+    @abstractmethod
+    async def set_summary(self, session_id: str, summary: ConversationSummary) -> bool:
+        """Store a summary unless the session is gone or already has a newer one"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Return the number of live sessions"""
+
+    @abstractmethod
+    async def cleanup_expired(self) -> int:
+        """Remove expired sessions and enforce MAX_SESSIONS; returns the number removed"""
+
+    async def close(self):
+        pass
+
+
+class _Session:
+    __slots__ = ("created", "last_activity", "created_at", "messages", "message_count", "summary")
+
+    def __init__(self, now: float, created_at: str, max_messages: int):
+        self.created = now
+        self.last_activity = now
+        self.created_at = created_at
+        # Ring buffer: the oldest messages drop off once the session is full
+        self.messages: Deque[ChatMessage] = deque(maxlen=max_messages)
+        self.message_count = 0
+        self.summary: Optional[ConversationSummary] = None
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Process-local store; sessions are lost on restart and not shared between workers.
+
+    Expiry is enforced incrementally with monotonic timestamps. Sessions are
+    kept in an OrderedDict in least-recently-active order (O(1) touch via
+    move_to_end), so inactivity expiry and MAX_SESSIONS eviction only ever
+    look at the front. With a fixed TTL, creation deadlines are also
+    increasing, so a FIFO queue of (created, session_id) acts as the deadline
+    min-heap. Eviction runs on every insert and lookup, keeping memory bounded
+    even between periodic cleanups.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_HOURS * 3600,
+                 inactivity_seconds: float = SESSION_INACTIVITY_MINUTES * 60,
+                 max_sessions: int = MAX_SESSIONS, max_messages: int = SESSION_MAX_MESSAGES,
+                 clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.inactivity_seconds = inactivity_seconds
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._clock = clock
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._creation_order: Deque[Tuple[float, str]] = deque()
+        self.expired = 0
+        self.evicted = 0
+
+    def _expired(self, session: _Session, now: float) -> bool:
+        return (now - session.created >= self.ttl_seconds
+                or now - session.last_activity >= self.inactivity_seconds)
+
+    def _remove(self, session_id: str, reason: str):
+        del self.sessions[session_id]
+        logger.info(f"Removed session {session_id} ({reason})")
+
+    def _evict(self, now: float) -> int:
+        removed = 0
+        # TTL: oldest creations first; entries for already removed sessions are skipped
+        while self._creation_order and now - self._creation_order[0][0] >= self.ttl_seconds:
+            created, session_id = self._creation_order.popleft()
+            session = self.sessions.get(session_id)
+            if session is not None and session.created == created:
+                self._remove(session_id, "expired")
+                self.expired += 1
+                removed += 1
+
+        # Inactivity: least recently active first
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_activity < self.inactivity_seconds:
+                break
+            self._remove(session_id, "inactive")
+            self.expired += 1
+            removed += 1
+
+        # Capacity: drop least recently active sessions beyond the cap
+        while len(self.sessions) > self.max_sessions:
+            session_id = next(iter(self.sessions))
+            self._remove(session_id, "capacity")
+            self.evicted += 1
+            removed += 1
+
+        # Keep the deadline queue proportional to the live sessions
+        if len(self._creation_order) > 2 * max(len(self.sessions), self.max_sessions):
+            self._creation_order = deque(sorted(
+                (session.created, session_id) for session_id, session in self.sessions.items()
+            ))
+        return removed
+
+    def _get(self, session_id: str, now: float) -> Optional[_Session]:
+        self._evict(now)
+        session = self.sessions.get(session_id)
+        if session is not None and self._expired(session, now):
+            self._remove(session_id, "expired")
+            self.expired += 1
+            return None
+        return session
+
+    async def create(self):
+        session_id = str(uuid.uuid4())
+        timestamp = datetime.now().isoformat()
+        now = self._clock()
+        self.sessions[session_id] = _Session(now, timestamp, self.max_messages)
+        self._creation_order.append((now, session_id))
+        self._evict(now)
+        return session_id, timestamp
+
+    async def get_messages(self, session_id):
+        session = self._get(session_id, self._clock())
+        if session is None:
+            return None
+        return list(session.messages)
+
+    async def append_messages(self, session_id, messages):
+        now = self._clock()
+        session = self._get(session_id, now)
+        if session is None:
+            return False
+        for message in messages:
+            session.message_count += 1
+            message.seq = session.message_count
+            session.messages.append(message)
+        session.last_activity = now
+        self.sessions.move_to_end(session_id)
+        return True
+
+    async def get_summary(self, session_id):
+        session = self._get(session_id, self._clock())
+        return session.summary if session is not None else None
+
+    async def set_summary(self, session_id, summary):
+        session = self._get(session_id, self._clock())
+        if session is None or (session.summary is not None and session.summary.seq >= summary.seq):
+            return False
+        session.summary = summary
+        return True
+
+    async def count(self):
+        return len(self.sessions)
+
+    async def cleanup_expired(self):
+        return self._evict(self._clock())
+
+
+# Columns the store reads and writes. The tables are created by
+# init-db/02-create-tables.sql and upgraded by init-db/load_data.py; the API
+# only checks that they are there, since ALTER TABLE would lock live tables.
+SESSION_COLUMNS = {
+    "chatsessions": {"session_id", "created_at", "last_activity", "expires_at",
+                     "summary", "summary_tokens", "summary_seq"},
+    "chatmessages": {"id", "session_id", "role", "content", "tokens", "created_at"},
+}
+
+
+class PostgresSessionStore(SessionStore):
+    """
+    Sessions in Postgres, shared by every worker and replica.
+
+    Expiry is precomputed into an indexed expires_at column, so cleanup is a
+    single indexed DELETE instead of a scan.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._schema_checked = False
+        self._ttl = timedelta(hours=SESSION_TTL_HOURS)
+        self._inactivity = timedelta(minutes=SESSION_INACTIVITY_MINUTES)
+
+    @property
+    def pool(self):
+        return self._pool or db.get_pool()
+
+    def _run(self, fn):
+        # Read-only, so concurrent first calls may both check harmlessly
+        if not self._schema_checked:
+            self.pool.run(self._check_schema)
+            self._schema_checked = True
+        return self.pool.run(fn)
+
+    def _check_schema(self, conn):
+        """Raise if the session tables are missing or predate a column; read-only"""
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name, column_name FROM information_schema.columns WHERE table_name IN %s",
+                (tuple(SESSION_COLUMNS),),
+            )
+            found = set(cur.fetchall())
+        missing = sorted(
+            f"{table}.{column}" for table, columns in SESSION_COLUMNS.items()
+            for column in columns if (table, column) not in found
+        )
+        if missing:
+            raise RuntimeError(
+                f"Session tables are missing {', '.join(missing)}; run init-db/load_data.py to create or upgrade them"
+            )
+
+    async def create(self):
+        session_id = str(uuid.uuid4())
+
+        def insert(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO ChatSessions (session_id, expires_at)
+                    VALUES (%s, now() + LEAST(%s, %s))
+                    RETURNING created_at
+                    """,
+                    (session_id, self._ttl, self._inactivity),
+                )
+                return cur.fetchone()[0]
+
+        created_at = await asyncio.to_thread(self._run, insert)
+        return session_id, created_at.isoformat()
+
+    async def get_messages(self, session_id):
+        def select(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT 1 FROM ChatSessions WHERE session_id = %s AND expires_at > now()",
+                    (session_id,),
+                )
+                if cur.fetchone() is None:
+                    return None
+                # Newest SESSION_MAX_MESSAGES via the (session_id, id) index, returned oldest first
+                cur.execute(
+                    """
+                    SELECT id, role, content, created_at, tokens FROM ChatMessages
+                    WHERE session_id = %s ORDER BY id DESC LIMIT %s
+                    """,
+                    (session_id, SESSION_MAX_MESSAGES),
+                )
+                return [
+                    ChatMessage(role, content, created_at.timestamp(), tokens, seq=message_id)
+                    for message_id, role, content, created_at, tokens in reversed(cur.fetchall())
+                ]
+
+        return await asyncio.to_thread(self._run, select)
+
+    async def append_messages(self, session_id, messages):
+        def write(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE ChatSessions
+                    SET last_activity = now(),
+                        expires_at = LEAST(created_at + %s, now() + %s)
+                    WHERE session_id = %s AND expires_at > now()
+                    """,
+                    (self._ttl, self._inactivity, session_id),
+                )
+                if cur.rowcount == 0:
+                    return False
+                if messages:
+                    # One multi-row INSERT for the whole turn
+                    values = ", ".join(["(%s, %s, %s, %s, to_timestamp(%s))"] * len(messages))
+                    params = []
+                    for message in messages:
+                        params.extend((session_id, message.role, message.content, message.tokens, message.created))
+                    cur.execute(
+                        f"INSERT INTO ChatMessages (session_id, role, content, tokens, created_at) VALUES {values}",
+                        params,
+                    )
+                return True
+
+        return await asyncio.to_thread(self._run, write)
+
+    async def get_summary(self, session_id):
+        def select(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT summary, summary_seq, summary_tokens FROM ChatSessions
+                    WHERE session_id = %s AND expires_at > now() AND summary IS NOT NULL
+                    """,
+                    (session_id,),
+                )
+                row = cur.fetchone()
+                return ConversationSummary(*row) if row else None
+
+        return await asyncio.to_thread(self._run, select)
+
+    async def set_summary(self, session_id, summary):
+        def write(conn):
+            with conn.cursor() as cur:
+                # Summaries are written off the request path; never replace a newer one
+                cur.execute(
+                    """
+                    UPDATE ChatSessions SET summary = %s, summary_tokens = %s, summary_seq = %s
+                    WHERE session_id = %s AND expires_at > now()
+                      AND (summary_seq IS NULL OR summary_seq < %s)
+                    """,
+                    (summary.text, summary.tokens, summary.seq, session_id, summary.seq),
+                )
+                return cur.rowcount > 0
+
+        return await asyncio.to_thread(self._run, write)
+
+    async def count(self):
+        def select(conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT COUNT(*) FROM ChatSessions WHERE expires_at > now()")
+                return cur.fetchone()[0]
+
+        return await asyncio.to_thread(self._run, select)
+
+    async def cleanup_expired(self):
+        def delete(conn):
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM ChatSessions WHERE expires_at <= now()")
+                removed = cur.rowcount
+                # Over capacity: drop the least recently active sessions beyond MAX_SESSIONS
+                cur.execute(
+                    """
+                    DELETE FROM ChatSessions WHERE session_id IN (
+                        SELECT session_id FROM ChatSessions
+                        ORDER BY last_activity DESC
+                        OFFSET %s
+                    )
+                    """,
+                    (MAX_SESSIONS,),
+                )
+                if cur.rowcount:
+                    logger.warning(f"Removed {cur.rowcount} oldest sessions to maintain limit of {MAX_SESSIONS}")
+                return removed + cur.rowcount
+
+        return await asyncio.to_thread(self._run, delete)
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "memory":
+        return InMemorySessionStore()
+    if kind == "postgres":
+        return PostgresSessionStore()
+    raise ValueError(f"Unknown session store: {kind} (expected memory or postgres)")
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Set
+
+from chat_context import ConversationSummary, history_tokens, unsummarized
+
+logger = logging.getLogger(__name__)
+
+# Fold older turns into a running summary in the background (off by default)
+SUMMARIES_ENABLED = os.getenv('SUMMARIES_ENABLED', 'false').lower() == 'true'
+# Summarize once the messages not yet covered by the summary exceed this many tokens
+SUMMARY_TRIGGER_TOKENS = int(os.getenv('SUMMARY_TRIGGER_TOKENS', '1500'))
+# Most recent messages always left out of the summary and sent verbatim
+SUMMARY_KEEP_RECENT_MESSAGES = int(os.getenv('SUMMARY_KEEP_RECENT_MESSAGES', '4'))
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', '300'))
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-4o-mini')
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and a mental health services chatbot. \
+Update the existing summary with the new messages. Keep the user's situation, location, needs and \
+preferences, and the services already suggested. Be concise and factual; do not add advice.
+"""
+
+
+def build_summary_messages(previous: Optional[ConversationSummary], messages) -> list:
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in messages)
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Existing summary:\n{previous.text if previous else '(none)'}\n\n"
+                                    f"New messages:\n{transcript}"},
+    ]
+
+
+class ConversationSummarizer:
+    """
+    Keeps a running summary per session, updated in background tasks after
+    a turn has been answered, so summarization never adds request latency.
+
+    Each run folds the oldest messages not yet covered into the previous
+    summary with one completion call, leaving the newest
+    SUMMARY_KEEP_RECENT_MESSAGES to be sent verbatim. At most one run per
+    session is in flight; a turn that finishes while one is running is
+    picked up by the next turn's run.
+    """
+
+    def __init__(self, session_store, complete, enabled: bool = SUMMARIES_ENABLED,
+                 trigger_tokens: int = SUMMARY_TRIGGER_TOKENS, keep_recent: int = SUMMARY_KEEP_RECENT_MESSAGES,
+                 model: str = SUMMARY_MODEL, max_tokens: int = SUMMARY_MAX_TOKENS):
+        self.session_store = session_store
+        self.complete = complete
+        self.enabled = enabled
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.model = model
+        self.max_tokens = max_tokens
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.runs = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    async def get_summary(self, session_id: str) -> Optional[ConversationSummary]:
+        if not self.enabled:
+            return None
+        return await self.session_store.get_summary(session_id)
+
+    def schedule(self, session_id: str):
+        """Start a background summary update for the session if one is due"""
+        if not self.enabled or session_id in self._running:
+            return
+        self._running.add(session_id)
+        task = asyncio.create_task(self._run(session_id))
+        # Keep a reference so the task is not garbage collected while running
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, session_id: str):
+        try:
+            await self.update(session_id)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Error summarizing session {session_id}: {str(e)}")
+        finally:
+            self._running.discard(session_id)
+
+    async def update(self, session_id: str) -> bool:
+        """Fold older messages into the summary if enough have accumulated; returns True if updated"""
+        messages = await self.session_store.get_messages(session_id)
+        if not messages:
+            return False
+        previous = await self.session_store.get_summary(session_id)
+        pending = unsummarized(messages, previous)
+        if len(pending) <= self.keep_recent or history_tokens(pending) < self.trigger_tokens:
+            return False
+
+        to_fold = pending[:len(pending) - self.keep_recent]
+        started = time.perf_counter()
+        text = await self.complete(build_summary_messages(previous, to_fold), model=self.model,
+                                   max_tokens=self.max_tokens)
+        self.seconds += time.perf_counter() - started
+        self.runs += 1
+        summary = ConversationSummary(text, to_fold[-1].seq)
+        stored = await self.session_store.set_summary(session_id, summary)
+        if stored:
+            logger.info(f"Summarized {len(to_fold)} messages of session {session_id} into {summary.tokens} tokens")
+        return stored
+
+    async def drain(self):
+        """Wait for in-flight summary updates"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "runs": self.runs,
+            "failures": self.failures,
+            "in_flight": len(self._running),
+            "avg_seconds": round(self.seconds / self.runs, 3) if self.runs else 0.0,
+        }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Incrementally sync the services CSV into MentalHealthRawData and MentalHealthEmbeddings.
+
+Every record is identified by the SHA-256 of its CSV values (content_hash).
+Only records whose hash is not yet in the database are chunked and embedded;
+records whose hash is no longer in the CSV are deleted together with their
+chunks. A changed record therefore shows up as one removal plus one addition.
+All database writes happen in a single transaction, so the API keeps serving
+the previous data until the sync commits.
+
+Rows loaded before content hashes existed have a NULL hash and are replaced
+on the first sync.
+
+Usage:
+    python sync_index.py [--csv mental_health_services_nwmphn_dataset.csv] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init-db'))
+
+import db
+from DataEmbedding import EMBED_CONCURRENCY, embed_batch, make_batches, split_record
+from embeddings import (
+    EMBEDDING_PROVIDER, check_embedding_model, create_embedding_provider, record_embedding_model, stored_embedding_model,
+)
+from load_data import RAW_DATA_COLUMNS, read_services_csv, record_hash, record_text, row_to_record
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mental_health_services_nwmphn_dataset.csv')
+
+ENSURE_HASH_COLUMN = """
+    ALTER TABLE MentalHealthRawData ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+    CREATE UNIQUE INDEX IF NOT EXISTS mentalhealthrawdata_content_hash_key ON MentalHealthRawData (content_hash);
+"""
+
+
+def diff_records(rows, existing):
+    """
+    Compare CSV rows against {id: content_hash} from the database.
+    Returns (new rows keyed by hash, ids of removed records, unchanged count).
+    """
+    csv_rows = {}
+    for row in rows:
+        csv_rows.setdefault(record_hash(row), row)
+    existing_hashes = {h for h in existing.values() if h is not None}
+    new_rows = {h: row for h, row in csv_rows.items() if h not in existing_hashes}
+    removed_ids = [record_id for record_id, h in existing.items() if h is None or h not in csv_rows]
+    return new_rows, removed_ids, len(csv_rows) - len(new_rows)
+
+
+async def embed_new_records(new_rows, provider, concurrency=EMBED_CONCURRENCY):
+    """
+    Chunk and embed new records; returns (content_hash, token_len, embedding) per chunk
+    """
+    chunks = []
+    for content_hash, row in new_rows.items():
+        for _, token_len, text in split_record(content_hash, record_text(row)):
+            chunks.append((len(chunks), content_hash, token_len, text))
+    if not chunks:
+        return []
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_batch(batch):
+        async with semaphore:
+            embeddings = await embed_batch(provider, [chunk[3] for chunk in batch])
+            return [(chunk[1], chunk[2], embedding) for chunk, embedding in zip(batch, embeddings)]
+
+    results = await asyncio.gather(*(run_batch(batch) for batch in make_batches(chunks)))
+    return [item for batch in results for item in batch]
+
+
+def apply_changes(conn, new_rows, removed_ids, embedded_chunks, provider=None):
+    """
+    Delete removed records and insert new ones with their chunks, in the caller's transaction
+    """
+    if provider is not None:
+        record_embedding_model(conn, provider)
+    with conn.cursor() as cur:
+        if removed_ids:
+            cur.execute("DELETE FROM MentalHealthEmbeddings WHERE record_index = ANY(%s)", (removed_ids,))
+            cur.execute("DELETE FROM MentalHealthRawData WHERE id = ANY(%s)", (removed_ids,))
+
+        if not new_rows:
+            return 0
+        inserted = execute_values(
+            cur,
+            f"""
+            INSERT INTO MentalHealthRawData ({', '.join(RAW_DATA_COLUMNS)}) VALUES %s
+            ON CONFLICT (content_hash) DO NOTHING
+            RETURNING id, content_hash
+            """,
+            [row_to_record(row) for row in new_rows.values()],
+            fetch=True,
+        )
+        ids_by_hash = {content_hash.strip(): record_id for record_id, content_hash in inserted}
+        embedding_rows = [
+            (ids_by_hash[content_hash], token_len, np.asarray(embedding, dtype=np.float32))
+            for content_hash, token_len, embedding in embedded_chunks
+            if content_hash in ids_by_hash
+        ]
+        if embedding_rows:
+            execute_values(
+                cur,
+                "INSERT INTO MentalHealthEmbeddings (record_index, tokens, embedding) VALUES %s",
+                embedding_rows,
+            )
+        return len(embedding_rows)
+
+
+def sync(csv_path=DEFAULT_CSV, dry_run=False, concurrency=EMBED_CONCURRENCY):
+    started = time.perf_counter()
+    pool = db.get_pool()
+    rows = read_services_csv(csv_path)
+    provider = create_embedding_provider(EMBEDDING_PROVIDER)
+    # New vectors must be comparable with the stored ones
+    check_embedding_model(pool.run(stored_embedding_model), provider)
+
+    def load_existing(conn):
+        with conn.cursor() as cur:
+            cur.execute(ENSURE_HASH_COLUMN)
+            cur.execute("SELECT id, content_hash FROM MentalHealthRawData")
+            return {record_id: content_hash.strip() if content_hash else None
+                    for record_id, content_hash in cur.fetchall()}
+
+    existing = pool.run(load_existing)
+    new_rows, removed_ids, unchanged = diff_records(rows, existing)
+    print(f"{unchanged} unchanged, {len(new_rows)} new or changed, {len(removed_ids)} removed or changed")
+    if dry_run or (not new_rows and not removed_ids):
+        return
+
+    # Embed before opening the write transaction so no locks are held during API calls
+    embedded_chunks = asyncio.run(embed_new_records(new_rows, provider, concurrency))
+    with pool.connection() as conn:
+        chunk_count = apply_changes(conn, new_rows, removed_ids, embedded_chunks, provider)
+
+    print(f"Synced in {time.perf_counter() - started:.1f}s: inserted {len(new_rows)} records "
+          f"({chunk_count} chunks), deleted {len(removed_ids)} records")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync the services CSV into the database")
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would change")
+    parser.add_argument('--concurrency', type=int, default=EMBED_CONCURRENCY)
+    args = parser.parse_args()
+    sync(args.csv, args.dry_run, args.concurrency)
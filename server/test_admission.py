@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control: upstream limits, wait deadlines and per-session ordering
+"""
+import asyncio
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from admission import ConcurrencyLimiter, Overloaded, SessionLocks
+
+
+async def check_limit_and_queue():
+    limiter = ConcurrencyLimiter("test", limit=2, max_waiting=2, wait_timeout=1)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.slot():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    # 2 run, 2 queue, the 5th is rejected immediately
+    results = await asyncio.gather(*(call() for _ in range(5)), return_exceptions=True)
+    rejected = [r for r in results if isinstance(r, Overloaded)]
+    assert peak == 2
+    assert len(rejected) == 1 and rejected[0].status_code == 503 and rejected[0].retry_after >= 1
+    stats = limiter.stats()
+    assert stats["admitted"] == 4 and stats["rejected_queue_full"] == 1
+    assert stats["active"] == 0 and stats["waiting"] == 0
+    print("✓ Concurrency limited with a bounded wait queue")
+
+
+async def check_wait_deadline():
+    limiter = ConcurrencyLimiter("test", limit=1, max_waiting=10, wait_timeout=0.02)
+    holder = asyncio.ensure_future(limiter.acquire())
+    await holder
+    try:
+        await limiter.acquire()
+        assert False, "Should have timed out"
+    except Overloaded as e:
+        assert "deadline" in str(e)
+    assert limiter.stats()["rejected_timeout"] == 1 and limiter.waiting == 0
+
+    # A slot released to a waiter is never lost
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    limiter.release()
+    await waiter
+    assert limiter.active == 1
+    limiter.release()
+    assert limiter.active == 0
+    print("✓ Queued callers rejected at their deadline")
+
+
+async def check_session_turns_in_order():
+    locks = SessionLocks(max_queued=2, wait_timeout=1)
+    order = []
+
+    async def turn(n, delay):
+        await asyncio.sleep(delay)
+        async with locks.hold("s1"):
+            order.append(f"start {n}")
+            await asyncio.sleep(0.01)
+            order.append(f"end {n}")
+
+    await asyncio.gather(turn(1, 0), turn(2, 0.001), turn(3, 0.002))
+    assert order == ["start 1", "end 1", "start 2", "end 2", "start 3", "end 3"]
+    assert locks.stats()["busy_sessions"] == 0, "Idle sessions hold no lock"
+
+    # Beyond max_queued, a turn is rejected with 429
+    release = await locks.acquire("s2")
+    waiters = [asyncio.ensure_future(locks.acquire("s2")) for _ in range(2)]
+    await asyncio.sleep(0)
+    try:
+        await locks.acquire("s2")
+        assert False, "Should have been rejected"
+    except Overloaded as e:
+        assert e.status_code == 429
+    release()
+    release()  # idempotent
+    for waiter in waiters:
+        (await waiter)()
+    assert locks.stats() == {"busy_sessions": 0, "queued_turns": 0, "rejected": 1}
+
+    async with locks.hold(None):
+        pass
+    print("✓ Turns of a session processed one at a time, in order")
+
+
+def test_limit_and_queue():
+    asyncio.run(check_limit_and_queue())
+
+
+def test_wait_deadline():
+    asyncio.run(check_wait_deadline())
+
+
+def test_session_turns_in_order():
+    asyncio.run(check_session_turns_in_order())
+
+
+if __name__ == "__main__":
+    print("Admission Control Test Script")
+    print("=" * 40)
+    test_limit_and_queue()
+    test_wait_deadline()
+    test_session_turns_in_order()
+    print("\n✅ All tests passed!")
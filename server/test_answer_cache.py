@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test script for the semantic answer cache
+"""
+import sys
+import os
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_reuses_answer_for_similar_query():
+    cache = SemanticAnswerCache(max_entries=4, ttl_seconds=60, threshold=0.95)
+    cache.put([1.0, 0.0, 0.0], "Call Lifeline on 13 11 14", cost_seconds=2.5)
+    assert cache.get([0.99, 0.05, 0.0]) == "Call Lifeline on 13 11 14"
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["saved_seconds"] == pytest.approx(2.5)
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_entries=2, ttl_seconds=60, threshold=0.99)
+    cache.put([1.0, 0.0, 0.0], "a")
+    cache.put([0.0, 1.0, 0.0], "b")
+    cache.get([1.0, 0.0, 0.0])
+    cache.put([0.0, 0.0, 1.0], "c")
+    assert cache.get([0.0, 1.0, 0.0]) is None
+    assert cache.get([1.0, 0.0, 0.0]) == "a"
+    assert cache.get([0.0, 0.0, 1.0]) == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_and_invalidation():
+    cache = SemanticAnswerCache(max_entries=2, ttl_seconds=0.01, threshold=0.9)
+    cache.put([1.0, 0.0], "a")
+    time.sleep(0.02)
+    assert cache.get([1.0, 0.0]) is None
+    assert cache.stats()["expirations"] == 1
+
+    cache.ttl_seconds = 60
+    cache.put([1.0, 0.0], "a")
+    cache.clear()
+    assert cache.get([1.0, 0.0]) is None
+    assert cache.stats()["size"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for batch chat processing
+"""
+import asyncio
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rag_service
+from embeddings import EmbeddingProvider
+
+
+class FakeProvider(EmbeddingProvider):
+    name = "fake"
+    model = "fake-model"
+    dimensions = 2
+
+    def __init__(self):
+        self.calls = []
+
+    async def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[1.0, float(len(text))] for text in texts]
+
+
+def setup(monkeypatch, completion):
+    provider = FakeProvider()
+    monkeypatch.setattr(rag_service, "embedding_provider", provider)
+    monkeypatch.setattr(rag_service, "embedding_cache", rag_service.EmbeddingCache())
+    monkeypatch.setattr(rag_service, "RETRIEVAL_BACKEND", "numpy")
+    monkeypatch.setattr(rag_service, "get_completion_from_messages", completion)
+    index = rag_service.VectorIndex(["service_name"])
+    index.load_records({1: {"id": 1, "service_name": "Headspace"}}, [(1, [1.0, 0.0])])
+    monkeypatch.setattr(rag_service, "numpy_index", index)
+    return provider
+
+
+async def check_batch_embeds_once_and_orders_sessions(monkeypatch):
+    in_flight = max_in_flight = 0
+
+    async def completion(messages):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        # Earlier turns of the session appear in its history
+        history = [m["content"] for m in messages if m["role"] == "user"]
+        return f"answer {len(history)}"
+
+    provider = setup(monkeypatch, completion)
+    items = [("a", "first"), ("b", "hello"), ("a", "second"), ("c", "hello"), ("a", "third")]
+    histories, stored = {"b": []}, []
+
+    async def on_turn(position, session_key, user_input, response):
+        stored.append((session_key, user_input))
+
+    results = {}
+    async for position, response, error in rag_service.process_inputs_with_retrieval_batch(
+            items, histories, concurrency=2, on_turn=on_turn):
+        assert error is None
+        results[position] = response
+
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    # One embedding call, one text per distinct message
+    assert provider.calls == [["first", "hello", "second", "third"]]
+    assert [results[i] for i in (0, 2, 4)] == ["answer 1", "answer 2", "answer 3"]
+    assert [user_input for key, user_input in stored if key == "a"] == ["first", "second", "third"]
+    assert [message.content for message in histories["a"]][::2] == ["first", "second", "third"]
+    assert max_in_flight == 2
+    print("✓ Batch embeds once, bounds concurrency and keeps session turns in order")
+
+
+async def check_failed_turn_does_not_stop_session(monkeypatch):
+    async def completion(messages):
+        if any("boom" in m["content"] for m in messages if m["role"] == "user"):
+            raise RuntimeError("upstream error")
+        return "ok"
+
+    setup(monkeypatch, completion)
+    items = [("a", "boom"), ("a", "after")]
+    results = [result async for result in rag_service.process_inputs_with_retrieval_batch(items)]
+    assert results[0][0] == 0 and isinstance(results[0][2], RuntimeError)
+    assert results[1] == (1, "ok", None)
+    print("✓ A failed turn is reported and its session continues")
+
+
+def test_batch_embeds_once_and_orders_sessions(monkeypatch):
+    asyncio.run(check_batch_embeds_once_and_orders_sessions(monkeypatch))
+
+
+def test_failed_turn_does_not_stop_session(monkeypatch):
+    asyncio.run(check_failed_turn_does_not_stop_session(monkeypatch))
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script for token-budgeted history selection and bounded session history
+"""
+import asyncio
+import time
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chat_context
+import rag_service
+from chat_context import ChatMessage, MESSAGE_OVERHEAD_TOKENS, count_tokens, select_history
+from session_store import InMemorySessionStore
+
+
+def make_history(count, tokens):
+    return [ChatMessage("user" if i % 2 == 0 else "assistant", f"message {i}", tokens=tokens)
+            for i in range(count)]
+
+
+def test_select_history_fits_budget():
+    history = make_history(20, 96)
+    per_message = 96 + MESSAGE_OVERHEAD_TOKENS
+
+    selected = select_history(history, budget=per_message * 3 + 50)
+    assert [m["content"] for m in selected] == ["message 17", "message 18", "message 19"]
+    assert selected[0] == {"role": "assistant", "content": "message 17"}
+
+    assert select_history(history, budget=per_message - 1) == []
+    assert len(select_history(history, budget=per_message * 100)) == 20
+    print("✓ Newest messages selected within the token budget, oldest first")
+
+
+def test_select_history_skips_long_message():
+    history = make_history(6, 20)
+    history[4] = ChatMessage("assistant", "a very long answer", tokens=5000)
+    # The long answer does not fit, but the messages before it still do
+    selected = select_history(history, budget=(20 + MESSAGE_OVERHEAD_TOKENS) * 5)
+    assert [m["content"] for m in selected] == ["message 0", "message 1", "message 2", "message 3", "message 5"]
+    print("✓ A message over the remaining budget is skipped, not the rest of the history")
+
+
+def test_select_history_accepts_dicts():
+    history = [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "hi there"}]
+    assert select_history(history, budget=1000) == history
+    print("✓ Plain message dicts are accepted")
+
+
+def test_token_count_cached_on_message():
+    message = ChatMessage("user", "How do I find a counsellor near Sunbury?")
+    assert message.tokens > 0
+    assert ChatMessage("user", "", tokens=7).tokens == 7
+    assert set(message.to_dict()) == {"role", "content", "timestamp"}
+    print("✓ Token counts are computed once per message")
+
+
+class SlowEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+async def check_tokenizer_loads_off_the_loop():
+    started = time.perf_counter()
+    # On the event loop the count is estimated while the tokenizer loads on a thread
+    assert count_tokens("one two three four") == len("one two three four") // 4 + 1
+    assert time.perf_counter() - started < 0.1
+    await asyncio.to_thread(chat_context._encoding_loader.join)
+    assert count_tokens("one two three four") == 4
+
+
+def test_tokenizer_loads_off_the_loop():
+    def slow_get_encoding(name):
+        time.sleep(0.3)  # as when the BPE file is downloaded
+        return SlowEncoding()
+
+    saved = (chat_context._encoding, chat_context._encoding_failed, chat_context._encoding_loader,
+             chat_context.tiktoken.get_encoding)
+    chat_context._encoding, chat_context._encoding_failed, chat_context._encoding_loader = None, False, None
+    chat_context.tiktoken.get_encoding = slow_get_encoding
+    try:
+        asyncio.run(check_tokenizer_loads_off_the_loop())
+    finally:
+        (chat_context._encoding, chat_context._encoding_failed, chat_context._encoding_loader,
+         chat_context.tiktoken.get_encoding) = saved
+    print("✓ The tokenizer is loaded on a worker thread, never on the event loop")
+
+
+async def prompt_tokens_for(history):
+    saved = rag_service.prompt_token_stats
+    rag_service.prompt_token_stats = chat_context.PromptTokenStats()
+    try:
+        messages = await rag_service.build_messages_with_retrieval("Any GPs nearby?", history, related_docs=[])
+        return messages, rag_service.prompt_token_stats.stats()["max_prompt_tokens"]
+    finally:
+        rag_service.prompt_token_stats = saved
+
+
+async def check_prompt_tokens_count_selected_history():
+    history = make_history(4, 100)
+    history[2] = ChatMessage("assistant", "a very long answer", tokens=chat_context.HISTORY_TOKEN_BUDGET * 2)
+    messages, prompt_tokens = await prompt_tokens_for(history)
+    # The long answer is skipped but the messages on either side of it are sent
+    assert [m["content"] for m in messages[1:4]] == ["message 0", "message 1", "message 3"]
+    _, without_long_answer = await prompt_tokens_for([history[0], history[1], history[3]])
+    assert prompt_tokens == without_long_answer
+    print("✓ Prompt tokens count the history messages actually sent")
+
+
+def test_prompt_tokens_count_selected_history():
+    asyncio.run(check_prompt_tokens_count_selected_history())
+
+
+async def check_session_history_bounded():
+    store = InMemorySessionStore(max_messages=6)
+    session_id, _ = await store.create()
+    for turn in range(10):
+        await store.append_messages(session_id, [ChatMessage("user", f"q{turn}"), ChatMessage("assistant", f"a{turn}")])
+    messages = await store.get_messages(session_id)
+    assert [m.content for m in messages] == ["q7", "a7", "q8", "a8", "q9", "a9"]
+    print("✓ Session history keeps only the newest messages")
+
+
+def test_session_history_bounded():
+    asyncio.run(check_session_history_bounded())
+
+
+if __name__ == "__main__":
+    print("Chat Context Test Script")
+    print("=" * 40)
+    test_select_history_fits_budget()
+    test_select_history_skips_long_message()
+    test_select_history_accepts_dicts()
+    test_token_count_cached_on_message()
+    test_tokenizer_loads_off_the_loop()
+    test_prompt_tokens_count_selected_history()
+    test_session_history_bounded()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script for the streaming chat endpoint: SSE framing, disconnects and cancellation
+"""
+import asyncio
+import json
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+
+class FakeUpstream:
+    """Stands in for process_input_with_retrieval_stream and records whether it was closed early"""
+
+    def __init__(self, deltas, pause=0.0):
+        self.deltas = deltas
+        self.pause = pause
+        self.sent = 0
+        self.closed = False
+        self.finished = False
+
+    async def __call__(self, message, history, summary):
+        try:
+            for delta in self.deltas:
+                await asyncio.sleep(self.pause)
+                self.sent += 1
+                yield delta
+            self.finished = True
+        finally:
+            self.closed = not self.finished
+
+
+class FakeRequest:
+    """Reports the client as gone once `after` deltas have been produced"""
+
+    def __init__(self, upstream, after):
+        self.upstream = upstream
+        self.after = after
+
+    async def is_disconnected(self):
+        return self.upstream.sent > self.after
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+async def session_is_free(session_id):
+    release = await asyncio.wait_for(main.session_locks.acquire(session_id), timeout=1)
+    release()
+    return True
+
+
+def test_event_framing(monkeypatch):
+    upstream = FakeUpstream(["Hel", "lo"])
+    monkeypatch.setattr(main, "process_input_with_retrieval_stream", upstream)
+    session_id, _ = asyncio.run(main.session_store.create())
+
+    response = TestClient(main.app).post("/api/chat/stream", json={"message": "Hi", "session_id": session_id})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert parse_events(response.text) == [
+        ("session", {"session_id": session_id}),
+        ("message", {"delta": "Hel"}),
+        ("message", {"delta": "lo"}),
+        ("done", {"response": "Hello", "session_id": session_id}),
+    ]
+    messages = asyncio.run(main.session_store.get_messages(session_id))
+    assert [(m.role, m.content) for m in messages] == [("user", "Hi"), ("assistant", "Hello")]
+
+
+async def check_disconnect_closes_upstream_and_discards_turn(monkeypatch):
+    upstream = FakeUpstream(["one", " two", " three", " four"])
+    monkeypatch.setattr(main, "process_input_with_retrieval_stream", upstream)
+    session_id, _ = await main.session_store.create()
+
+    response = await main.chat_stream_endpoint(main.ChatRequest(message="Hi", session_id=session_id),
+                                               FakeRequest(upstream, after=1))
+    events = parse_events("".join([chunk async for chunk in response.body_iterator]))
+    assert events == [("session", {"session_id": session_id}), ("message", {"delta": "one"})]
+    # The upstream generation stopped early, and the partial answer was not stored
+    assert upstream.closed and upstream.sent == 2
+    assert await main.session_store.get_messages(session_id) == []
+    assert await session_is_free(session_id)
+
+
+async def check_cancelled_stream_closes_upstream(monkeypatch):
+    upstream = FakeUpstream(["one", " two", " three"], pause=0.1)
+    monkeypatch.setattr(main, "process_input_with_retrieval_stream", upstream)
+    session_id, _ = await main.session_store.create()
+
+    response = await main.chat_stream_endpoint(main.ChatRequest(message="Hi", session_id=session_id),
+                                               FakeRequest(upstream, after=99))
+    received = []
+
+    async def consume():
+        async for chunk in response.body_iterator:
+            received.append(chunk)
+
+    # The server cancels the response task when the connection drops mid-stream
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.15)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert upstream.closed and not upstream.finished
+    assert len(parse_events("".join(received))) == 2
+    assert await main.session_store.get_messages(session_id) == []
+    assert await session_is_free(session_id)
+
+
+def test_disconnect_closes_upstream_and_discards_turn(monkeypatch):
+    asyncio.run(check_disconnect_closes_upstream_and_discards_turn(monkeypatch))
+
+
+def test_cancelled_stream_closes_upstream(monkeypatch):
+    asyncio.run(check_cancelled_stream_closes_upstream(monkeypatch))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for batched, resumable dataset embedding
+"""
+import asyncio
+import csv
+import json
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import DataEmbedding
+from DataEmbedding import OUTPUT_COLUMNS, completed_chunk_ids, embed_dataset, make_batches
+
+
+def chunks(*token_lens):
+    return [(chunk_id, chunk_id + 1, token_len, f"text {chunk_id}") for chunk_id, token_len in enumerate(token_lens)]
+
+
+def batch_ids(batches):
+    return [[chunk[0] for chunk in batch] for batch in batches]
+
+
+def write_output(path, rows, tail=""):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        writer.writerows(rows)
+        f.write(tail)
+
+
+class FakeProvider:
+    name = "fake"
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def describe(self):
+        return {"provider": self.name, "model": self.model}
+
+    async def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def test_batches_split_at_token_limit():
+    # 40 + 50 fits in 100; adding 30 would not
+    assert batch_ids(make_batches(chunks(40, 50, 30, 70), max_tokens=100, max_inputs=10)) == [[0, 1], [2, 3]]
+    # Exactly at the limit stays in one batch
+    assert batch_ids(make_batches(chunks(60, 40, 1), max_tokens=100, max_inputs=10)) == [[0, 1], [2]]
+    # A chunk bigger than the limit still goes out, on its own
+    assert batch_ids(make_batches(chunks(10, 150, 10), max_tokens=100, max_inputs=10)) == [[0], [1], [2]]
+
+
+def test_batches_split_at_input_limit():
+    assert batch_ids(make_batches(chunks(*[1] * 5), max_tokens=100, max_inputs=2)) == [[0, 1], [2, 3], [4]]
+    assert list(make_batches([], max_tokens=100, max_inputs=2)) == []
+
+
+def test_completed_chunk_ids(tmp_path):
+    path = str(tmp_path / "embeddings.csv")
+    assert completed_chunk_ids(path) == set()
+
+    # A crash mid-write leaves a partial last row, which is dropped from the file
+    write_output(path, [[0, 1, 5, "[0.1]"], [2, 1, 7, "[0.2]"]], tail="3,2,9,[0.")
+    assert completed_chunk_ids(path) == {0, 2}
+    with open(path, newline="") as f:
+        assert f.read().endswith("2,1,7,[0.2]\r\n")
+
+    # Files in the old format cannot be resumed
+    with open(path, "w") as f:
+        f.write("index,token_len,embeddings\n1,5,[0.1]\n")
+    with pytest.raises(ValueError):
+        completed_chunk_ids(path)
+
+
+def test_resume_skips_embedded_chunks(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.csv")
+    split = [[1, 4, "first"], [1, 3, "second"], [2, 5, "third"]]
+    monkeypatch.setattr(DataEmbedding, "load_records", lambda csv_path: [])
+    monkeypatch.setattr(DataEmbedding, "splitting_dataset", lambda records: split)
+    provider = FakeProvider()
+    with open(DataEmbedding.metadata_file(path), "w") as f:
+        json.dump(provider.describe(), f)
+    write_output(path, [[1, 1, 3, "[6.0]"]])
+
+    asyncio.run(embed_dataset(path, concurrency=1, provider=provider))
+    # Only the chunks missing from the output are sent
+    assert sorted(text for call in provider.calls for text in call) == ["first", "third"]
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(int(row["chunk_id"]) for row in rows) == [0, 1, 2]
+
+    # A second run has nothing left to do
+    provider.calls.clear()
+    asyncio.run(embed_dataset(path, concurrency=1, provider=provider))
+    assert provider.calls == []
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test script for the database connection pool
+"""
+import threading
+import time
+import sys
+import os
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db
+from db import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query)
+        if self.conn.broken:
+            # psycopg2 marks a connection closed when the server goes away
+            self.conn.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        if self.conn.error is not None:
+            raise self.conn.error
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.error = None
+        self.break_on_commit = False
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.break_on_commit:
+            self.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, *args, **kwargs):
+        self.opened = []
+        super().__init__(*args, connect_kwargs={"host": "fake"}, **kwargs)
+
+    def _connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def test_connections_are_reused():
+    pool = FakePool(min_size=1, max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(pool.opened) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_pool_is_bounded_and_times_out():
+    pool = FakePool(min_size=0, max_size=1, timeout=0.05)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    pool.putconn(conn)
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["size"] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = FakePool(min_size=0, max_size=1, timeout=2)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["max_wait_ms"] > 0
+
+
+def test_run_reconnects_after_dropped_connection():
+    pool = FakePool(min_size=1, max_size=2)
+    calls = []
+
+    def query(conn):
+        calls.append(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        return "ok"
+
+    pool.opened[0].broken = True
+    assert pool.run(query) == "ok"
+    assert len(calls) == 2
+    assert calls[0].closed
+    assert calls[0].commits == 0 and calls[1].commits == 1
+    assert pool.stats()["reconnects"] == 1
+
+
+def insert(conn):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO ChatMessages VALUES (1)")
+    return "ok"
+
+
+def test_run_does_not_retry_errors_on_a_live_connection():
+    pool = FakePool(min_size=1, max_size=2)
+    conn = pool.opened[0]
+    conn.error = psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")
+    with pytest.raises(psycopg2.errors.QueryCanceled):
+        pool.run(insert)
+    assert len(conn.executed) == 1
+    # The connection is rolled back and reused, not replaced
+    assert conn.rollbacks == 1 and not conn.closed
+    assert pool.stats()["reconnects"] == 0 and pool.stats()["idle"] == 1
+
+
+def test_run_does_not_retry_a_failed_commit():
+    pool = FakePool(min_size=1, max_size=2)
+    conn = pool.opened[0]
+    conn.break_on_commit = True
+    # The insert may have been committed before the connection dropped
+    with pytest.raises(psycopg2.OperationalError):
+        pool.run(insert)
+    assert len(pool.opened) == 1 and len(conn.executed) == 1
+    assert conn.closed
+    assert pool.stats()["reconnects"] == 0 and pool.stats()["size"] == 0
+
+
+def test_run_gives_up_after_retries():
+    pool = FakePool(min_size=0, max_size=3)
+    real_connect = pool._connect
+
+    def broken_connect():
+        conn = real_connect()
+        conn.broken = True
+        return conn
+
+    pool._connect = broken_connect
+    with pytest.raises(psycopg2.OperationalError):
+        pool.run(insert, retries=1)
+    assert len(pool.opened) == 2
+    assert pool.stats()["reconnects"] == 1 and pool.stats()["size"] == 0
+
+
+def test_stale_idle_connection_is_health_checked():
+    pool = FakePool(min_size=1, max_size=1, healthcheck_idle_seconds=0)
+    pool.opened[0].broken = True
+    time.sleep(0.001)
+    conn = pool.getconn()
+    assert conn is not pool.opened[0]
+    assert pool.stats()["healthcheck_failures"] == 1
+
+
+def test_warm_opens_connections_up_to_max_size():
+    pool = FakePool(min_size=1, max_size=3)
+    assert pool.warm(2) == 2
+    assert len(pool.opened) == 2
+    assert pool.stats()["idle"] == 2 and pool.stats()["in_use"] == 0
+    assert pool.warm(10) == 3
+    assert len(pool.opened) == 3
+
+
+def test_pool_stats_do_not_open_the_pool(monkeypatch):
+    monkeypatch.setattr(db, "_pool", None)
+    # Nothing may connect just to report statistics
+    monkeypatch.setattr(db, "ConnectionPool", None)
+    assert db.pool_stats() == {"open": False}
+
+    pool = FakePool(min_size=1, max_size=2)
+    monkeypatch.setattr(db, "_pool", pool)
+    stats = db.pool_stats()
+    assert stats["open"] and stats["size"] == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
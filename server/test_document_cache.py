@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script for compact service record renderings
+"""
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from document_cache import DocumentRenderCache, render_document
+
+
+def make_record(record_id, **fields):
+    record = {
+        "id": record_id, "organisation_name": "13YARN", "campus_name": "Online", "service_name": "13YARN",
+        "region_name": "Statewide", "email": None, "phone": "13 92 76", "website": "https://www.13yarn.org.au/",
+        "notes": None, "expected_wait_time": "Not applicable", "opening_hours_24_7": True,
+        "opening_hours_standard": False, "opening_hours_extended": None, "op_hours_extended_details": "",
+        "address": None, "suburb": None, "state": None, "postcode": None, "cost": "Free",
+        "delivery_method": "Online", "level_of_care": "Low intensity", "referral_pathway": "Free call",
+        "service_type": "Crisis support", "target_population": None, "work_force_type": "Peer worker",
+        "score": 0.87,
+    }
+    record.update(fields)
+    return record
+
+
+def test_render_drops_empty_fields():
+    text = render_document(make_record(1))
+    assert text.startswith("Service: 13YARN; Campus: Online")
+    assert "Organisation" not in text, "Organisation equal to the service name is omitted"
+    assert "Hours: 24/7;" in text
+    assert "None" not in text and "Email" not in text and "Address" not in text
+    assert "0.87" not in text and "id" not in text.lower().split(":")[0]
+
+    text = render_document(make_record(2, address="8/255 Bourke St", suburb="Melbourne", postcode="3000",
+                                       opening_hours_24_7=False, opening_hours_standard=True,
+                                       op_hours_extended_details="Thu until 8pm"))
+    assert "Address: 8/255 Bourke St, Melbourne, 3000" in text
+    assert "Hours: standard hours, Thu until 8pm" in text
+    print("✓ Records rendered compactly without empty fields")
+
+
+def test_cache_keyed_by_record_id():
+    cache = DocumentRenderCache(budget=10000)
+    first = cache.get(make_record(1))
+    assert cache.get(make_record(1, service_name="ignored while cached")) is first
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.clear()
+    assert "ignored while cached" in cache.get(make_record(1, service_name="ignored while cached")).text
+    print("✓ Renderings cached by record id until cleared")
+
+
+def test_render_respects_budget():
+    records = [make_record(i, notes="word " * 40) for i in range(1, 6)]
+    cache = DocumentRenderCache(budget=10000)
+    per_document = cache.get(records[0]).tokens
+
+    text, tokens = cache.render(records, budget=per_document * 2 + 1)
+    assert len(text.split("\n")) == 2 and tokens == per_document * 2
+    assert cache.stats()["dropped_for_budget"] == 3
+
+    # The best match is kept even when it alone exceeds the budget
+    text, tokens = cache.render(records, budget=1)
+    assert len(text.split("\n")) == 1 and tokens == per_document
+    print("✓ Rendered documents fit the token budget")
+
+
+if __name__ == "__main__":
+    print("Document Cache Test Script")
+    print("=" * 40)
+    test_render_drops_empty_fields()
+    test_cache_keyed_by_record_id()
+    test_render_respects_budget()
+    print("\n✅ All tests passed!")
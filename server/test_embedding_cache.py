@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script for the query embedding cache
+"""
+import asyncio
+import sys
+import os
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-3-small"
+
+
+def test_hit_on_normalized_text():
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60, path="")
+    cache.put("I need help", MODEL, [0.1, 0.2])
+    assert cache.get("  i NEED   help ", MODEL) == [0.1, 0.2]
+    assert cache.get("I need help", "other-model") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_entries=2, ttl_seconds=60, path="")
+    cache.put("hi", MODEL, [1.0])
+    cache.put("crisis line", MODEL, [2.0])
+    cache.get("hi", MODEL)
+    cache.put("free counselling", MODEL, [3.0])
+    assert cache.get("crisis line", MODEL) is None
+    assert cache.get("hi", MODEL) == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=0.01, path="")
+    cache.put("hi", MODEL, [1.0])
+    time.sleep(0.02)
+    assert cache.get("hi", MODEL) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache(max_entries=10, ttl_seconds=60, path=path).put("hi", MODEL, [0.5, 0.25])
+
+    restarted = EmbeddingCache(max_entries=10, ttl_seconds=60, path=path)
+    assert restarted.get("hi", MODEL) == pytest.approx([0.5, 0.25])
+    assert restarted.stats()["disk_hits"] == 1
+    # Promoted into memory, so the next lookup is a memory hit
+    restarted.get("hi", MODEL)
+    assert restarted.stats()["hits"] == 1
+
+
+def test_dimensions_are_part_of_the_key(tmp_path):
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60, path=str(tmp_path / "embeddings.sqlite"))
+    cache.put("hi", MODEL, [0.5] * 4, dimensions=4)
+    assert cache.get("hi", MODEL, dimensions=8) is None
+    assert cache.get("hi", MODEL) is None
+    assert cache.get("hi", MODEL, dimensions=4) == pytest.approx([0.5] * 4)
+
+
+def test_disk_tier_is_capped(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60, path=path, disk_max_entries=3)
+    for i in range(5):
+        cache.put(f"question {i}", MODEL, [float(i)])
+    stats = cache.stats()
+    assert stats["disk_size"] == 3 and stats["disk_evictions"] == 2
+
+    # The oldest entries were dropped from disk
+    restarted = EmbeddingCache(max_entries=10, ttl_seconds=60, path=path, disk_max_entries=3)
+    assert restarted.get("question 0", MODEL) is None
+    assert restarted.get("question 4", MODEL) == pytest.approx([4.0])
+
+
+async def check_async_disk_tier(path):
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60, path=path)
+    writer_threads = []
+    flush = cache.flush
+
+    def recording_flush():
+        writer_threads.append(threading.current_thread())
+        flush()
+
+    cache.flush = recording_flush
+    # Written behind on a worker thread, in one batch
+    cache.put("hi", MODEL, [0.5])
+    cache.put("crisis line", MODEL, [0.25])
+    await cache.drain()
+    assert writer_threads and threading.main_thread() not in writer_threads
+    assert cache.stats()["disk_writes"] == 2 and cache.stats()["pending_writes"] == 0
+
+    restarted = EmbeddingCache(max_entries=10, ttl_seconds=60, path=path)
+    results = await restarted.get_many_async(["hi", "crisis line", "unknown"], MODEL)
+    assert results[0] == pytest.approx([0.5]) and results[1] == pytest.approx([0.25]) and results[2] is None
+    stats = restarted.stats()
+    assert stats["disk_hits"] == 2 and stats["misses"] == 1
+    assert await restarted.get_async("hi", MODEL) == pytest.approx([0.5])
+    assert restarted.stats()["hits"] == 1
+
+
+def test_async_disk_tier_stays_off_the_event_loop(tmp_path):
+    asyncio.run(check_async_disk_tier(str(tmp_path / "embeddings.sqlite")))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script for the embedding providers and stored-model checks
+"""
+import asyncio
+import sys
+import os
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from embeddings import (
+    EmbeddingModelMismatch, EmbeddingProvider, LocalEmbeddingProvider, OpenAIEmbeddingProvider, check_embedding_model,
+    create_embedding_provider,
+)
+from fake_openai import create_app, fake_embedding
+
+
+class FakeSentenceTransformer:
+    """Stands in for a sentence-transformers model: 4-dimensional vectors, calls recorded"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 0, 0, 0] for text in texts], dtype=np.float32)
+
+
+def local_provider(**kwargs):
+    model = FakeSentenceTransformer()
+    provider = LocalEmbeddingProvider("fake-minilm", "onnx", loader=lambda name, backend: model, **kwargs)
+    return provider, model
+
+
+async def check_local_queries_share_a_batch():
+    provider, model = local_provider(batch_size=8, batch_wait_ms=5)
+    texts = ["a", "bb", "ccc"]
+    results = await asyncio.gather(*(provider.embed_one(text) for text in texts))
+    assert [vector[0] for vector in results] == [1, 2, 3]
+    assert model.calls == [texts]
+    assert provider.stats()["batches"] == 1 and provider.stats()["avg_batch_size"] == 3
+    assert provider.describe() == {"provider": "local", "model": "fake-minilm", "dimensions": 4}
+    print("✓ Concurrent local queries are encoded as one batch")
+
+
+async def check_local_full_batch_flushes_immediately():
+    provider, model = local_provider(batch_size=2, batch_wait_ms=10_000)
+    results = await asyncio.wait_for(asyncio.gather(provider.embed_one("x"), provider.embed_one("yy")), 1)
+    assert [vector[0] for vector in results] == [1, 2]
+    # Ingestion-sized inputs skip the batcher
+    assert len(await provider.embed(["a", "b", "c"])) == 3
+    assert model.calls == [["x", "yy"], ["a", "b", "c"]]
+    print("✓ Full batches are encoded without waiting")
+
+
+async def check_local_errors_reach_every_caller():
+    def loader(name, backend):
+        raise RuntimeError("model not found")
+
+    provider = LocalEmbeddingProvider("missing", "torch", batch_wait_ms=1, loader=loader)
+    results = await asyncio.gather(provider.embed_one("a"), provider.embed_one("b"), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    print("✓ A failed batch fails each of its callers")
+
+
+async def check_openai_provider():
+    app = create_app(latency_ms=0, embedding_latency_ms=0, dimensions=1536)
+    client = openai.AsyncOpenAI(api_key="test", base_url="http://fake/v1",
+                                http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)))
+    provider = OpenAIEmbeddingProvider(lambda: client, model="text-embedding-3-small")
+    assert provider.dimensions == 1536
+    vectors = await provider.embed(["first", "second"])
+    assert np.allclose(vectors[1], fake_embedding("second", 1536), atol=1e-6)
+    assert provider.stats()["requests"] == 1 and provider.stats()["texts"] == 2
+    print("✓ OpenAI provider returns vectors in input order")
+
+
+def test_local_queries_share_a_batch():
+    asyncio.run(check_local_queries_share_a_batch())
+
+
+def test_local_full_batch_flushes_immediately():
+    asyncio.run(check_local_full_batch_flushes_immediately())
+
+
+def test_local_errors_reach_every_caller():
+    asyncio.run(check_local_errors_reach_every_caller())
+
+
+def test_openai_provider():
+    asyncio.run(check_openai_provider())
+
+
+def test_embedding_model_mismatch():
+    provider = OpenAIEmbeddingProvider(model="text-embedding-3-small")
+    check_embedding_model(None, provider)
+    check_embedding_model({"provider": "openai", "model": "text-embedding-3-small", "dimensions": 1536}, provider)
+    # Databases loaded before the metadata table only know the dimensions
+    check_embedding_model({"provider": None, "model": None, "dimensions": 1536}, provider)
+    with pytest.raises(EmbeddingModelMismatch):
+        check_embedding_model({"provider": "local", "model": "all-MiniLM-L6-v2", "dimensions": 384}, provider)
+    with pytest.raises(EmbeddingModelMismatch):
+        check_embedding_model({"provider": None, "model": None, "dimensions": 384}, provider)
+    with pytest.raises(ValueError):
+        create_embedding_provider("word2vec")
+    # A provider must implement embed()
+    with pytest.raises(TypeError):
+        EmbeddingProvider()
+    print("✓ Vectors from another model are rejected")
+
+
+if __name__ == "__main__":
+    print("Embedding Provider Test Script")
+    print("=" * 40)
+    test_local_queries_share_a_batch()
+    test_local_full_batch_flushes_immediately()
+    test_local_errors_reach_every_caller()
+    test_openai_provider()
+    test_embedding_model_mismatch()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script for the offline benchmark's OpenAI stand-in
+"""
+import asyncio
+import sys
+import os
+
+import numpy as np
+import openai
+import httpx
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_chat import parse_server_timing
+from fake_openai import create_app, fake_embedding
+
+
+def fake_client():
+    app = create_app(latency_ms=0, tokens_per_second=0, completion_tokens=5, embedding_latency_ms=0, dimensions=8)
+    transport = httpx.ASGITransport(app=app)
+    return openai.AsyncOpenAI(api_key="test", base_url="http://fake/v1",
+                              http_client=httpx.AsyncClient(transport=transport))
+
+
+async def check_embeddings_are_deterministic():
+    client = fake_client()
+    response = await client.embeddings.create(model="text-embedding-3-small", input=["hello", "world"])
+    first, second = (np.array(item.embedding) for item in response.data)
+    assert np.allclose(first, fake_embedding("hello", 8), atol=1e-6)
+    assert np.allclose(second, fake_embedding("world", 8), atol=1e-6)
+    assert abs(np.linalg.norm(first) - 1) < 1e-5
+    assert response.usage.prompt_tokens > 0
+    print("✓ Embeddings are deterministic unit vectors")
+
+
+async def check_completions():
+    client = fake_client()
+    messages = [{"role": "user", "content": "Where can I get help?"}]
+    response = await client.chat.completions.create(model="gpt-4o", messages=messages)
+    assert response.choices[0].message.content
+    assert response.usage.completion_tokens == 5
+
+    stream = await client.chat.completions.create(model="gpt-4o", messages=messages, stream=True,
+                                                  stream_options={"include_usage": True})
+    parts, usage = [], None
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+        if chunk.usage:
+            usage = chunk.usage
+    assert "".join(parts) == response.choices[0].message.content
+    assert usage.completion_tokens == 5
+    print("✓ Streamed and plain completions agree, with usage")
+
+
+def test_embeddings_are_deterministic():
+    asyncio.run(check_embeddings_are_deterministic())
+
+
+def test_completions():
+    asyncio.run(check_completions())
+
+
+def test_parse_server_timing():
+    timings = parse_server_timing("embed;dur=41.5, retrieve;dur=1.2, total;dur=250.0")
+    assert timings == {"embed": 41.5, "retrieve": 1.2, "total": 250.0}
+    assert parse_server_timing("") == {}
+    print("✓ Server-Timing header parsed")
+
+
+if __name__ == "__main__":
+    print("Fake OpenAI Test Script")
+    print("=" * 40)
+    test_embeddings_are_deterministic()
+    test_completions()
+    test_parse_server_timing()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script for query filter extraction used by hybrid retrieval
+"""
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hybrid_search import QueryFilters, extract_filters, suburb_pattern, text_query
+
+SUBURBS = suburb_pattern(["Coburg", "Preston", "North Melbourne", "Melbourne", None, ""])
+
+
+def test_extract_location():
+    filters = extract_filters("Is there a psychologist in north melbourne?", SUBURBS)
+    assert filters.suburb == "north melbourne", "Longest suburb name wins"
+    assert extract_filters("counselling near 3058", SUBURBS).postcode == "3058"
+    assert extract_filters("I moved here in 2019", SUBURBS).postcode is None
+    assert not extract_filters("I feel anxious at night", SUBURBS)
+    print("✓ Suburb and postcode extracted")
+
+
+def test_extract_flags():
+    filters = extract_filters("Free 24/7 online support please", SUBURBS)
+    assert filters.free and filters.open_24_7 and filters.online
+    assert extract_filters("a helpline open 24 hours", SUBURBS).open_24_7
+    assert extract_filters("bulk-billed GP in Coburg", SUBURBS).free
+    assert not extract_filters("Feel free to suggest anything", SUBURBS).free
+    assert not extract_filters("am I free to choose my psychologist?", SUBURBS).free
+    print("✓ 24/7, free and online flags extracted")
+
+
+def test_where_clause():
+    where, params = QueryFilters().where_clause()
+    assert where == "TRUE" and params == []
+
+    where, params = QueryFilters(suburb="Coburg", postcode="3058", free=True).where_clause()
+    assert params == ["coburg", "3058"]
+    assert "lower(r.suburb) = %s OR r.postcode = %s" in where
+    assert "r.cost ILIKE 'Free%%'" in where
+    print("✓ Filters translated to SQL predicates")
+
+
+def test_text_query():
+    assert text_query("Free counselling, free support!") == "free | counselling | support"
+    assert text_query("?!") == ""
+    print("✓ Full-text query built from the question words")
+
+
+if __name__ == "__main__":
+    print("Hybrid Search Test Script")
+    print("=" * 40)
+    test_extract_location()
+    test_extract_flags()
+    test_where_clause()
+    test_text_query()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Test script for completion latency budgets, retries, hedged requests and fallback
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from latency_budget import CompletionPolicy, LatencyBudgetExceeded, latency_budget, remaining_budget, retry_delay
+
+
+def warmed(policy, model="primary", seconds=0.05, samples=10):
+    for _ in range(samples):
+        policy._latencies(model).record(seconds)
+    return policy
+
+
+async def check_retries_with_jitter():
+    policy = CompletionPolicy(timeout=0.05, max_retries=2, retry_base=0.001)
+    attempts = []
+
+    async def request(model):
+        attempts.append(model)
+        if len(attempts) == 1:
+            await asyncio.sleep(1)  # cut off by the attempt timeout
+        if len(attempts) == 2:
+            raise TimeoutError()
+        return "answer"
+
+    assert await policy.call("primary", request) == "answer"
+    assert attempts == ["primary"] * 3
+    stats = policy.stats()
+    assert stats["retries"] == 2 and stats["timeouts"] == 2 and stats["hedges"] == 0
+    assert all(0 <= retry_delay(n, 0.5) <= 0.5 * 2 ** n for n in range(5))
+
+    async def bad_request(model):
+        raise ValueError("not retryable")
+
+    try:
+        await policy.call("primary", bad_request)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert policy.stats()["retries"] == 2
+    print("✓ Timed-out and transient attempts retried; other errors raised at once")
+
+
+async def check_admission_wait_is_not_timed():
+    policy = CompletionPolicy(timeout=0.05, max_retries=0)
+
+    @asynccontextmanager
+    async def queued_slot():
+        # Longer than the attempt timeout
+        await asyncio.sleep(0.1)
+        yield
+
+    async def request(model):
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    assert await policy.call("primary", request, admission=queued_slot) == "answer"
+    stats = policy.stats()
+    assert stats["timeouts"] == 0 and stats["retries"] == 0
+    # Only the upstream call feeds the hedge threshold
+    assert policy.latencies["primary"].percentile(100) < 0.05
+    print("✓ Waiting for an upstream slot is neither timed out nor recorded")
+
+
+async def check_budget():
+    policy = CompletionPolicy(timeout=10, max_retries=5, retry_base=0.001)
+
+    async def slow(model):
+        await asyncio.sleep(1)
+
+    assert remaining_budget() is None
+    with latency_budget(0.05):
+        # A nested budget never extends the outer one
+        with latency_budget(30):
+            assert remaining_budget() <= 0.05
+        try:
+            await policy.call("primary", slow)
+            assert False, "expected LatencyBudgetExceeded"
+        except LatencyBudgetExceeded as e:
+            assert e.status_code == 504
+    assert remaining_budget() is None
+    assert policy.stats()["budget_exceeded"] == 1
+    print("✓ Attempts cut off when the latency budget runs out")
+
+
+async def check_hedge_cancels_loser():
+    policy = warmed(CompletionPolicy(hedge_mode="hedge", min_samples=10, min_hedge_delay=0.01))
+    assert abs(policy.hedge_delay("primary") - 0.05) < 1e-9
+    calls, cancelled = [], []
+
+    async def request(model):
+        calls.append(model)
+        delay = 1 if len(calls) == 1 else 0.01
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(len(calls))
+            raise
+        return f"answer {len(calls)}"
+
+    assert await policy.call("primary", request) == "answer 2"
+    assert calls == ["primary", "primary"] and len(cancelled) == 1
+    stats = policy.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+    async def fast(model):
+        return "fast answer"
+
+    # A fast primary needs no second request
+    assert await policy.call("primary", fast) == "fast answer"
+    assert policy.stats()["hedges"] == 1
+    print("✓ Slow request hedged, the loser cancelled")
+
+
+async def check_fallback_model():
+    policy = warmed(CompletionPolicy(hedge_mode="fallback", fallback_model="fast", max_retries=0,
+                                     min_samples=10, min_hedge_delay=0.01))
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if model == "primary":
+            raise ValueError("model unavailable")
+        return "from fast"
+
+    # A failed primary goes to the fallback model without waiting for the threshold
+    assert await policy.call("primary", request) == "from fast"
+    assert calls == ["primary", "fast"]
+
+    async def slow_primary(model):
+        await asyncio.sleep(1 if model == "primary" else 0)
+        return model
+
+    assert await policy.call("primary", slow_primary) == "fast"
+    assert policy.stats()["hedges"] == 2 and policy.stats()["fallback_model"] == "fast"
+    print("✓ Failed or slow primary answered by the fallback model")
+
+
+async def check_no_hedge_without_capacity():
+    policy = warmed(CompletionPolicy(hedge_mode="hedge", min_samples=10, min_hedge_delay=0.01))
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    assert await policy.call("primary", request, can_hedge=lambda: False) == "answer"
+    assert len(calls) == 1 and policy.stats()["hedges"] == 0
+    # Not enough samples yet for a threshold
+    assert CompletionPolicy(hedge_mode="hedge").hedge_delay("primary") is None
+    print("✓ No hedging while upstream capacity is short or latencies unknown")
+
+
+def test_retries_with_jitter():
+    asyncio.run(check_retries_with_jitter())
+
+
+def test_admission_wait_is_not_timed():
+    asyncio.run(check_admission_wait_is_not_timed())
+
+
+def test_budget():
+    asyncio.run(check_budget())
+
+
+def test_hedge_cancels_loser():
+    asyncio.run(check_hedge_cancels_loser())
+
+
+def test_fallback_model():
+    asyncio.run(check_fallback_model())
+
+
+def test_no_hedge_without_capacity():
+    asyncio.run(check_no_hedge_without_capacity())
+
+
+if __name__ == "__main__":
+    print("Latency Budget Test Script")
+    print("=" * 40)
+    test_retries_with_jitter()
+    test_admission_wait_is_not_timed()
+    test_budget()
+    test_hedge_cancels_loser()
+    test_fallback_model()
+    test_no_hedge_without_capacity()
+    print("\n✅ All tests passed!")
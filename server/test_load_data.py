@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test script for the bulk loader's binary COPY payload and ANN index sizing
+"""
+import io
+import struct
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init-db'))
+
+import load_data
+from load_data import build_ann_index, copy_embeddings, ivfflat_lists, upgrade_schema
+
+
+class FakeCursor:
+    def __init__(self, row_count=0):
+        self.row_count = row_count
+        self.executed = []
+        self.copied = None
+
+    def copy_expert(self, sql, buffer):
+        self.executed.append(sql)
+        self.copied = buffer.read()
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+
+    def fetchone(self):
+        return (self.row_count,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, row_count):
+        self.cur = FakeCursor(row_count)
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+
+def parse_binary_copy(payload):
+    """Decode a PGCOPY stream of (int4, int4, vector) tuples the way the server reads it"""
+    data = io.BytesIO(payload)
+    assert data.read(11) == b'PGCOPY\n\xff\r\n\x00'
+    flags, extension_length = struct.unpack('>ii', data.read(8))
+    assert flags == 0 and extension_length == 0
+    rows = []
+    while True:
+        (field_count,) = struct.unpack('>h', data.read(2))
+        if field_count == -1:
+            break
+        assert field_count == 3
+        fields = [data.read(struct.unpack('>i', data.read(4))[0]) for _ in range(field_count)]
+        (record_index,), (tokens,) = struct.unpack('>i', fields[0]), struct.unpack('>i', fields[1])
+        dim, unused = struct.unpack('>hh', fields[2][:4])
+        assert unused == 0 and len(fields[2]) == 4 + 4 * dim
+        rows.append((record_index, tokens, list(struct.unpack(f'>{dim}f', fields[2][4:]))))
+    # Nothing may follow the trailer
+    assert data.read() == b''
+    return rows
+
+
+def test_copy_embeddings_round_trip():
+    rows = [(1, 12, [0.5, -1.25, 3.0]), (2, 7, [0.0, 1e-3, -2.5]), (40000, 512, [1.0] * 1536)]
+    cursor = FakeCursor()
+    nbytes = copy_embeddings(cursor, rows)
+
+    assert "FORMAT binary" in cursor.executed[0]
+    assert nbytes == len(cursor.copied)
+    decoded = parse_binary_copy(cursor.copied)
+    assert [(index, tokens) for index, tokens, _ in decoded] == [(1, 12), (2, 7), (40000, 512)]
+    for (_, _, sent), (_, _, received) in zip(rows, decoded):
+        assert received == pytest.approx(sent, rel=1e-6)
+
+
+def test_copy_embeddings_empty():
+    cursor = FakeCursor()
+    copy_embeddings(cursor, [])
+    assert parse_binary_copy(cursor.copied) == []
+
+
+def test_ivfflat_lists_boundaries():
+    # An empty or small table still gets one list
+    assert ivfflat_lists(0) == 1
+    assert ivfflat_lists(999) == 1
+    assert ivfflat_lists(1000) == 1
+    assert ivfflat_lists(2500) == 2
+    # rows / 1000 up to 1M rows, sqrt(rows) beyond
+    assert ivfflat_lists(1_000_000) == 1000
+    assert ivfflat_lists(1_000_001) == 1000
+    assert ivfflat_lists(4_000_000) == 2000
+
+
+def test_build_ann_index_options(monkeypatch):
+    monkeypatch.setattr(load_data, "IVFFLAT_LISTS", 0)
+    conn = FakeConnection(row_count=0)
+    build_ann_index(conn, 'ivfflat')
+    assert any("USING ivfflat" in sql and "lists = 1)" in sql for sql in conn.cur.executed)
+
+    conn = FakeConnection(row_count=50_000)
+    build_ann_index(conn, 'ivfflat')
+    assert any("lists = 50)" in sql for sql in conn.cur.executed)
+
+    conn = FakeConnection(row_count=50_000)
+    build_ann_index(conn, 'hnsw', m=8, ef_construction=32)
+    assert any("USING hnsw" in sql and "m = 8, ef_construction = 32" in sql for sql in conn.cur.executed)
+
+    with pytest.raises(ValueError):
+        build_ann_index(FakeConnection(row_count=10), 'flat')
+
+
+def test_upgrade_schema_is_idempotent():
+    conn = FakeConnection(row_count=0)
+    upgrade_schema(conn)
+    (sql,) = conn.cur.executed
+    statements = [statement.strip() for statement in sql.split(";") if statement.strip()]
+    assert any("ADD COLUMN IF NOT EXISTS search_tsv" in statement for statement in statements)
+    # Safe to run on every db-init start
+    assert all("IF NOT EXISTS" in statement for statement in statements)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
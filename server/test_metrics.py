@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script for the Prometheus metrics and stage timings
+"""
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import Counter, Histogram, Registry, record_usage, OPENAI_TOKENS, _request_timings, stage, STAGE_SECONDS
+
+
+class Usage:
+    prompt_tokens = 1200
+    completion_tokens = 80
+
+
+def test_histogram_render():
+    registry = Registry()
+    histogram = registry.register(Histogram("test_seconds", "Test latency", ("stage",), buckets=(0.1, 1.0)))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "embed")
+    text = registry.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="embed",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{stage="embed",le="1.0"} 3' in text
+    assert 'test_seconds_bucket{stage="embed",le="+Inf"} 4' in text
+    assert 'test_seconds_count{stage="embed"} 4' in text
+    assert 'test_seconds_sum{stage="embed"} 3.65' in text
+    print("✓ Histogram rendered in Prometheus text format")
+
+
+def test_counter_labels_escaped():
+    registry = Registry()
+    counter = registry.register(Counter("test_total", "Test counter", ("model",)))
+    counter.inc(2, 'odd "model"')
+    assert 'test_total{model="odd \\"model\\""} 2' in registry.render()
+    print("✓ Label values escaped")
+
+
+def test_stage_records_request_timings():
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        with stage("embed"):
+            pass
+        with stage("embed"):
+            pass
+    finally:
+        _request_timings.reset(token)
+    assert set(timings) == {"embed"}
+    assert STAGE_SECONDS._series[("embed",)][0][0] >= 2
+    print("✓ Stage timings recorded for the current request")
+
+
+def test_record_usage():
+    record_usage("test-model", Usage())
+    record_usage("test-model", None)
+    assert OPENAI_TOKENS._values[("test-model", "prompt")] == 1200
+    assert OPENAI_TOKENS._values[("test-model", "completion")] == 80
+    print("✓ Token usage recorded")
+
+
+if __name__ == "__main__":
+    print("Metrics Test Script")
+    print("=" * 40)
+    test_histogram_render()
+    test_counter_labels_escaped()
+    test_stage_records_request_timings()
+    test_record_usage()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for pgvector top-k retrieval over chunked records
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rag_service
+from rag_service import get_top_k_similar_docs
+
+
+class FakeCursor:
+    """Answers EXECUTE top_k_similar_docs the way the prepared statement does, over (record, distance) chunks"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [("id",), ("score",), ("candidate_count",)]
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        _, k, candidates = params
+        self.conn.windows.append(candidates)
+        window = sorted(self.conn.chunks, key=lambda chunk: chunk[1])[:candidates]
+        best = {}
+        for record_index, distance in window:
+            best[record_index] = min(distance, best.get(record_index, distance))
+        ranked = sorted(best.items(), key=lambda item: item[1])[:k]
+        self._rows = [(record_index, 1 - distance, len(window)) for record_index, distance in ranked]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.windows = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_window_widened_when_one_record_fills_it():
+    # Record 1 has 20 chunks nearer than any other record's best chunk
+    chunks = [(1, 0.01 * i) for i in range(20)] + [(2, 0.5), (3, 0.6), (4, 0.7), (2, 0.8)]
+    conn = FakeConnection(chunks)
+    records = get_top_k_similar_docs([0.0], conn, k=3)
+    assert [record["id"] for record in records] == [1, 2, 3]
+    assert "candidate_count" not in records[0]
+    k_window = 3 * rag_service.RETRIEVAL_CANDIDATE_MULTIPLIER
+    assert conn.windows[0] == k_window and conn.windows[-1] > k_window
+    print("✓ Candidate window widened until it holds k distinct records")
+
+
+def test_no_widening_when_window_is_not_full():
+    conn = FakeConnection([(1, 0.1), (1, 0.2), (2, 0.3)])
+    # Only two records exist: one query, no retries
+    assert [record["id"] for record in get_top_k_similar_docs([0.0], conn, k=3)] == [1, 2]
+    assert len(conn.windows) == 1
+    print("✓ Fewer than k records returned at once when no more exist")
+
+
+def test_widening_is_capped():
+    conn = FakeConnection([(1, 0.001 * i) for i in range(500)] + [(2, 0.9)])
+    records = get_top_k_similar_docs([0.0], conn, k=2, max_candidates=50)
+    assert [record["id"] for record in records] == [1]
+    assert max(conn.windows) == 50
+    print("✓ Candidate window never grows past max_candidates")
+
+
+if __name__ == "__main__":
+    print("Retrieval Test Script")
+    print("=" * 40)
+    test_window_widened_when_one_record_fills_it()
+    test_no_widening_when_window_is_not_full()
+    test_widening_is_capped()
+    print("\n✅ All tests passed!")
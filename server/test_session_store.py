@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Test script for the Postgres session store, against a scripted fake pool
+"""
+import asyncio
+from datetime import datetime, timezone
+import sys
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from chat_context import ChatMessage, ConversationSummary
+from db import ConnectionPool
+from session_store import SESSION_COLUMNS, PostgresSessionStore, SessionStore
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        self.conn.pool.executed.append((query, params))
+        self._rows, self.rowcount = [], 0
+        for prefix, (rows, rowcount) in self.conn.pool.results.items():
+            if query.startswith(prefix):
+                self._rows, self.rowcount = list(rows), rowcount
+                break
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.pool.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    """
+    Answers each statement with the (rows, rowcount) of the first `results`
+    prefix it starts with, and records every statement in `executed`
+    """
+
+    def __init__(self, results=None):
+        # Every table and column is there unless a test says otherwise
+        self.results = {"SELECT table_name, column_name": (SCHEMA_ROWS, len(SCHEMA_ROWS)), **(results or {})}
+        self.executed = []
+        self.commits = 0
+        super().__init__(min_size=0, max_size=2, connect_kwargs={"host": "fake"})
+
+    def _connect(self):
+        return FakeConnection(self)
+
+    def statements(self, prefix):
+        return [(query, params) for query, params in self.executed if query.startswith(prefix)]
+
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+SCHEMA_ROWS = [(table, column) for table, columns in SESSION_COLUMNS.items() for column in columns]
+
+
+def test_schema_checked_once_and_never_altered():
+    pool = FakePool({"SELECT COUNT(*)": ([(3,)], 1)})
+    store = PostgresSessionStore(pool)
+    assert asyncio.run(store.count()) == 3
+    assert asyncio.run(store.count()) == 3
+    assert len(pool.statements("SELECT table_name, column_name")) == 1
+    # The API never runs DDL; init-db owns the schema
+    assert not [query for query, _ in pool.executed if query.startswith(("CREATE", "ALTER"))]
+
+
+def test_missing_columns_reported():
+    rows = [row for row in SCHEMA_ROWS if row != ("chatsessions", "summary_seq")]
+    pool = FakePool({"SELECT table_name, column_name": (rows, len(rows))})
+    with pytest.raises(RuntimeError, match="chatsessions.summary_seq"):
+        asyncio.run(PostgresSessionStore(pool).count())
+
+
+def test_create():
+    pool = FakePool({"INSERT INTO ChatSessions": ([(NOW,)], 1)})
+    session_id, created_at = asyncio.run(PostgresSessionStore(pool).create())
+    assert created_at == NOW.isoformat()
+    (_, params), = pool.statements("INSERT INTO ChatSessions")
+    assert params[0] == session_id
+
+
+def test_get_messages():
+    pool = FakePool()
+    store = PostgresSessionStore(pool)
+    assert asyncio.run(store.get_messages("missing")) is None
+    assert pool.statements("SELECT id, role") == []
+
+    # Rows come back newest first and are returned oldest first
+    pool.results = {
+        "SELECT 1 FROM ChatSessions": ([(1,)], 1),
+        "SELECT id, role": ([(12, "assistant", "Hi there", NOW, 3), (11, "user", "Hello", NOW, 2)], 2),
+    }
+    messages = asyncio.run(store.get_messages("session"))
+    assert [(m.seq, m.role, m.content, m.tokens) for m in messages] == [
+        (11, "user", "Hello", 2), (12, "assistant", "Hi there", 3)
+    ]
+    assert messages[0].created == NOW.timestamp()
+
+
+def test_append_messages():
+    pool = FakePool({"UPDATE ChatSessions SET last_activity": ([], 0)})
+    store = PostgresSessionStore(pool)
+    turn = [ChatMessage("user", "Hello", tokens=2), ChatMessage("assistant", "Hi", tokens=1)]
+    # Expired or unknown session: nothing is inserted
+    assert asyncio.run(store.append_messages("gone", turn)) is False
+    assert pool.statements("INSERT INTO ChatMessages") == []
+
+    pool.results = {"UPDATE ChatSessions SET last_activity": ([], 1)}
+    assert asyncio.run(store.append_messages("session", turn)) is True
+    (query, params), = pool.statements("INSERT INTO ChatMessages")
+    # One multi-row INSERT for the whole turn
+    assert query.count("to_timestamp") == 2
+    assert params[:4] == ["session", "user", "Hello", 2]
+    assert params[5:9] == ["session", "assistant", "Hi", 1]
+
+
+def test_summaries():
+    pool = FakePool({"SELECT summary": ([("So far", 12, 40)], 1), "UPDATE ChatSessions SET summary": ([], 1)})
+    store = PostgresSessionStore(pool)
+    summary = asyncio.run(store.get_summary("session"))
+    assert (summary.text, summary.seq, summary.tokens) == ("So far", 12, 40)
+    assert asyncio.run(store.set_summary("session", ConversationSummary("Newer", 14, 45))) is True
+    (_, params), = pool.statements("UPDATE ChatSessions SET summary")
+    assert params == ("Newer", 45, 14, "session", 14)
+
+    # An equal or newer summary is already stored
+    pool.results = {"UPDATE ChatSessions SET summary": ([], 0)}
+    assert asyncio.run(store.set_summary("session", ConversationSummary("Older", 10, 30))) is False
+
+
+def test_cleanup_expired_counts_both_deletes():
+    pool = FakePool({
+        "DELETE FROM ChatSessions WHERE expires_at": ([], 4),
+        "DELETE FROM ChatSessions WHERE session_id IN": ([], 2),
+    })
+    assert asyncio.run(PostgresSessionStore(pool).cleanup_expired()) == 6
+
+
+def test_chat_turn_for_expired_session_returns_404(monkeypatch):
+    async def answer_after_expiry(message, history, summary):
+        # The session expires while the turn is being answered
+        main.session_store.sessions.pop(session_id)
+        return "answer"
+
+    monkeypatch.setattr(main, "process_input_with_retrieval_continuous", answer_after_expiry)
+    session_id, _ = asyncio.run(main.session_store.create())
+    response = TestClient(main.app).post("/api/chat", json={"message": "Hello", "session_id": session_id})
+    assert response.status_code == 404
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test script for single-flight request coalescing
+"""
+import asyncio
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from single_flight import SingleFlight
+
+
+async def check_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    executions = 0
+
+    async def work():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.01)
+        return [1, 2, 3]
+
+    results = await asyncio.gather(*(flight.do("same", work) for _ in range(10)), flight.do("other", work))
+    assert executions == 2
+    assert all(result == [1, 2, 3] for result in results)
+    stats = flight.stats()
+    assert stats["calls"] == 11 and stats["upstream_calls"] == 2 and stats["saved_calls"] == 9
+    assert stats["in_flight"] == 0
+
+    # Once finished, the next call runs again
+    await flight.do("same", work)
+    assert executions == 3
+    print("✓ Concurrent identical calls coalesced")
+
+
+async def check_errors_reach_every_waiter():
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("key", fail) for _ in range(5)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats()["errors"] == 1
+    print("✓ Errors propagated to all waiters")
+
+
+async def check_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("key", work))
+    second = asyncio.ensure_future(flight.do("key", work))
+    await asyncio.sleep(0.005)
+    first.cancel()
+    assert await second == "done"
+    assert first.cancelled()
+    print("✓ Cancelling one caller leaves the shared work running")
+
+
+def test_concurrent_calls_share_one_execution():
+    asyncio.run(check_concurrent_calls_share_one_execution())
+
+
+def test_errors_reach_every_waiter():
+    asyncio.run(check_errors_reach_every_waiter())
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    asyncio.run(check_cancelled_caller_does_not_cancel_others())
+
+
+if __name__ == "__main__":
+    print("Single Flight Test Script")
+    print("=" * 40)
+    test_concurrent_calls_share_one_execution()
+    test_errors_reach_every_waiter()
+    test_cancelled_caller_does_not_cancel_others()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test script for background conversation summaries
+"""
+import asyncio
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_context import ChatMessage, unsummarized
+from session_store import InMemorySessionStore
+from summarizer import ConversationSummarizer
+
+
+class FakeCompletion:
+    """Stands in for get_completion_from_messages and records its calls"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, messages, model="gpt-4o", temperature=0, max_tokens=1000):
+        self.calls.append(messages)
+        if self.fail:
+            raise RuntimeError("upstream error")
+        return f"summary #{len(self.calls)}"
+
+
+async def add_turns(store, session_id, first, last, tokens=100):
+    for turn in range(first, last):
+        await store.append_messages(session_id, [
+            ChatMessage("user", f"question {turn}", tokens=tokens),
+            ChatMessage("assistant", f"answer {turn}", tokens=tokens),
+        ])
+
+
+async def check_summary_folds_older_messages():
+    store = InMemorySessionStore()
+    complete = FakeCompletion()
+    summarizer = ConversationSummarizer(store, complete, enabled=True, trigger_tokens=500, keep_recent=2)
+    session_id, _ = await store.create()
+
+    await add_turns(store, session_id, 0, 2)
+    assert not await summarizer.update(session_id), "Below the trigger, nothing is summarized"
+
+    await add_turns(store, session_id, 2, 4)
+    assert await summarizer.update(session_id)
+    summary = await summarizer.get_summary(session_id)
+    assert summary.text == "summary #1"
+    messages = await store.get_messages(session_id)
+    assert [m.content for m in unsummarized(messages, summary)] == ["question 3", "answer 3"]
+
+    # The next run builds on the previous summary
+    await add_turns(store, session_id, 4, 7)
+    assert await summarizer.update(session_id)
+    assert "summary #1" in complete.calls[-1][1]["content"]
+    assert "question 3" in complete.calls[-1][1]["content"]
+    summary = await summarizer.get_summary(session_id)
+    assert [m.content for m in unsummarized(messages, summary)] == []
+    print("✓ Older messages folded into a running summary")
+
+
+async def check_schedule_runs_in_background():
+    store = InMemorySessionStore()
+    complete = FakeCompletion()
+    summarizer = ConversationSummarizer(store, complete, enabled=True, trigger_tokens=100, keep_recent=2)
+    session_id, _ = await store.create()
+    await add_turns(store, session_id, 0, 3)
+
+    summarizer.schedule(session_id)
+    summarizer.schedule(session_id)
+    assert complete.calls == [], "Summaries are not computed on the caller's path"
+    await summarizer.drain()
+    assert len(complete.calls) == 1, "Only one run per session is in flight"
+    assert summarizer.stats()["runs"] == 1
+
+    failing = ConversationSummarizer(store, FakeCompletion(fail=True), enabled=True, trigger_tokens=100,
+                                     keep_recent=0)
+    failing.schedule(session_id)
+    await failing.drain()
+    assert failing.stats()["failures"] == 1
+    print("✓ Summaries run in background tasks")
+
+
+async def check_disabled():
+    store = InMemorySessionStore()
+    summarizer = ConversationSummarizer(store, FakeCompletion(), enabled=False)
+    session_id, _ = await store.create()
+    summarizer.schedule(session_id)
+    assert await summarizer.get_summary(session_id) is None
+    assert summarizer.stats()["in_flight"] == 0
+    print("✓ Disabled summarizer does nothing")
+
+
+def test_summary_folds_older_messages():
+    asyncio.run(check_summary_folds_older_messages())
+
+
+def test_schedule_runs_in_background():
+    asyncio.run(check_schedule_runs_in_background())
+
+
+def test_disabled():
+    asyncio.run(check_disabled())
+
+
+if __name__ == "__main__":
+    print("Summarizer Test Script")
+    print("=" * 40)
+    test_summary_folds_older_messages()
+    test_schedule_runs_in_background()
+    test_disabled()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for incremental service data sync
+"""
+import csv
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sync_index
+from DataEmbedding import load_records
+from load_data import CSV_COLUMNS, record_hash, record_text
+from sync_index import apply_changes, diff_records
+
+
+def row(name, suburb="Footscray"):
+    return {**{col: None for col in CSV_COLUMNS}, "service_name": name, "suburb": suburb}
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append((" ".join(query.split()), params))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+@pytest.fixture
+def inserts(monkeypatch):
+    """Record execute_values calls; inserted records get ids from 100, with CHAR(64)-style padded hashes"""
+    calls = []
+
+    def fake_execute_values(cur, sql, rows, fetch=False):
+        calls.append((" ".join(sql.split()), list(rows)))
+        if fetch:
+            return [(100 + i, record[-1] + " ") for i, record in enumerate(rows)]
+
+    monkeypatch.setattr(sync_index, "execute_values", fake_execute_values)
+    return calls
+
+
+def test_diff_records():
+    kept, changed, added = row("Kept"), row("Changed", "Sunshine"), row("Added")
+    existing = {1: record_hash(kept), 2: record_hash(row("Changed")), 3: None}
+    # Duplicate CSV rows are inserted once
+    new_rows, removed_ids, unchanged = diff_records([kept, changed, added, dict(added)], existing)
+    assert set(new_rows) == {record_hash(changed), record_hash(added)}
+    # The old version of a changed record and rows without a hash are removed
+    assert sorted(removed_ids) == [2, 3]
+    assert unchanged == 1
+
+    new_rows, removed_ids, unchanged = diff_records([kept], {1: record_hash(kept)})
+    assert new_rows == {} and removed_ids == [] and unchanged == 1
+
+
+def test_apply_changes_inserts_records_and_chunks(inserts):
+    conn = FakeConnection()
+    added = row("Added")
+    content_hash = record_hash(added)
+    new_rows = {content_hash: added}
+    chunks = [(content_hash, 12, [0.1, 0.2]), (content_hash, 8, [0.3, 0.4]), ("unknown", 5, [0.0, 0.0])]
+
+    assert apply_changes(conn, new_rows, [7, 8], chunks) == 2
+    assert [params for _, params in conn.executed] == [([7, 8],), ([7, 8],)]
+    assert "DELETE FROM MentalHealthEmbeddings" in conn.executed[0][0]
+    assert "DELETE FROM MentalHealthRawData" in conn.executed[1][0]
+
+    (record_sql, records), (chunk_sql, chunk_rows) = inserts
+    assert "ON CONFLICT (content_hash) DO NOTHING" in record_sql
+    assert records[0][-1] == content_hash
+    assert "INSERT INTO MentalHealthEmbeddings" in chunk_sql
+    # Chunks are attached to the new record's id; chunks of records not inserted are dropped
+    assert [(record_id, tokens) for record_id, tokens, _ in chunk_rows] == [(100, 12), (100, 8)]
+    assert chunk_rows[0][2].dtype.name == "float32"
+
+
+def test_apply_changes_only_deletes(inserts):
+    conn = FakeConnection()
+    assert apply_changes(conn, {}, [3], []) == 0
+    assert len(conn.executed) == 2 and inserts == []
+
+
+def test_bulk_and_sync_embed_the_same_text(tmp_path):
+    rows = [row("First"), row("Second", "Sunshine")]
+    path = tmp_path / "services.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    assert load_records(str(path)) == [(1, record_text(rows[0])), (2, record_text(rows[1]))]
+    assert '"service_name": "First"' in record_text(rows[0])
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
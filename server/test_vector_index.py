@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-process NumPy vector index
+"""
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vector_index import VectorIndex
+
+
+class FakeCursor:
+    def __init__(self, tables):
+        self.tables = tables
+        self.description = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if "pg_stat_user_tables" in query:
+            self._rows = [self.tables["signature"]]
+        elif "FROM MentalHealthEmbeddings" in query:
+            self._rows = sorted(self.tables["embeddings"], key=lambda row: row[0])
+        else:
+            self.description = [("id",), ("service_name",)]
+            self._rows = self.tables["records"]
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakePool:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def run(self, fn):
+        return fn(self)
+
+    def cursor(self):
+        return FakeCursor(self.tables)
+
+
+def make_tables():
+    return {
+        "signature": (4, 3, 7),
+        "records": [(1, "Headspace"), (2, "Lifeline"), (3, "Beyond Blue")],
+        # Record 1 has two chunks; both point the same way as the query below
+        "embeddings": [
+            (1, [1.0, 0.0, 0.0]),
+            (1, [0.9, 0.1, 0.0]),
+            (2, [0.0, 1.0, 0.0]),
+            (3, [0.7, 0.7, 0.0]),
+        ],
+    }
+
+
+def test_search_returns_distinct_records_in_order():
+    index = VectorIndex(["service_name"], pool=FakePool(make_tables()))
+    docs = index.search([2.0, 0.0, 0.0], k=3)
+    assert [doc["id"] for doc in docs] == [1, 3, 2]
+    assert docs[0]["service_name"] == "Headspace"
+    assert docs[0]["score"] == pytest.approx(1.0)
+    assert docs[0]["score"] >= docs[1]["score"] >= docs[2]["score"]
+
+
+def test_matrix_is_contiguous_and_normalised():
+    index = VectorIndex(["service_name"], pool=FakePool(make_tables()))
+    index.reload()
+    matrix = index._snapshot.matrix
+    assert matrix.dtype == np.float32
+    assert matrix.flags["C_CONTIGUOUS"]
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+
+
+def test_k_larger_than_corpus():
+    index = VectorIndex(["service_name"], pool=FakePool(make_tables()))
+    assert len(index.search([0.0, 1.0, 0.0], k=10)) == 3
+
+
+def test_search_many_matches_search():
+    index = VectorIndex(["service_name"], pool=FakePool(make_tables()))
+    queries = [[2.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 0.0]]
+    batched = index.search_many(queries, k=2)
+    assert len(batched) == 3
+    for query, docs in zip(queries, batched):
+        single = index.search(query, k=2)
+        assert [doc["id"] for doc in docs] == [doc["id"] for doc in single]
+        assert [doc["score"] for doc in docs] == pytest.approx([doc["score"] for doc in single])
+    assert index.search_many([], k=2) == []
+
+
+def test_load_records_without_database():
+    index = VectorIndex(["service_name"])
+    index.load_records({1: {"id": 1, "service_name": "Headspace"}, 2: {"id": 2, "service_name": "Lifeline"}},
+                       [(2, [0.0, 1.0]), (1, [1.0, 0.0]), (1, [0.8, 0.2])])
+    assert [doc["id"] for doc in index.search([1.0, 0.1], k=2)] == [1, 2]
+
+
+def test_reload_only_when_tables_change():
+    tables = make_tables()
+    index = VectorIndex(["service_name"], pool=FakePool(tables))
+    index.reload()
+    assert index.reload_if_changed() is False
+
+    tables["records"].append((4, "Kids Helpline"))
+    tables["embeddings"].append((4, [0.0, 0.0, 1.0]))
+    tables["signature"] = (5, 4, 9)
+    assert index.reload_if_changed() is True
+    assert index.search([0.0, 0.0, 1.0], k=1)[0]["service_name"] == "Kids Helpline"
+    assert index.version == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script for background warm-up and readiness reporting
+"""
+import asyncio
+import sys
+import os
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from warmup import WarmUp
+
+
+async def check_required_steps_retry_until_ready():
+    warmup = WarmUp(retry_seconds=0.01)
+    attempts = 0
+    order = []
+
+    def database():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise ConnectionError("database is starting up")
+        order.append("database")
+
+    async def sessions():
+        order.append("sessions")
+
+    warmup.add("database", database)
+    warmup.add("sessions", sessions)
+    assert not warmup.ready and warmup.status()["status"] == "warming_up"
+
+    await warmup.run()
+    assert warmup.ready
+    assert order == ["database", "sessions"]
+    status = warmup.status()
+    assert status["status"] == "ready"
+    assert status["checks"]["database"]["status"] == "ok" and status["checks"]["database"]["attempts"] == 3
+    assert "error" not in status["checks"]["database"]
+    print("✓ Required steps are retried in order until they succeed")
+
+
+async def check_optional_failures_do_not_block():
+    warmup = WarmUp(retry_seconds=0.01)
+
+    def tokenizer():
+        raise RuntimeError("no network")
+
+    warmup.add("tokenizer", tokenizer, required=False)
+    warmup.add("documents", lambda: None, required=False)
+    await warmup.run()
+    assert warmup.ready
+    checks = warmup.status()["checks"]
+    assert checks["tokenizer"]["status"] == "failed" and checks["tokenizer"]["error"] == "no network"
+    assert checks["documents"]["status"] == "ok"
+    print("✓ Optional step failures are reported without blocking readiness")
+
+
+async def check_not_ready_while_required_step_fails():
+    warmup = WarmUp(retry_seconds=0.01)
+
+    def database():
+        raise ConnectionError("connection refused")
+
+    warmup.add("database", database)
+    task = asyncio.create_task(warmup.run())
+    await asyncio.sleep(0.05)
+    assert not warmup.ready
+    check = warmup.status()["checks"]["database"]
+    assert check["status"] == "failed" and check["attempts"] > 1
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    print("✓ Not ready while a required step keeps failing")
+
+
+def test_required_steps_retry_until_ready():
+    asyncio.run(check_required_steps_retry_until_ready())
+
+
+def test_optional_failures_do_not_block():
+    asyncio.run(check_optional_failures_do_not_block())
+
+
+def test_not_ready_while_required_step_fails():
+    asyncio.run(check_not_ready_while_required_step_fails())
+
+
+if __name__ == "__main__":
+    print("Warm-up Test Script")
+    print("=" * 40)
+    test_required_steps_retry_until_ready()
+    test_optional_failures_do_not_block()
+    test_not_ready_while_required_step_fails()
+    print("\n✅ All tests passed!")
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# How often the service tables are checked for changes
+DATA_RELOAD_CHECK_SECONDS = float(os.getenv('DATA_RELOAD_CHECK_SECONDS', '60'))
+
+# Cheap change detector: write counters from the statistics collector plus row counts
+TABLE_SIGNATURE_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM MentalHealthEmbeddings),
+        (SELECT COUNT(*) FROM MentalHealthRawData),
+        (SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+         FROM pg_stat_user_tables
+         WHERE relname IN ('mentalhealthembeddings', 'mentalhealthrawdata'))
+"""
+
+
+def table_signature(conn):
+    """
+    Return a value that changes whenever the service or embedding tables are written to
+    """
+    with conn.cursor() as cur:
+        cur.execute(TABLE_SIGNATURE_QUERY)
+        return tuple(cur.fetchone())
+
+
+class _Snapshot:
+    """Immutable arrays for one load of the tables; swapped in whole on reload"""
+
+    __slots__ = ("matrix", "record_ids", "record_starts", "records", "signature", "loaded_at")
+
+    def __init__(self, matrix, record_ids, record_starts, records, signature):
+        self.matrix = matrix
+        self.record_ids = record_ids
+        self.record_starts = record_starts
+        self.records = records
+        self.signature = signature
+        self.loaded_at = time.time()
+
+
+class VectorIndex:
+    """
+    In-process exact cosine index over MentalHealthEmbeddings.
+
+    All chunk embeddings are held in one contiguous, L2-normalised float32
+    matrix sorted by record, so a query is a single matrix-vector product
+    followed by a per-record max and an argpartition over records. The raw
+    service rows are cached alongside, so no database round trip is needed
+    at query time.
+    """
+
+    def __init__(self, columns, pool=None):
+        self.columns = tuple(columns)
+        self._pool = pool
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def pool(self):
+        return self._pool or db.get_pool()
+
+    def _load(self, conn):
+        signature = table_signature(conn)
+        with conn.cursor() as cur:
+            cur.execute("SELECT record_index, embedding FROM MentalHealthEmbeddings ORDER BY record_index, id")
+            rows = cur.fetchall()
+            cur.execute(f"SELECT id, {', '.join(self.columns)} FROM MentalHealthRawData")
+            colnames = [desc[0] for desc in cur.description]
+            records = {row[0]: dict(zip(colnames, row)) for row in cur.fetchall()}
+        return self._build(rows, records, signature)
+
+    @staticmethod
+    def _build(rows, records, signature):
+        """
+        Snapshot from (record_id, embedding) chunk rows sorted by record, and {id: record}
+        """
+        # Drop chunks whose record no longer exists so results can always be resolved
+        rows = [row for row in rows if row[0] in records]
+        if not rows:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+            chunk_records = np.zeros(0, dtype=np.int64)
+        else:
+            chunk_records = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            matrix = np.ascontiguousarray(np.vstack([np.asarray(row[1], dtype=np.float32) for row in rows]))
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+        # Chunks are sorted by record, so each record is a contiguous run starting at record_starts
+        record_ids, record_starts = np.unique(chunk_records, return_index=True)
+        return _Snapshot(matrix, record_ids, record_starts, records, signature)
+
+    def reload(self):
+        """
+        Load (or re-load) every embedding and record from the database
+        """
+        with self._reload_lock:
+            started = time.perf_counter()
+            snapshot = self.pool.run(self._load)
+            self._snapshot = snapshot
+            self.version += 1
+            logger.info(
+                f"Loaded vector index: {snapshot.matrix.shape[0]} chunks, "
+                f"{len(snapshot.record_ids)} records in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+            return snapshot
+
+    def load_records(self, records, chunks):
+        """
+        Load from memory instead of the database: records is {id: record} and
+        chunks is a list of (record_id, embedding). Used by the offline benchmark.
+        """
+        rows = sorted(chunks, key=lambda chunk: chunk[0])
+        with self._reload_lock:
+            self._snapshot = self._build(rows, records, None)
+            self.version += 1
+        return self._snapshot
+
+    def reload_if_changed(self):
+        """
+        Reload when the underlying tables have changed since the last load.
+        Returns True if a reload happened.
+        """
+        if self._snapshot is None:
+            self.reload()
+            return True
+        signature = self.pool.run(table_signature)
+        if signature == self._snapshot.signature:
+            return False
+        logger.info("Embedding tables changed; reloading vector index")
+        self.reload()
+        return True
+
+    def search(self, query_embedding, k):
+        """
+        Return up to k distinct records most similar to the query, best first,
+        in the same shape as rag_service.get_top_k_similar_docs
+        """
+        return self.search_many([query_embedding], k)[0]
+
+    def search_many(self, query_embeddings, k):
+        """
+        search() for several queries with one matrix product; returns one
+        result list per query
+        """
+        snapshot = self._snapshot or self.reload()
+        if k <= 0 or len(snapshot.record_ids) == 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        queries = queries / norms
+
+        # (chunks, queries) scores, then the best chunk of each record per query
+        chunk_scores = snapshot.matrix @ queries.T
+        record_scores = np.maximum.reduceat(chunk_scores, snapshot.record_starts, axis=0)
+        return [self._top(snapshot, record_scores[:, i], k) for i in range(queries.shape[0])]
+
+    @staticmethod
+    def _top(snapshot, record_scores, k):
+        k = min(k, len(record_scores))
+        if k < len(record_scores):
+            top = np.argpartition(-record_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(record_scores))
+        top = top[np.argsort(-record_scores[top], kind="stable")]
+
+        results = []
+        for position in top:
+            record = dict(snapshot.records[int(snapshot.record_ids[position])])
+            record["score"] = float(record_scores[position])
+            results.append(record)
+        return results
+
+    def stats(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False, "version": self.version}
+        return {
+            "loaded": True,
+            "version": self.version,
+            "chunks": int(snapshot.matrix.shape[0]),
+            "records": int(len(snapshot.record_ids)),
+            "dimensions": int(snapshot.matrix.shape[1]) if snapshot.matrix.ndim == 2 else 0,
+            "memory_bytes": int(snapshot.matrix.nbytes),
+            "loaded_at": snapshot.loaded_at,
+        }
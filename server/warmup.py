@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Warm caches and connections in the background after startup; /ready reports 503 until done
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+# Pooled database connections opened (and prepared) during warm-up
+WARMUP_DB_CONNECTIONS = int(os.getenv('WARMUP_DB_CONNECTIONS', '2'))
+# Also open the HTTPS connection to OpenAI and check the API key
+WARMUP_OPENAI = os.getenv('WARMUP_OPENAI', 'true').lower() == 'true'
+# Pause before retrying a required step that failed, e.g. while Postgres is still starting
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '5'))
+
+
+class WarmUp:
+    """
+    Named warm-up steps run once, in order, by a background task.
+
+    A required step is retried until it succeeds, so an instance started
+    before its database becomes ready once the database is up instead of
+    crashing. An optional step that fails is logged and skipped, since what
+    it warms is also created on first use. Synchronous steps run on a worker
+    thread to keep the event loop free.
+    """
+
+    def __init__(self, retry_seconds: float = WARMUP_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self._steps: List[Tuple[str, Callable, bool]] = []
+        self.checks: Dict[str, dict] = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name: str, fn: Callable, required: bool = True):
+        self._steps.append((name, fn, required))
+        self.checks[name] = {"status": "pending", "required": required}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    async def _call(self, fn):
+        if asyncio.iscoroutinefunction(fn):
+            return await fn()
+        return await asyncio.to_thread(fn)
+
+    async def run(self):
+        self.started_at = time.perf_counter()
+        for name, fn, required in self._steps:
+            check = self.checks[name]
+            attempts = 0
+            while True:
+                attempts += 1
+                started = time.perf_counter()
+                try:
+                    await self._call(fn)
+                except Exception as e:
+                    check.update(status="failed", attempts=attempts, error=str(e))
+                    if not required:
+                        logger.warning(f"Warm-up step {name} failed ({e}); continuing without it")
+                        break
+                    logger.error(f"Warm-up step {name} failed ({e}); retrying in {self.retry_seconds:g}s")
+                    await asyncio.sleep(self.retry_seconds)
+                    continue
+                check.update(status="ok", attempts=attempts, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+                check.pop("error", None)
+                break
+        self.finished_at = time.perf_counter()
+        logger.info(f"Warm-up finished in {(self.finished_at - self.started_at) * 1000:.0f} ms")
+
+    def status(self) -> dict:
+        if self.ready:
+            status, elapsed = "ready", self.finished_at - self.started_at
+        else:
+            status = "warming_up"
+            elapsed = time.perf_counter() - self.started_at if self.started_at is not None else 0.0
+        return {
+            "status": status,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "checks": self.checks,
+        }